@@ -1,6 +1,52 @@
 #!/bin/sh
 
+# schema changes hold session state, run them on postgres directly
+MIGRATE_HOST=${POSTGRES_DIRECT_HOST:-$POSTGRES_HOST}
+
+# pairs get their currency foreign keys before migrate drops their codes
+echo "Link exchange rates to their currencies"
+POSTGRES_HOST=$MIGRATE_HOST python manage.py link_pair_currencies || exit 1
+
 echo "Apply database migrations"
-python manage.py migrate
+POSTGRES_HOST=$MIGRATE_HOST python manage.py migrate
+
+echo "Create upcoming daily exchange rate partitions"
+POSTGRES_HOST=$MIGRATE_HOST python manage.py partition_rates
+
+echo "Summarize daily exchange rates written without summaries"
+python manage.py rebuild_rate_summaries --missing
+
+# the background commands bump cache versions the server processes read,
+# they refuse to run with the default per process cache, see CACHE_BACKEND.
+# Their output, failed runs included, goes to the container log
+
+# workers serve the latest rates from a file this keeps up to date
+if [ -n "$EXCHANGE_RATE_SNAPSHOT_PATH" ]; then
+    SNAPSHOT_INTERVAL=${SNAPSHOT_INTERVAL:-5}
+    echo "Build rate snapshots every $SNAPSHOT_INTERVAL seconds"
+    python manage.py build_rate_snapshot \
+        --interval "$SNAPSHOT_INTERVAL" &
+fi
+
+# pull the daily exchange rates of every pair from the provider feed
+if [ -n "$EXCHANGE_RATE_PROVIDER_URL" ]; then
+    FETCH_RATES_INTERVAL=${FETCH_RATES_INTERVAL:-3600}
+    echo "Fetch rates every $FETCH_RATES_INTERVAL seconds"
+    python manage.py fetch_rates \
+        --interval "$FETCH_RATES_INTERVAL" &
+fi
 
-gunicorn -b 0.0.0.0:8000 server.wsgi:application
\ No newline at end of file
+# a daily-exchange-rates/stream client holds a thread, of the ASGI_THREADS
+# pool or of a gthread worker, at most EXCHANGE_RATE_STREAM_SLOTS of them
+# per process and for less than GUNICORN_TIMEOUT. A sync worker would be
+# held whole and killed by the arbiter
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn -b 0.0.0.0:8000 -k uvicorn.workers.UvicornWorker \
+        server.asgi:application
+else
+    gunicorn -b 0.0.0.0:8000 -k gthread \
+        --workers "${GUNICORN_WORKERS:-2}" \
+        --threads "${GUNICORN_THREADS:-8}" \
+        --timeout "${GUNICORN_TIMEOUT:-120}" \
+        server.wsgi:application
+fi
\ No newline at end of file
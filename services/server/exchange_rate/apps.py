@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ExchangeRateConfig(AppConfig):
     name = 'exchange_rate'
+
+    def ready(self):
+        from . import signals
+        post_migrate.connect(signals.create_currencies, sender=self)
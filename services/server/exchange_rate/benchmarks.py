@@ -0,0 +1,281 @@
+"""
+Synthetic data and request scenarios for manage.py seed_rates and
+manage.py benchmark.
+
+Every scenario builds the i-th request of an endpoint, spread over the
+seeded pairs and dates so caches see a realistic mix of hits and misses.
+Results are plain dicts, written as JSON to compare runs between commits.
+"""
+
+import datetime
+import itertools
+import json
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.urls import reverse
+
+from .cache import invalidate_exchange_rates
+from .conversion import invalidate_latest_rates
+from .currencies import register_currency
+from .ingest import upsert_daily_exchange_rates
+from .models import ExchangeRates, DailyExchangeRates, DailyRateSummary
+
+SEED_START_DATE = datetime.date(2018, 1, 1)
+SEED_BATCH_DAYS = 30
+BENCHMARK_CODE = 'BNC'
+
+
+def get_currency_codes(count):
+    """
+    Return count distinct three letter codes, AAA, AAB, ...
+    """
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    codes = (''.join(code)
+             for code in itertools.product(letters, repeat=3))
+    return list(itertools.islice(codes, count))
+
+
+def get_seed_pairs(pairs):
+    """
+    Return pairs (from_code, to_code) over the fewest currencies, every
+    currency connected to the first one so conversions find a path
+    """
+    currencies = get_currency_codes(int(math.ceil(math.sqrt(pairs))) + 1)
+    combinations = [(from_code, to_code)
+                    for from_code in currencies
+                    for to_code in currencies if from_code != to_code]
+    combinations.sort(key=lambda pair: currencies[0] not in pair)
+    return combinations[:pairs]
+
+
+def seed_rates(pairs, days, start_date=SEED_START_DATE, seed=0):
+    """
+    Create pairs exchange rates with a random walk of days daily rates
+    each, existing pairs and rates are reused or overwritten. Return the
+    (from_code, to_code) pairs
+    """
+    generator = random.Random(seed)
+    seed_pairs = get_seed_pairs(pairs)
+    exchange_rate_ids = []
+    for from_code, to_code in seed_pairs:
+        exchange_rate, _ = ExchangeRates.objects.get_or_create(
+            from_currency_id=register_currency(from_code),
+            to_currency_id=register_currency(to_code))
+        exchange_rate_ids.append(exchange_rate.id)
+
+    rates = [generator.uniform(0.5, 2) for _ in exchange_rate_ids]
+    for offset in range(0, days, SEED_BATCH_DAYS):
+        rows = []
+        for day in range(offset, min(offset + SEED_BATCH_DAYS, days)):
+            date = start_date + datetime.timedelta(days=day)
+            for index, exchange_rate_id in enumerate(exchange_rate_ids):
+                rates[index] *= 1 + generator.gauss(0, 0.01)
+                rows.append((exchange_rate_id, round(rates[index], 6), date))
+        upsert_daily_exchange_rates(rows)
+    return seed_pairs
+
+
+class Scenario:
+    """
+    One endpoint, request builds the (method, path, query, body) of the
+    i-th request and callback, if any, gets i and the response data
+    """
+
+    def __init__(self, name, request, callback=None):
+        self.name = name
+        self.request = request
+        self.callback = callback
+
+
+def get_scenarios(pairs, ids, days, start_date=SEED_START_DATE,
+                  version='v1'):
+    """
+    Return a Scenario per endpoint of exchange_rate over the seeded pairs
+    and their exchange rate ids. Daily exchange rates are created after
+    the seeded days, see reset_benchmark_data
+    """
+    def url(name, **kwargs):
+        return reverse('exchange-rate:{}'.format(name),
+                       kwargs=dict(kwargs, version=version))
+
+    def pair(i):
+        return pairs[i % len(pairs)]
+
+    def date(i):
+        return str(start_date + datetime.timedelta(days=i % days))
+
+    def new_date(i):
+        return str(start_date + datetime.timedelta(days=days + i))
+
+    def rates(i, count):
+        return [{'from_code': pair(i + j)[0], 'to_code': pair(i + j)[1],
+                 'rate': 1 + j / count, 'date': date(i + j)}
+                for j in range(count)]
+
+    # codes of the pairs created, updated and deleted by the benchmark
+    def benchmark_pair(i):
+        return {'from_code': BENCHMARK_CODE,
+                'to_code': get_benchmark_code(i)}
+
+    created = {}
+
+    def create(i):
+        return ('POST', url('index'), None, benchmark_pair(i))
+
+    def update(i):
+        return ('PUT', url('detail', pk=created.get(i, 0)), None,
+                benchmark_pair(i))
+
+    def delete(i):
+        return ('DELETE', url('detail', pk=created.get(i, 0)), None, None)
+
+    def created_callback(i, data):
+        if isinstance(data, dict) and 'id' in data:
+            created[i] = data['id']
+
+    return [
+        Scenario('exchange-rates list', lambda i: (
+            'GET', url('index'), {'page_size': 100}, None)),
+        Scenario('exchange-rates detail', lambda i: (
+            'GET', url('detail', pk=ids[i % len(ids)]), None, None)),
+        Scenario('daily-exchange-rates detail', lambda i: (
+            'GET', url('daily-detail'),
+            {'from_code': pair(i)[0], 'to_code': pair(i)[1]}, None)),
+        Scenario('daily-exchange-rates detail window 365', lambda i: (
+            'GET', url('daily-detail'),
+            {'from_code': pair(i)[0], 'to_code': pair(i)[1],
+             'window': 365, 'limit': 365}, None)),
+        Scenario('daily-exchange-rates list', lambda i: (
+            'GET', url('daily-list'), {'date': date(i)}, None)),
+        Scenario('daily-exchange-rates as-of', lambda i: (
+            'GET', url('daily-as-of'),
+            {'from_code': pair(i)[0], 'to_code': pair(i)[1],
+             'date': [date(i + j * 7) for j in range(10)]}, None)),
+        Scenario('daily-exchange-rates latest', lambda i: (
+            'GET', url('daily-latest'),
+            {'from_code': pair(i)[0], 'to_code': pair(i)[1]}, None)),
+        Scenario('daily-exchange-rates export', lambda i: (
+            'GET', url('daily-export'),
+            {'from_code': pair(i)[0], 'to_code': pair(i)[1],
+             'format': 'csv'}, None)),
+        Scenario('convert', lambda i: (
+            'GET', url('convert'),
+            {'from_code': pair(i)[0], 'to_code': pair(i + 1)[1],
+             'amount': 100}, None)),
+        Scenario('quotes', lambda i: (
+            'POST', url('quotes'), None,
+            [dict(rate, amount=100) for rate in rates(i, 100)])),
+        Scenario('daily-exchange-rates create', lambda i: (
+            'POST', url('daily-detail'), None,
+            dict(rates(i, 1)[0], date=new_date(i)))),
+        Scenario('daily-exchange-rates bulk', lambda i: (
+            'POST', url('daily-bulk'), None, rates(i, 100))),
+        Scenario('exchange-rates create', create, created_callback),
+        Scenario('exchange-rates update', update),
+        Scenario('exchange-rates delete', delete),
+    ]
+
+
+def get_benchmark_code(i):
+    return '{}{}'.format(BENCHMARK_CODE, i)
+
+
+def reset_benchmark_data(days, start_date=SEED_START_DATE, requests=0):
+    """
+    Drop what an earlier benchmark created past the seeded days, so it
+    can create it again, and register the currencies of the pairs
+    created by requests requests
+    """
+    end_date = start_date + datetime.timedelta(days=days)
+    DailyRateSummary.objects.filter(date__gte=end_date).delete()
+    DailyExchangeRates.objects.filter(date__gte=end_date).delete()
+    ExchangeRates.objects.filter(
+        from_currency_id=register_currency(BENCHMARK_CODE)).delete()
+    for i in range(requests):
+        register_currency(get_benchmark_code(i))
+    invalidate_exchange_rates(
+        ExchangeRates.objects.values_list('id', flat=True))
+    invalidate_latest_rates()
+
+
+def get_percentile(timings, percentile):
+    """
+    Nearest rank percentile of sorted timings
+    """
+    if not timings:
+        return None
+    rank = int(math.ceil(percentile / 100 * len(timings)))
+    return timings[max(rank, 1) - 1]
+
+
+def summarize(timings, errors, elapsed, queries=None):
+    timings = sorted(timings)
+    result = {
+        'requests': len(timings),
+        'errors': errors,
+        'rps': len(timings) / elapsed if elapsed else None,
+        'mean_ms': sum(timings) / len(timings) * 1000 if timings else None,
+    }
+    for percentile in (50, 95, 99):
+        value = get_percentile(timings, percentile)
+        result['p{}_ms'.format(percentile)] = (
+            value * 1000 if value is not None else None)
+    result['queries_per_request'] = (
+        sum(queries) / len(queries) if queries else None)
+    return result
+
+
+def run_scenario(scenario, send, requests, concurrency=1):
+    """
+    Send requests requests of scenario with concurrency threads, send
+    takes (method, path, query, body) and returns (status, data,
+    queries). Return the summary of the run
+    """
+    callback = scenario.callback
+
+    def run(i):
+        request = scenario.request(i)
+        started = time.perf_counter()
+        status, data, queries = send(*request)
+        elapsed = time.perf_counter() - started
+        if callback is not None:
+            callback(i, data)
+        return elapsed, status >= 400, queries
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        results = [run(i) for i in range(requests)]
+    else:
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(run, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    queries = [result[2] for result in results if result[2] is not None]
+    return summarize([result[0] for result in results],
+                     sum(result[1] for result in results), elapsed, queries)
+
+
+def compare(previous, current, threshold):
+    """
+    Yield (endpoint, metric, previous, current, change, regressed) for
+    the p95 latency and throughput of every endpoint of both runs
+    """
+    for name, result in current['endpoints'].items():
+        before = previous['endpoints'].get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in (('p95_ms', False), ('rps', True)):
+            if not before.get(metric) or result.get(metric) is None:
+                continue
+            change = result[metric] / before[metric] - 1
+            regressed = (-change if higher_is_better else change) > threshold
+            yield (name, metric, before[metric], result[metric], change,
+                   regressed)
+
+
+def load_results(path):
+    with open(path) as results:
+        return json.load(results)
@@ -0,0 +1,170 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from server.replicas import get_write_position, read_from_replica_at
+
+# hits and misses of this process, read by the tests and for monitoring
+stats = {'hits': 0, 'misses': 0}
+
+PROCESS_LOCAL_MESSAGE = (
+    'The cache is local to this process, the server processes only see '
+    'the rates it writes once their cached copies expire. Set '
+    'CACHE_BACKEND and CACHE_LOCATION to a cache they share')
+
+
+def get_cache():
+    return caches[getattr(settings, 'EXCHANGE_RATE_CACHE', 'default')]
+
+
+def is_process_local():
+    """
+    Return True when the versions bumped by this process aren't seen by
+    the others, e.g. by a command run next to the server processes
+    """
+    return isinstance(get_cache(), LocMemCache)
+
+
+def get_timeout():
+    return getattr(settings, 'EXCHANGE_RATE_CACHE_TIMEOUT', 300)
+
+
+def get_version_key(name):
+    return 'exchange-rate:version:{}'.format(name)
+
+
+def get_modified_key(name):
+    return 'exchange-rate:modified:{}'.format(name)
+
+
+# WAL position of the primary after the last committed write, see
+# read_consistently
+POSITION_KEY = 'exchange-rate:position'
+
+
+def new_version():
+    # a missing (evicted) version restarts from the clock instead of 0,
+    # so entries written under an older counter can never be served again
+    return int(time.time() * 1000)
+
+
+def get_state(names):
+    """
+    Return the current version of every name and the last time any of
+    them changed, in a single cache round trip when they all exist
+    """
+    cache = get_cache()
+    version_keys = [get_version_key(name) for name in names]
+    modified_keys = [get_modified_key(name) for name in names]
+    found = cache.get_many(version_keys + modified_keys)
+
+    versions = []
+    for key in version_keys:
+        if key not in found:
+            cache.add(key, new_version(), None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+
+    last_modified = 0
+    for key in modified_keys:
+        if key not in found:
+            cache.add(key, time.time(), None)
+            found[key] = cache.get(key)
+        last_modified = max(last_modified, found[key])
+    return versions, last_modified
+
+
+def get_versions(names):
+    return get_state(names)[0]
+
+
+def bump_versions(names):
+    """
+    Move the version of every name. Inside a transaction they are bumped
+    again once it commits: a concurrent read between the two still sees
+    the previous rows, and would otherwise cache them under the version
+    the writer left
+    """
+    set_new_versions(names)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: set_new_versions(names))
+
+
+def set_new_versions(names):
+    cache = get_cache()
+    for name in names:
+        key = get_version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), None)
+    cache.set_many({get_modified_key(name): time.time() for name in names},
+                   None)
+    if not transaction.get_connection().in_atomic_block:
+        set_position(cache)
+
+
+def set_position(cache):
+    """
+    Store the WAL position of the primary once a write is committed, a
+    position is never replaced by an older one
+    """
+    position = get_write_position()
+    if position is not None and position > (cache.get(POSITION_KEY) or 0):
+        cache.set(POSITION_KEY, position, None)
+
+
+def read_consistently():
+    """
+    Context of reads kept under the current versions: they run on the
+    replica of the request only when it has replayed the last committed
+    write, on the primary otherwise
+    """
+    return read_from_replica_at(lambda: get_cache().get(POSITION_KEY))
+
+
+def get_key(prefix, versions, parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return 'exchange-rate:{}:{}:{}'.format(
+        prefix, ':'.join(str(version) for version in versions), digest)
+
+
+def get_or_compute(prefix, versions, parts, compute):
+    """
+    Return the cached value of prefix for parts, calling compute on a
+    miss. The key embeds versions, as returned by get_state, so bumping
+    one of them invalidates the entry. Misses are computed in
+    read_consistently, a replica may not have the rows of these versions
+    yet
+    """
+    cache = get_cache()
+    key = get_key(prefix, versions, parts)
+
+    value = cache.get(key)
+    if value is not None:
+        stats['hits'] += 1
+        return value
+
+    stats['misses'] += 1
+    with read_consistently():
+        value = compute()
+    cache.set(key, value, get_timeout())
+    return value
+
+
+def get_pair_version_name(exchange_rate_id):
+    return 'pair:{}'.format(exchange_rate_id)
+
+
+def invalidate_exchange_rates(exchange_rate_ids):
+    """
+    Drop every cached summary of the given exchange rates and every
+    cached list, which spans all of them
+    """
+    names = ['list']
+    names.extend(get_pair_version_name(pk) for pk in set(exchange_rate_ids))
+    bump_versions(names)
@@ -0,0 +1,36 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_key
+
+
+def get_etag(prefix, versions, parts):
+    return quote_etag(
+        hashlib.md5(get_key(prefix, versions, parts).encode()).hexdigest())
+
+
+def get_not_modified_response(request, etag, last_modified):
+    """
+    Return a 304 (or 412) response when the request validators match,
+    None when the response has to be built. HTTP dates are whole
+    seconds: If-Modified-Since only matches a date after the second of
+    the last change, a write in the second of the Last-Modified a client
+    holds would be missed otherwise
+    """
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified) + 1)
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept',))
+    patch_cache_control(
+        response, public=True,
+        max_age=getattr(settings, 'EXCHANGE_RATE_CACHE_CONTROL_MAX_AGE', 60))
+    return response
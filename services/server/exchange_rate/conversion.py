@@ -0,0 +1,154 @@
+import threading
+from collections import deque
+
+from django.db.models import OuterRef, Subquery
+
+from .cache import bump_versions, get_versions, read_consistently
+from .currencies import currency_index, normalize_code
+from .models import ExchangeRates, DailyExchangeRates
+from .snapshots import snapshot_store
+
+# bumped when the set of pairs or the latest rate of one of them moves,
+# see invalidate_latest_rates
+VERSION_NAMES = ('pairs', 'latest')
+LATEST_VERSION_NAME = 'latest'
+
+
+def invalidate_latest_rates(dates=None):
+    """
+    Bump the latest rates version when one of the dates written of an
+    exchange rate ({exchange_rate_id: dates}) is now its latest, or
+    unconditionally without dates. Rates written before the latest one
+    of their pair, e.g. by a backfill, leave the graph alone
+    """
+    if dates is not None:
+        to_date = DailyExchangeRates._meta.get_field('date').to_python
+        written = {pk: {to_date(date) for date in pk_dates}
+                   for pk, pk_dates in dates.items()}
+        latest_date = DailyExchangeRates.objects.filter(
+            exchange_rate=OuterRef('pk')).order_by('-date')
+        latest_dates = ExchangeRates.objects.filter(id__in=written).annotate(
+            latest_date=Subquery(latest_date.values('date')[:1])
+        ).values_list('id', 'latest_date')
+        if not any(latest in written[pk] for pk, latest in latest_dates):
+            return
+    bump_versions([LATEST_VERSION_NAME])
+
+
+class RateGraph:
+    """
+    Per process graph of the latest rate of every exchange rate, used to
+    convert between currencies that have no stored pair.
+
+    Every stored pair is an edge, its inverse is added when the opposite
+    pair isn't stored. Shortest paths (fewest conversions) are kept per
+    source currency and only dropped when the set of edges changes, a
+    new rate on an existing pair just updates the edge.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.rates = {}
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def get_latest_rates(self):
+        snapshot = snapshot_store.get()
+        if snapshot is not None:
+            return [(from_code, to_code, data['rate'])
+                    for from_code, to_code, data in snapshot.pairs()
+                    if data['rate'] is not None]
+
+        latest_rate = DailyExchangeRates.objects.filter(
+            exchange_rate=OuterRef('pk')).order_by('-date')
+        codes = currency_index.load()[1]
+        return [(codes.get(from_currency_id), codes.get(to_currency_id), rate)
+                for from_currency_id, to_currency_id, rate
+                in ExchangeRates.objects.annotate(
+                    latest_rate=Subquery(latest_rate.values('rate')[:1])
+                ).filter(latest_rate__isnull=False).values_list(
+                    'from_currency_id', 'to_currency_id', 'latest_rate')]
+
+    def load_rates(self):
+        exchange_rates = self.get_latest_rates()
+
+        rates = {}
+        for from_code, to_code, rate in exchange_rates:
+            rates[(from_code, to_code)] = rate
+        for (from_code, to_code), rate in list(rates.items()):
+            if (to_code, from_code) not in rates and rate != 0:
+                rates[(to_code, from_code)] = 1 / rate
+        return rates
+
+    def refresh(self):
+        version = get_versions(VERSION_NAMES)
+        if version == self.version:
+            return
+
+        # kept until the version moves, not read from a lagging replica
+        with read_consistently():
+            rates = self.load_rates()
+        with self.lock:
+            if rates.keys() != self.rates.keys():
+                self.paths = {}
+            self.rates = rates
+            self.version = version
+
+    def get_predecessors(self, source):
+        """
+        Breadth first search from source, map every reachable currency
+        to the currency it is reached from, None when source isn't a
+        currency of any pair
+        """
+        predecessors = self.paths.get(source)
+        if predecessors is not None:
+            return predecessors
+
+        adjacency = {}
+        for from_code, to_code in self.rates:
+            adjacency.setdefault(from_code, []).append(to_code)
+        # every currency of a pair has an edge out, the inverse one at
+        # least, only paths of those are kept whatever clients ask for
+        if source not in adjacency:
+            return None
+
+        predecessors = {source: None}
+        queue = deque([source])
+        while queue:
+            code = queue.popleft()
+            for next_code in adjacency.get(code, ()):
+                if next_code not in predecessors:
+                    predecessors[next_code] = code
+                    queue.append(next_code)
+
+        with self.lock:
+            self.paths[source] = predecessors
+        return predecessors
+
+    def convert(self, from_code, to_code):
+        """
+        Return (rate, path) from from_code to to_code or None when they
+        aren't connected
+        """
+        self.refresh()
+        from_code = normalize_code(from_code)
+        to_code = normalize_code(to_code)
+        if from_code == to_code:
+            return 1.0, [from_code]
+
+        predecessors = self.get_predecessors(from_code)
+        if predecessors is None or to_code not in predecessors:
+            return None
+
+        path = [to_code]
+        while path[-1] != from_code:
+            path.append(predecessors[path[-1]])
+        path.reverse()
+
+        rate = 1.0
+        for edge in zip(path, path[1:]):
+            rate *= self.rates[edge]
+        return rate, path
+
+
+rate_graph = RateGraph()
@@ -0,0 +1,344 @@
+"""
+Currencies of exchange rates, keyed by a small integer.
+
+ISO 4217 currencies are created with their numeric code as id after
+every migrate, other codes are registered with ids from
+FIRST_CUSTOM_ID. Codes are compared upper case, "usd" and "USD" are the
+same currency. Every process keeps the whole table in memory to turn
+codes into ids and back without a query or a join, see CurrencyIndex.
+
+Migrations aren't kept in the repository. An existing database needs
+its pairs linked to their currencies before the code columns go, in two
+migrations instead of the single one makemigrations writes: add the
+currency foreign keys and make the codes nullable, then make the foreign
+keys non null and remove the codes. manage.py link_pair_currencies, run
+by entrypoint.sh before migrate, applies the first one and links the
+pairs. A RunPython(link_pair_currencies, restore_pair_codes) in between
+does the same and can be reversed.
+"""
+
+import threading
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Max
+
+from .cache import bump_versions, get_versions, read_consistently
+
+VERSION_NAME = 'currencies'
+FIRST_CUSTOM_ID = 1000
+# inserts racing for the next custom id before register_currency gives up
+REGISTER_ATTEMPTS = 5
+
+# active ISO 4217 currencies as of 2025, plus gold, silver, platinum,
+# palladium and special drawing rights
+ISO_4217 = (
+    ('AED', 784, 'UAE Dirham'),
+    ('AFN', 971, 'Afghani'),
+    ('ALL', 8, 'Lek'),
+    ('AMD', 51, 'Armenian Dram'),
+    ('AOA', 973, 'Kwanza'),
+    ('ARS', 32, 'Argentine Peso'),
+    ('AUD', 36, 'Australian Dollar'),
+    ('AWG', 533, 'Aruban Florin'),
+    ('AZN', 944, 'Azerbaijan Manat'),
+    ('BAM', 977, 'Convertible Mark'),
+    ('BBD', 52, 'Barbados Dollar'),
+    ('BDT', 50, 'Taka'),
+    ('BGN', 975, 'Bulgarian Lev'),
+    ('BHD', 48, 'Bahraini Dinar'),
+    ('BIF', 108, 'Burundi Franc'),
+    ('BMD', 60, 'Bermudian Dollar'),
+    ('BND', 96, 'Brunei Dollar'),
+    ('BOB', 68, 'Boliviano'),
+    ('BRL', 986, 'Brazilian Real'),
+    ('BSD', 44, 'Bahamian Dollar'),
+    ('BTN', 64, 'Ngultrum'),
+    ('BWP', 72, 'Pula'),
+    ('BYN', 933, 'Belarusian Ruble'),
+    ('BZD', 84, 'Belize Dollar'),
+    ('CAD', 124, 'Canadian Dollar'),
+    ('CDF', 976, 'Congolese Franc'),
+    ('CHF', 756, 'Swiss Franc'),
+    ('CLP', 152, 'Chilean Peso'),
+    ('CNY', 156, 'Yuan Renminbi'),
+    ('COP', 170, 'Colombian Peso'),
+    ('CRC', 188, 'Costa Rican Colon'),
+    ('CUP', 192, 'Cuban Peso'),
+    ('CVE', 132, 'Cabo Verde Escudo'),
+    ('CZK', 203, 'Czech Koruna'),
+    ('DJF', 262, 'Djibouti Franc'),
+    ('DKK', 208, 'Danish Krone'),
+    ('DOP', 214, 'Dominican Peso'),
+    ('DZD', 12, 'Algerian Dinar'),
+    ('EGP', 818, 'Egyptian Pound'),
+    ('ERN', 232, 'Nakfa'),
+    ('ETB', 230, 'Ethiopian Birr'),
+    ('EUR', 978, 'Euro'),
+    ('FJD', 242, 'Fiji Dollar'),
+    ('FKP', 238, 'Falkland Islands Pound'),
+    ('GBP', 826, 'Pound Sterling'),
+    ('GEL', 981, 'Lari'),
+    ('GHS', 936, 'Ghana Cedi'),
+    ('GIP', 292, 'Gibraltar Pound'),
+    ('GMD', 270, 'Dalasi'),
+    ('GNF', 324, 'Guinean Franc'),
+    ('GTQ', 320, 'Quetzal'),
+    ('GYD', 328, 'Guyana Dollar'),
+    ('HKD', 344, 'Hong Kong Dollar'),
+    ('HNL', 340, 'Lempira'),
+    ('HTG', 332, 'Gourde'),
+    ('HUF', 348, 'Forint'),
+    ('IDR', 360, 'Rupiah'),
+    ('ILS', 376, 'New Israeli Sheqel'),
+    ('INR', 356, 'Indian Rupee'),
+    ('IQD', 368, 'Iraqi Dinar'),
+    ('IRR', 364, 'Iranian Rial'),
+    ('ISK', 352, 'Iceland Krona'),
+    ('JMD', 388, 'Jamaican Dollar'),
+    ('JOD', 400, 'Jordanian Dinar'),
+    ('JPY', 392, 'Yen'),
+    ('KES', 404, 'Kenyan Shilling'),
+    ('KGS', 417, 'Som'),
+    ('KHR', 116, 'Riel'),
+    ('KMF', 174, 'Comorian Franc'),
+    ('KPW', 408, 'North Korean Won'),
+    ('KRW', 410, 'Won'),
+    ('KWD', 414, 'Kuwaiti Dinar'),
+    ('KYD', 136, 'Cayman Islands Dollar'),
+    ('KZT', 398, 'Tenge'),
+    ('LAK', 418, 'Lao Kip'),
+    ('LBP', 422, 'Lebanese Pound'),
+    ('LKR', 144, 'Sri Lanka Rupee'),
+    ('LRD', 430, 'Liberian Dollar'),
+    ('LSL', 426, 'Loti'),
+    ('LYD', 434, 'Libyan Dinar'),
+    ('MAD', 504, 'Moroccan Dirham'),
+    ('MDL', 498, 'Moldovan Leu'),
+    ('MGA', 969, 'Malagasy Ariary'),
+    ('MKD', 807, 'Denar'),
+    ('MMK', 104, 'Kyat'),
+    ('MNT', 496, 'Tugrik'),
+    ('MOP', 446, 'Pataca'),
+    ('MRU', 929, 'Ouguiya'),
+    ('MUR', 480, 'Mauritius Rupee'),
+    ('MVR', 462, 'Rufiyaa'),
+    ('MWK', 454, 'Malawi Kwacha'),
+    ('MXN', 484, 'Mexican Peso'),
+    ('MYR', 458, 'Malaysian Ringgit'),
+    ('MZN', 943, 'Mozambique Metical'),
+    ('NAD', 516, 'Namibia Dollar'),
+    ('NGN', 566, 'Naira'),
+    ('NIO', 558, 'Cordoba Oro'),
+    ('NOK', 578, 'Norwegian Krone'),
+    ('NPR', 524, 'Nepalese Rupee'),
+    ('NZD', 554, 'New Zealand Dollar'),
+    ('OMR', 512, 'Rial Omani'),
+    ('PAB', 590, 'Balboa'),
+    ('PEN', 604, 'Sol'),
+    ('PGK', 598, 'Kina'),
+    ('PHP', 608, 'Philippine Peso'),
+    ('PKR', 586, 'Pakistan Rupee'),
+    ('PLN', 985, 'Zloty'),
+    ('PYG', 600, 'Guarani'),
+    ('QAR', 634, 'Qatari Rial'),
+    ('RON', 946, 'Romanian Leu'),
+    ('RSD', 941, 'Serbian Dinar'),
+    ('RUB', 643, 'Russian Ruble'),
+    ('RWF', 646, 'Rwanda Franc'),
+    ('SAR', 682, 'Saudi Riyal'),
+    ('SBD', 90, 'Solomon Islands Dollar'),
+    ('SCR', 690, 'Seychelles Rupee'),
+    ('SDG', 938, 'Sudanese Pound'),
+    ('SEK', 752, 'Swedish Krona'),
+    ('SGD', 702, 'Singapore Dollar'),
+    ('SHP', 654, 'Saint Helena Pound'),
+    ('SLE', 925, 'Leone'),
+    ('SOS', 706, 'Somali Shilling'),
+    ('SRD', 968, 'Surinam Dollar'),
+    ('SSP', 728, 'South Sudanese Pound'),
+    ('STN', 930, 'Dobra'),
+    ('SVC', 222, 'El Salvador Colon'),
+    ('SYP', 760, 'Syrian Pound'),
+    ('SZL', 748, 'Lilangeni'),
+    ('THB', 764, 'Baht'),
+    ('TJS', 972, 'Somoni'),
+    ('TMT', 934, 'Turkmenistan New Manat'),
+    ('TND', 788, 'Tunisian Dinar'),
+    ('TOP', 776, 'Pa\'anga'),
+    ('TRY', 949, 'Turkish Lira'),
+    ('TTD', 780, 'Trinidad and Tobago Dollar'),
+    ('TWD', 901, 'New Taiwan Dollar'),
+    ('TZS', 834, 'Tanzanian Shilling'),
+    ('UAH', 980, 'Hryvnia'),
+    ('UGX', 800, 'Uganda Shilling'),
+    ('USD', 840, 'US Dollar'),
+    ('UYU', 858, 'Peso Uruguayo'),
+    ('UZS', 860, 'Uzbekistan Sum'),
+    ('VED', 926, 'Bolivar Soberano'),
+    ('VES', 928, 'Bolivar Soberano'),
+    ('VND', 704, 'Dong'),
+    ('VUV', 548, 'Vatu'),
+    ('WST', 882, 'Tala'),
+    ('XAF', 950, 'CFA Franc BEAC'),
+    ('XAG', 961, 'Silver'),
+    ('XAU', 959, 'Gold'),
+    ('XCD', 951, 'East Caribbean Dollar'),
+    ('XCG', 532, 'Caribbean Guilder'),
+    ('XDR', 960, 'SDR (Special Drawing Right)'),
+    ('XOF', 952, 'CFA Franc BCEAO'),
+    ('XPD', 964, 'Palladium'),
+    ('XPF', 953, 'CFP Franc'),
+    ('XPT', 962, 'Platinum'),
+    ('YER', 886, 'Yemeni Rial'),
+    ('ZAR', 710, 'Rand'),
+    ('ZMW', 967, 'Zambian Kwacha'),
+    ('ZWG', 924, 'Zimbabwe Gold'),
+)
+
+
+def normalize_code(code):
+    return str(code).strip().upper()
+
+
+def get_currency_model():
+    return apps.get_model('exchange_rate', 'Currency')
+
+
+class CurrencyIndex:
+    """
+    Per process map between currency codes and ids, the whole table is
+    loaded again whenever the shared 'currencies' version in the cache
+    moves, see invalidate_currencies.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.maps = ({}, {})
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Return the current (code to id, id to code) dicts, the caller
+        can keep them for a batch of lookups
+        """
+        version = get_versions([VERSION_NAME])[0]
+        if version != self.version:
+            with read_consistently():
+                ids = dict(get_currency_model().objects.values_list(
+                    'code', 'id'))
+            with self.lock:
+                self.maps = (ids, {pk: code for code, pk in ids.items()})
+                self.version = version
+        return self.maps
+
+    def get_id(self, code):
+        """
+        Return the id of code, in any case, or None if it isn't a
+        currency
+        """
+        return self.load()[0].get(normalize_code(code))
+
+    def get_code(self, pk):
+        return self.load()[1].get(pk)
+
+
+currency_index = CurrencyIndex()
+
+
+def invalidate_currencies():
+    bump_versions([VERSION_NAME])
+
+
+def seed_currencies(Currency, using=DEFAULT_DB_ALIAS):
+    """
+    Create the missing ISO 4217 currencies, Currency is the model or its
+    historical version in a migration
+    """
+    currencies = Currency.objects.using(using)
+    existing = set(currencies.values_list('code', flat=True))
+    currencies.bulk_create(
+        Currency(id=number, code=code, name=name)
+        for code, number, name in ISO_4217 if code not in existing)
+
+
+def get_next_custom_id(Currency):
+    last = Currency.objects.filter(id__gte=FIRST_CUSTOM_ID).aggregate(
+        last=Max('id'))['last']
+    return FIRST_CUSTOM_ID if last is None else last + 1
+
+
+def register_currency(code, name=''):
+    """
+    Return the id of code, creating a currency outside of ISO 4217 for
+    it when it doesn't exist. A concurrent insert of the same code is
+    read back, one taking the same id is retried with the next one
+    """
+    pk = currency_index.get_id(code)
+    if pk is not None:
+        return pk
+    Currency = get_currency_model()
+    code = normalize_code(code)
+    for attempt in range(REGISTER_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return Currency.objects.create(
+                    id=get_next_custom_id(Currency), code=code,
+                    name=name).id
+        except IntegrityError:
+            pk = Currency.objects.filter(code=code).values_list(
+                'id', flat=True).first()
+            if pk is not None:
+                return pk
+            if attempt == REGISTER_ATTEMPTS - 1:
+                raise
+
+
+def link_pair_currencies(apps, schema_editor):
+    """
+    Data migration setting the currency foreign keys of every pair from
+    its codes. Codes outside of ISO 4217 are registered, and pairs only
+    differing by the case of their codes are merged into the oldest one:
+    rates of dates it lacks are moved to it, the others are dropped
+    """
+    Currency = apps.get_model('exchange_rate', 'Currency')
+    ExchangeRates = apps.get_model('exchange_rate', 'ExchangeRates')
+    DailyExchangeRates = apps.get_model('exchange_rate',
+                                        'DailyExchangeRates')
+    DailyRateSummary = apps.get_model('exchange_rate', 'DailyRateSummary')
+
+    seed_currencies(Currency, schema_editor.connection.alias)
+    ids = dict(Currency.objects.values_list('code', 'id'))
+    kept = {}
+    for pair in ExchangeRates.objects.order_by('id'):
+        codes = (normalize_code(pair.from_code), normalize_code(pair.to_code))
+        for code in codes:
+            if code not in ids:
+                ids[code] = Currency.objects.create(
+                    id=get_next_custom_id(Currency), code=code).id
+        if codes not in kept:
+            kept[codes] = pair.id
+            ExchangeRates.objects.filter(id=pair.id).update(
+                from_currency_id=ids[codes[0]], to_currency_id=ids[codes[1]])
+            continue
+
+        # summaries of the merged pair are rebuilt with
+        # manage.py rebuild_rate_summaries
+        dates = DailyExchangeRates.objects.filter(
+            exchange_rate_id=kept[codes]).values('date')
+        DailyExchangeRates.objects.filter(exchange_rate_id=pair.id).exclude(
+            date__in=dates).update(exchange_rate_id=kept[codes])
+        DailyRateSummary.objects.filter(
+            exchange_rate_id__in=[pair.id, kept[codes]]).delete()
+        pair.delete()
+
+
+def restore_pair_codes(apps, schema_editor):
+    """
+    Reverse of link_pair_currencies, merged pairs stay merged
+    """
+    ExchangeRates = apps.get_model('exchange_rate', 'ExchangeRates')
+    for pair in ExchangeRates.objects.select_related(
+            'from_currency', 'to_currency'):
+        ExchangeRates.objects.filter(id=pair.id).update(
+            from_code=pair.from_currency.code, to_code=pair.to_currency.code)
@@ -0,0 +1,46 @@
+from django.db.models import Q, Subquery
+
+from .models import DailyExchangeRates
+
+# keys answered by one query, SQLite refuses expression trees deeper
+# than 1000 and postgres plans long OR chains badly
+AS_OF_BATCH_SIZE = 100
+
+
+def get_rates_as_of(keys):
+    """
+    Map every (exchange_rate_id, date) in keys to the (date, rate) of
+    the most recent daily exchange rate at or before date, or the most
+    recent one when date is None. Keys without such a rate are left out.
+
+    Every key is an uncorrelated subquery probing the (exchange_rate,
+    -date) index once, and they are answered by a query per
+    AS_OF_BATCH_SIZE distinct keys.
+    """
+    lookups = list(set(keys))
+    found = {}
+    for start in range(0, len(lookups), AS_OF_BATCH_SIZE):
+        condition = Q()
+        for exchange_rate_id, date in lookups[start:start + AS_OF_BATCH_SIZE]:
+            rows = DailyExchangeRates.objects.filter(
+                exchange_rate_id=exchange_rate_id)
+            if date is not None:
+                rows = rows.filter(date__lte=date)
+            condition |= Q(
+                pk=Subquery(rows.order_by('-date').values('pk')[:1]))
+
+        daily_exchange_rates = DailyExchangeRates.objects.filter(
+            condition).values_list('exchange_rate_id', 'date', 'rate')
+        for exchange_rate_id, date, rate in daily_exchange_rates:
+            found.setdefault(exchange_rate_id, set()).add((date, rate))
+
+    # the rows found for a pair hold the answer of each of its keys,
+    # which is the most recent of them at or before the key date
+    rates = {}
+    for exchange_rate_id, date in lookups:
+        candidates = [(found_date, rate) for found_date, rate
+                      in found.get(exchange_rate_id, ())
+                      if date is None or found_date <= date]
+        if candidates:
+            rates[(exchange_rate_id, date)] = max(candidates)
+    return rates
@@ -0,0 +1,90 @@
+from django.db import connection, transaction
+
+from .cache import invalidate_exchange_rates
+from .conversion import invalidate_latest_rates
+from .currencies import currency_index, normalize_code
+from .models import ExchangeRates, DailyExchangeRates
+from .partitions import ensure_partitions
+from .push import publish_daily_exchange_rates
+from .summaries import refresh_summaries
+
+UPSERT_BATCH_SIZE = 250
+
+
+def get_exchange_rate_ids(pairs):
+    """
+    Map every (from_code, to_code) in pairs to its exchange rate id
+    with a single query, unknown pairs are left out
+    """
+    pairs = set(pairs)
+    ids = currency_index.load()[0]
+    currencies = {}
+    for from_code, to_code in pairs:
+        key = (ids.get(normalize_code(from_code)),
+               ids.get(normalize_code(to_code)))
+        if None not in key:
+            currencies.setdefault(key, []).append((from_code, to_code))
+    if not currencies:
+        return {}
+
+    exchange_rates = ExchangeRates.objects.filter(
+        from_currency_id__in={key[0] for key in currencies},
+        to_currency_id__in={key[1] for key in currencies}
+    ).values_list('from_currency_id', 'to_currency_id', 'id')
+    return {pair: pk
+            for from_currency_id, to_currency_id, pk in exchange_rates
+            for pair in currencies.get((from_currency_id, to_currency_id),
+                                       ())}
+
+
+def upsert_daily_exchange_rates(rows, batch_size=UPSERT_BATCH_SIZE,
+                                summarize=True):
+    """
+    Insert or update (exchange_rate_id, rate, date) rows in batches of
+    multi-row INSERT ... ON CONFLICT statements, when the same
+    (exchange_rate_id, date) appears more than once the last row wins.
+    Without summarize the caller rebuilds the summaries of the pairs
+    once it is done, e.g. after every chunk of an import. Return the
+    number of rows written
+    """
+    latest = {}
+    for exchange_rate_id, rate, date in rows:
+        latest[(exchange_rate_id, date)] = rate
+    rows = [(rate, connection.ops.adapt_datefield_value(date),
+             exchange_rate_id)
+            for (exchange_rate_id, date), rate in latest.items()]
+
+    opts = DailyExchangeRates._meta
+    quote_name = connection.ops.quote_name
+    rate_column = quote_name(opts.get_field('rate').column)
+    date_column = quote_name(opts.get_field('date').column)
+    exchange_rate_column = quote_name(
+        opts.get_field('exchange_rate').column)
+    sql = ('INSERT INTO {table} ({rate}, {date}, {exchange_rate}) '
+           'VALUES {values} '
+           'ON CONFLICT ({date}, {exchange_rate}) '
+           'DO UPDATE SET {rate} = EXCLUDED.{rate}')
+
+    ensure_partitions(date for _, date in latest)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                sql.format(table=quote_name(opts.db_table),
+                           rate=rate_column,
+                           date=date_column,
+                           exchange_rate=exchange_rate_column,
+                           values=', '.join(['(%s, %s, %s)'] * len(batch))),
+                [value for row in batch for value in row])
+    dates = {}
+    for exchange_rate_id, date in latest:
+        dates.setdefault(exchange_rate_id, []).append(date)
+    if summarize:
+        for exchange_rate_id, exchange_rate_dates in dates.items():
+            refresh_summaries(exchange_rate_id, exchange_rate_dates)
+    invalidate_exchange_rates(dates)
+    invalidate_latest_rates(dates)
+    publish_daily_exchange_rates(
+        (exchange_rate_id, rate, date)
+        for (exchange_rate_id, date), rate in latest.items())
+    return len(rows)
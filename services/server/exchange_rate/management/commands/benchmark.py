@@ -0,0 +1,231 @@
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import django
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from exchange_rate.benchmarks import (
+    SEED_START_DATE,
+    compare,
+    get_scenarios,
+    get_seed_pairs,
+    load_results,
+    reset_benchmark_data,
+    run_scenario
+)
+from exchange_rate.ingest import get_exchange_rate_ids
+
+
+class Command(BaseCommand):
+    help = ('Measure latency percentiles, throughput and queries per '
+            'request of every exchange_rate endpoint, in process or over '
+            'HTTP against gunicorn. Run seed_rates with the same --pairs '
+            'and --days first')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=100)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--start-date', default=str(SEED_START_DATE))
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests per endpoint')
+        parser.add_argument('--http', action='store_true',
+                            help='load a local gunicorn instead of calling '
+                                 'the views in process')
+        parser.add_argument('--url',
+                            help='load this running server instead, '
+                                 'implies --http')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='concurrent HTTP requests')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='gunicorn workers')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--endpoint', action='append',
+                            help='only run endpoints containing this text')
+        parser.add_argument('--output', help='write the results as JSON')
+        parser.add_argument('--compare',
+                            help='JSON results of an earlier run')
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help='relative change reported as regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be '
+                               'positive')
+        try:
+            start_date = datetime.datetime.strptime(
+                options['start_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('--start-date must be YYYY-MM-DD')
+
+        pairs = get_seed_pairs(options['pairs'])
+        ids = get_exchange_rate_ids(pairs)
+        if len(ids) != len(pairs):
+            raise CommandError('Missing seeded pairs, run seed_rates '
+                               '--pairs {} --days {} first'.format(
+                                   options['pairs'], options['days']))
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on, every query is recorded and '
+                              'timings are higher than in production')
+
+        reset_benchmark_data(options['days'], start_date,
+                             options['requests'])
+        scenarios = [
+            scenario for scenario in get_scenarios(
+                pairs, [ids[pair] for pair in pairs], options['days'],
+                start_date)
+            if not options['endpoint'] or any(
+                text in scenario.name for text in options['endpoint'])]
+
+        http = options['http'] or options['url']
+        server = None
+        if http:
+            base_url = options['url']
+            if base_url is None:
+                base_url = 'http://127.0.0.1:{}'.format(options['port'])
+                server = self.start_server(options['port'],
+                                           options['workers'])
+            send = self.get_http_send(base_url.rstrip('/'))
+            concurrency = options['concurrency']
+        else:
+            send = self.get_client_send()
+            concurrency = 1
+
+        endpoints = {}
+        try:
+            for scenario in scenarios:
+                result = run_scenario(scenario, send, options['requests'],
+                                      concurrency)
+                endpoints[scenario.name] = result
+                self.write_result(scenario.name, result)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        results = {'meta': self.get_meta(options, http, concurrency),
+                   'endpoints': endpoints}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+        if options['compare']:
+            self.compare(load_results(options['compare']), results,
+                         options['threshold'],
+                         options['fail_on_regression'])
+
+    def get_client_send(self):
+        client = APIClient()
+
+        def send(method, path, query, body):
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'GET':
+                    response = client.get(path, data=query)
+                else:
+                    response = getattr(client, method.lower())(
+                        path, data=body, format='json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            return (response.status_code, getattr(response, 'data', None),
+                    len(queries))
+        return send
+
+    def get_http_send(self, base_url):
+        sessions = threading.local()
+
+        def send(method, path, query, body):
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+            response = sessions.session.request(
+                method, base_url + path, params=query, json=body)
+            data = None
+            if response.headers.get('Content-Type', '').startswith(
+                    'application/json'):
+                data = response.json()
+            return response.status_code, data, None
+        return send
+
+    def start_server(self, port, workers):
+        # the gunicorn script installed along this python comes first
+        gunicorn = shutil.which('gunicorn', path=os.pathsep.join(
+            [os.path.dirname(sys.executable), os.environ.get('PATH', '')]))
+        if gunicorn is None:
+            raise CommandError('gunicorn is not installed')
+        server = subprocess.Popen(
+            [gunicorn, '-b',
+             '127.0.0.1:{}'.format(port), '-w', str(workers),
+             '--log-level', 'warning', 'server.wsgi:application'],
+            env=dict(os.environ,
+                     DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE))
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited with {}'.format(
+                    server.returncode))
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('gunicorn did not start listening on {}'.format(
+            port))
+
+    def get_meta(self, options, http, concurrency):
+        try:
+            commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {'commit': commit,
+                'date': datetime.datetime.utcnow().isoformat(),
+                'mode': 'http' if http else 'in-process',
+                'pairs': options['pairs'],
+                'days': options['days'],
+                'requests': options['requests'],
+                'concurrency': concurrency,
+                'database': connection.vendor,
+                'debug': settings.DEBUG,
+                'python': platform.python_version(),
+                'django': django.get_version()}
+
+    def write_result(self, name, result):
+        queries = result['queries_per_request']
+        self.stdout.write(
+            '{:<40} p50 {:7.1f} ms  p95 {:7.1f} ms  p99 {:7.1f} ms  '
+            '{:7.1f} req/s  {} queries  {} errors'.format(
+                name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['rps'],
+                '-' if queries is None else '{:.1f}'.format(queries),
+                result['errors']))
+
+    def compare(self, previous, current, threshold, fail_on_regression):
+        if previous['meta'].get('mode') != current['meta']['mode']:
+            self.stderr.write('Comparing a {} run with a {} run'.format(
+                previous['meta'].get('mode'), current['meta']['mode']))
+        regressions = 0
+        for name, metric, before, after, change, regressed in compare(
+                previous, current, threshold):
+            line = '{:<40} {:<6} {:9.1f} -> {:9.1f} ({:+.0%})'.format(
+                name, metric, before, after, change)
+            if regressed:
+                regressions += 1
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions and fail_on_regression:
+            raise CommandError('{} regressions above {:.0%}'.format(
+                regressions, threshold))
@@ -0,0 +1,79 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rest_framework.renderers import JSONRenderer
+
+from exchange_rate.currencies import register_currency
+from exchange_rate.models import ExchangeRates, DailyExchangeRates
+from exchange_rate.partitions import ensure_partitions
+from exchange_rate.renderers import FastJSONRenderer
+from exchange_rate.serializers import (
+    DailyExchangeRatesSerializer,
+    get_daily_exchange_rates_data
+)
+
+BENCHMARK_CODE = 'BENCH'
+
+
+class Command(BaseCommand):
+    help = ('Compare ModelSerializer with JSONRenderer against value '
+            'tuples with FastJSONRenderer on a large daily exchange rate '
+            'response. The rows are written in a transaction that is '
+            'rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError('--rows and --repeat must be positive')
+
+        with transaction.atomic():
+            queryset = self.create_rows(options['rows'])
+            model = self.measure(
+                options['repeat'],
+                lambda: JSONRenderer().render(DailyExchangeRatesSerializer(
+                    queryset.all(), many=True).data))
+            values = self.measure(
+                options['repeat'],
+                lambda: FastJSONRenderer().render(
+                    get_daily_exchange_rates_data(queryset.all())))
+            transaction.set_rollback(True)
+
+        for name, elapsed in (('ModelSerializer + JSONRenderer', model),
+                              ('values + FastJSONRenderer', values)):
+            self.stdout.write('{:<32} {:8.1f} ms {:8.1f} responses/s'.format(
+                name, elapsed * 1000, 1 / elapsed))
+        self.stdout.write(self.style.SUCCESS(
+            '{:.1f}x faster on {} rows'.format(model / values,
+                                               options['rows'])))
+
+    def create_rows(self, rows):
+        currency_id = register_currency(BENCHMARK_CODE)
+        exchange_rate = ExchangeRates.objects.create(
+            from_currency_id=currency_id, to_currency_id=currency_id)
+        start = datetime.date(2000, 1, 1)
+        dates = [start + datetime.timedelta(days=day) for day in range(rows)]
+        ensure_partitions(dates)
+        DailyExchangeRates.objects.bulk_create(
+            (DailyExchangeRates(exchange_rate=exchange_rate,
+                                rate=1 + day / rows, date=date)
+             for day, date in enumerate(dates)),
+            batch_size=500)
+        return DailyExchangeRates.objects.filter(
+            exchange_rate=exchange_rate).order_by('-date')
+
+    def measure(self, repeat, render):
+        """
+        Return the best time of repeat renders, database fetch included
+        """
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,73 @@
+import datetime
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from exchange_rate.cache import (
+    PROCESS_LOCAL_MESSAGE,
+    get_versions,
+    is_process_local
+)
+from exchange_rate.snapshots import (
+    VERSION_NAME,
+    build_snapshot,
+    get_snapshot_path
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Write the latest rate and 7 day statistics of every pair to '
+            'the memory-mapped snapshot the read endpoints serve from, '
+            'see exchange_rate/snapshots.py')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=get_snapshot_path(),
+                            help='default EXCHANGE_RATE_SNAPSHOT_PATH')
+        parser.add_argument('--date', metavar='YYYY-MM-DD',
+                            help='date of the statistics, default today')
+        parser.add_argument('--interval', type=float,
+                            help='keep running, checking every interval '
+                                 'seconds for changes to snapshot')
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('--path or EXCHANGE_RATE_SNAPSHOT_PATH '
+                               'is required')
+        # changes are seen through the versions the server processes bump
+        if options['interval'] is not None and is_process_local():
+            raise CommandError(PROCESS_LOCAL_MESSAGE)
+        date = None
+        if options['date']:
+            try:
+                date = datetime.datetime.strptime(
+                    options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be YYYY-MM-DD')
+
+        built = None
+        while True:
+            try:
+                state = (get_versions([VERSION_NAME])[0],
+                         date or datetime.date.today())
+                if state != built:
+                    self.build(options['path'], state[1])
+                    built = state
+            except Exception:
+                if options['interval'] is None:
+                    raise
+                # built is left as is, the next check tries again
+                logger.exception('Building the snapshot failed')
+            if options['interval'] is None:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def build(self, path, date):
+        started = time.monotonic()
+        pairs = build_snapshot(path, date)
+        self.stdout.write('Snapshot of {} pairs on {} in {:.1f} ms'.format(
+            pairs, date, (time.monotonic() - started) * 1000))
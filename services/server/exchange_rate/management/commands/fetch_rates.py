@@ -0,0 +1,116 @@
+import datetime
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from exchange_rate.cache import PROCESS_LOCAL_MESSAGE, is_process_local
+from exchange_rate.models import ExchangeRates
+from exchange_rate.pairs import pair_index
+from exchange_rate.providers import (
+    RateFetcher,
+    get_missing_pairs,
+    get_provider
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Fetch the daily exchange rate of every pair, or only of the '
+            'given FROM_CODE/TO_CODE pairs, from the EXCHANGE_RATE_PROVIDER '
+            'feed, see exchange_rate/providers.py. Pairs that already have '
+            'a rate on the date are skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('pairs', nargs='*', metavar='FROM_CODE/TO_CODE')
+        parser.add_argument('--url',
+                            help='fetch from a JSON provider at this url, '
+                                 'formatted with {from_code}, {to_code} '
+                                 'and {date}')
+        parser.add_argument('--date', metavar='YYYY-MM-DD',
+                            help='date of the rates, default today')
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--retries', type=int, default=3)
+        parser.add_argument('--backoff', type=float, default=0.5,
+                            help='seconds before the first retry, doubled '
+                                 'on every other one')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float,
+                            help='keep running, fetching again every '
+                                 'interval seconds')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be positive')
+        provider = get_provider(options['url'])
+        if provider is None:
+            raise CommandError('--url or EXCHANGE_RATE_PROVIDER is required')
+        if is_process_local():
+            if options['interval'] is not None:
+                raise CommandError(PROCESS_LOCAL_MESSAGE)
+            self.stderr.write(PROCESS_LOCAL_MESSAGE)
+        date = None
+        if options['date']:
+            try:
+                date = datetime.datetime.strptime(
+                    options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be YYYY-MM-DD')
+
+        fetcher = RateFetcher(provider, workers=options['workers'],
+                              retries=options['retries'],
+                              backoff=options['backoff'])
+        try:
+            while True:
+                try:
+                    self.fetch(fetcher, options['pairs'],
+                               date or datetime.date.today(),
+                               options['batch_size'])
+                except Exception:
+                    if options['interval'] is None:
+                        raise
+                    # the next run tries again
+                    logger.exception('Fetching rates failed')
+                if options['interval'] is None:
+                    return
+                close_old_connections()
+                time.sleep(options['interval'])
+        finally:
+            fetcher.close()
+
+    def get_pairs(self, pairs):
+        """
+        Return the (exchange_rate_id, from_code, to_code) of pairs, or of
+        every exchange rate when none is given
+        """
+        if not pairs:
+            return [(exchange_rate.id, exchange_rate.from_code,
+                     exchange_rate.to_code)
+                    for exchange_rate in ExchangeRates.objects.order_by('id')]
+
+        exchange_rates = []
+        for pair in pairs:
+            try:
+                from_code, to_code = pair.split('/')
+            except ValueError:
+                from_code = to_code = ''
+            pk = pair_index.get(from_code, to_code)
+            if pk is None:
+                raise CommandError('Unknown exchange rate {}'.format(pair))
+            exchange_rates.append((pk, from_code, to_code))
+        return exchange_rates
+
+    def fetch(self, fetcher, pairs, date, batch_size):
+        started = time.monotonic()
+        pairs = self.get_pairs(pairs)
+        missing = get_missing_pairs(pairs, date)
+        written, failed = fetcher.run(missing, date, batch_size)
+        for from_code, to_code, error in failed:
+            self.stderr.write('{}/{}: {}'.format(from_code, to_code, error))
+        self.stdout.write(self.style.SUCCESS(
+            'Fetched {} pairs on {}, {} already stored, {} written, {} '
+            'failed in {:.1f}s'.format(
+                len(pairs), date, len(pairs) - len(missing), written,
+                len(failed), time.monotonic() - started)))
@@ -0,0 +1,220 @@
+import csv
+import datetime
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from exchange_rate.cache import (
+    PROCESS_LOCAL_MESSAGE,
+    invalidate_exchange_rates,
+    is_process_local
+)
+from exchange_rate.conversion import invalidate_latest_rates
+from exchange_rate.currencies import currency_index, normalize_code
+from exchange_rate.ingest import (
+    get_exchange_rate_ids,
+    upsert_daily_exchange_rates
+)
+from exchange_rate.models import ExchangeRates, DailyExchangeRates
+from exchange_rate.partitions import ensure_partitions
+from exchange_rate.summaries import rebuild_summaries
+
+STAGING_TABLE = 'import_daily_exchange_rates'
+
+
+class Command(BaseCommand):
+    help = ('Import daily exchange rates from a CSV (from_code, to_code, '
+            'rate, date header) or NDJSON file in fixed-size chunks, '
+            'existing (date, exchange rate) rows are updated')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file to import, - for stdin')
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help='defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        file_format = options['format'] or self.guess_format(options['path'])
+        if is_process_local():
+            self.stderr.write(PROCESS_LOCAL_MESSAGE)
+
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(options['path'], newline='')
+            except OSError as exc:
+                raise CommandError(exc)
+
+        use_copy = connection.vendor == 'postgresql'
+        write_chunk = self.copy_chunk if use_copy else self.write_chunk
+        if use_copy:
+            self.create_staging_table()
+
+        # pairs written to, summarized once at the end: refreshing the
+        # summaries of every chunk would go over the same windows again
+        self.touched = set()
+        read = invalid = written = 0
+        started = time.monotonic()
+        try:
+            for chunk, chunk_invalid in self.read_chunks(
+                    stream, file_format, options['chunk_size']):
+                with transaction.atomic():
+                    written += write_chunk(chunk)
+                read += len(chunk) + chunk_invalid
+                invalid += chunk_invalid
+                self.report(read, written, started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if use_copy:
+                self.drop_staging_table()
+            # chunks already written are summarized even after a failure
+            self.summarize()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Read {} rows, {} invalid, {} written in {:.1f}s'.format(
+                read, invalid, written, time.monotonic() - started)))
+
+    def guess_format(self, path):
+        if path.endswith('.csv'):
+            return 'csv'
+        if path.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        raise CommandError('Unknown file format, use --format')
+
+    def read_records(self, stream, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(stream)
+            return
+
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+    def parse_record(self, record):
+        """
+        Return a (from_code, to_code, rate, date) tuple or None when
+        the record is invalid
+        """
+        try:
+            date = datetime.datetime.strptime(
+                record['date'], '%Y-%m-%d').date()
+            return (str(record['from_code']), str(record['to_code']),
+                    float(record['rate']), date)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def read_chunks(self, stream, file_format, chunk_size):
+        """
+        Yield lists of at most chunk_size parsed rows along with the
+        number of invalid records skipped while filling them
+        """
+        chunk = []
+        invalid = 0
+        for record in self.read_records(stream, file_format):
+            row = self.parse_record(record)
+            if row is None:
+                invalid += 1
+                continue
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk, invalid
+                chunk = []
+                invalid = 0
+        if chunk or invalid:
+            yield chunk, invalid
+
+    def write_chunk(self, chunk):
+        exchange_rate_ids = get_exchange_rate_ids(
+            (from_code, to_code) for from_code, to_code, _, _ in chunk)
+        rows = [(exchange_rate_ids[(from_code, to_code)], rate, date)
+                for from_code, to_code, rate, date in chunk
+                if (from_code, to_code) in exchange_rate_ids]
+        self.touched.update(row[0] for row in rows)
+        return upsert_daily_exchange_rates(rows, summarize=False)
+
+    def create_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE {} (line bigint, '
+                'from_currency_id smallint, to_currency_id smallint, '
+                'rate double precision, date date)'.format(STAGING_TABLE))
+
+    def drop_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(STAGING_TABLE))
+
+    def copy_chunk(self, chunk):
+        """
+        COPY the chunk into the staging table and merge it into
+        DailyExchangeRates with a single INSERT ... SELECT
+        """
+        # rows of unknown currencies can't match a pair, left out
+        ids = currency_index.load()[0]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for line, (from_code, to_code, rate, date) in enumerate(chunk):
+            from_currency_id = ids.get(normalize_code(from_code))
+            to_currency_id = ids.get(normalize_code(to_code))
+            if from_currency_id is not None and to_currency_id is not None:
+                writer.writerow((line, from_currency_id, to_currency_id,
+                                 rate, date.isoformat()))
+        buffer.seek(0)
+
+        ensure_partitions(date for _, _, _, date in chunk)
+        daily = DailyExchangeRates._meta
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY {} FROM STDIN WITH (FORMAT csv)'.format(STAGING_TABLE),
+                buffer)
+            # DISTINCT ON keeps the last line of a duplicated
+            # (exchange rate, date), ON CONFLICT can't touch a row twice
+            cursor.execute(
+                'INSERT INTO {daily} (rate, date, exchange_rate_id) '
+                'SELECT DISTINCT ON (e.id, s.date) s.rate, s.date, e.id '
+                'FROM {staging} s JOIN {pairs} e '
+                'ON e.from_currency_id = s.from_currency_id '
+                'AND e.to_currency_id = s.to_currency_id '
+                'ORDER BY e.id, s.date, s.line DESC '
+                'ON CONFLICT (date, exchange_rate_id) '
+                'DO UPDATE SET rate = EXCLUDED.rate '
+                'RETURNING exchange_rate_id, date'.format(
+                    daily=connection.ops.quote_name(daily.db_table),
+                    staging=STAGING_TABLE,
+                    pairs=connection.ops.quote_name(
+                        ExchangeRates._meta.db_table)))
+            written = cursor.fetchall()
+            cursor.execute('TRUNCATE {}'.format(STAGING_TABLE))
+
+        dates = {}
+        for exchange_rate_id, date in written:
+            dates.setdefault(exchange_rate_id, []).append(date)
+        self.touched.update(dates)
+        invalidate_exchange_rates(dates)
+        invalidate_latest_rates(dates)
+        return len(written)
+
+    def summarize(self):
+        started = time.monotonic()
+        for exchange_rate_id in sorted(self.touched):
+            rebuild_summaries(exchange_rate_id)
+        invalidate_exchange_rates(self.touched)
+        self.stdout.write('Summarized {} pairs in {:.1f}s'.format(
+            len(self.touched), time.monotonic() - started))
+
+    def report(self, read, written, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write('{} rows read, {} written, {:.0f} rows/sec'.format(
+            read, written, read / elapsed))
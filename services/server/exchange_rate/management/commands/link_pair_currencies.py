@@ -0,0 +1,90 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.migrations.loader import MigrationLoader
+
+from exchange_rate.currencies import (
+    invalidate_currencies,
+    link_pair_currencies
+)
+from exchange_rate.models import ExchangeRates
+from exchange_rate.pairs import invalidate_pairs
+
+APP_LABEL = 'exchange_rate'
+
+
+def get_link_migration(loader):
+    """
+    Return the last migration of the app whose pairs have both their
+    codes and their currency foreign keys, and the ones after it, or
+    (None, []) when the migrations never had both
+    """
+    leaves = [key for key in loader.graph.leaf_nodes()
+              if key[0] == APP_LABEL]
+    if not leaves:
+        return None, []
+    keys = [key for key in loader.graph.forwards_plan(leaves[0])
+            if key[0] == APP_LABEL]
+
+    for index in range(len(keys) - 1, -1, -1):
+        state = loader.project_state(keys[index])
+        model = state.models.get((APP_LABEL, 'exchangerates'))
+        names = {name for name, _ in model.fields} if model else set()
+        if {'from_code', 'from_currency'} <= names:
+            return keys[index], keys[index + 1:]
+    return None, []
+
+
+def has_pair_codes():
+    """
+    Return True when the pairs table of the database still has the code
+    columns, so its pairs may not be linked
+    """
+    table = ExchangeRates._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return False
+        columns = connection.introspection.get_table_description(
+            cursor, table)
+    return 'from_code' in {column.name for column in columns}
+
+
+class Command(BaseCommand):
+    help = ('Link every exchange rate to its currencies from its codes: '
+            'migrate up to the migration adding the currency foreign keys, '
+            'then run the link_pair_currencies data migration. Run before '
+            'migrate, which removes the codes. Safe to run on every deploy, '
+            'does nothing once the pairs are linked')
+
+    def handle(self, *args, **options):
+        loader = MigrationLoader(connection)
+        target, later = get_link_migration(loader)
+        if target is None and has_pair_codes():
+            # migrate would drop the codes before anything links the pairs
+            raise CommandError(
+                'The pairs still have their codes but no migration adds '
+                'the currency foreign keys before removing them, see '
+                'exchange_rate/currencies.py for the migrations to write')
+        if target is None or any(
+                key in loader.applied_migrations for key in later):
+            self.stdout.write('Pairs are linked to their currencies')
+            return
+
+        if target not in loader.applied_migrations:
+            call_command('migrate', APP_LABEL, target[1],
+                         stdout=self.stdout)
+
+        apps = loader.project_state(target).apps
+        ExchangeRates = apps.get_model(APP_LABEL, 'ExchangeRates')
+        if not ExchangeRates.objects.filter(
+                from_currency__isnull=True).exists():
+            self.stdout.write('Pairs are linked to their currencies')
+            return
+
+        # only the connection of the schema editor is used
+        with transaction.atomic():
+            link_pair_currencies(apps, connection.schema_editor())
+        invalidate_currencies()
+        invalidate_pairs()
+        self.stdout.write(self.style.SUCCESS(
+            'Pairs linked to their currencies'))
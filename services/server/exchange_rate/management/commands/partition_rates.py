@@ -0,0 +1,54 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from exchange_rate.partitions import (
+    convert_to_partitioned,
+    create_future_partitions,
+    detach_partitions_before,
+    is_partitioned
+)
+
+
+class Command(BaseCommand):
+    help = ('Manage the date range partitions of daily exchange rates on '
+            'PostgreSQL: convert the table, create the partitions of the '
+            'coming periods and detach old ones. Safe to run on every '
+            'deploy, does nothing on other databases')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='partition the table if it is not yet')
+        parser.add_argument('--ahead', type=int, default=2,
+                            help='periods to create after the current one')
+        parser.add_argument('--detach-before', metavar='YYYY-MM-DD',
+                            help='detach partitions older than this date')
+        parser.add_argument('--drop', action='store_true',
+                            help='drop detached partitions instead of '
+                                 'keeping them as archive tables')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write('Partitioning requires PostgreSQL, skipped')
+            return
+
+        if not is_partitioned():
+            if not options['convert']:
+                self.stdout.write('Table is not partitioned, use --convert')
+                return
+            convert_to_partitioned(options['ahead'])
+            self.stdout.write(self.style.SUCCESS('Table partitioned'))
+
+        with connection.cursor() as cursor:
+            names = create_future_partitions(cursor, options['ahead'])
+        self.stdout.write('Partitions up to {}'.format(names[-1]))
+
+        if options['detach_before']:
+            try:
+                date = datetime.datetime.strptime(
+                    options['detach_before'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--detach-before must be YYYY-MM-DD')
+            for name in detach_partitions_before(date, options['drop']):
+                self.stdout.write('Detached {}'.format(name))
@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, OuterRef, Q, Subquery
+
+from exchange_rate.cache import invalidate_exchange_rates
+from exchange_rate.models import (
+    ExchangeRates,
+    DailyExchangeRates,
+    DailyRateSummary
+)
+from exchange_rate.pairs import pair_index
+from exchange_rate.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = ('Recompute the daily rate summaries of every exchange rate, '
+            'or only of the given FROM_CODE/TO_CODE pairs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('pairs', nargs='*', metavar='FROM_CODE/TO_CODE')
+        parser.add_argument('--missing', action='store_true',
+                            help='only the exchange rates whose latest '
+                                 'daily rate has no summary, e.g. the ones '
+                                 'written before summaries existed')
+
+    def handle(self, *args, **options):
+        exchange_rates = ExchangeRates.objects.order_by('id')
+        if options['pairs']:
+            ids = []
+            for pair in options['pairs']:
+                try:
+                    from_code, to_code = pair.split('/')
+                except ValueError:
+                    from_code = to_code = ''
+                pk = pair_index.get(from_code, to_code)
+                if pk is None:
+                    raise CommandError('Unknown exchange rate {}'.format(pair))
+                ids.append(pk)
+            exchange_rates = exchange_rates.filter(id__in=ids)
+        if options['missing']:
+            exchange_rates = self.get_missing(exchange_rates)
+
+        started = time.monotonic()
+        total = 0
+        for exchange_rate in exchange_rates:
+            count = rebuild_summaries(exchange_rate.id)
+            invalidate_exchange_rates([exchange_rate.id])
+            total += count
+            self.stdout.write('{}: {} summaries'.format(exchange_rate, count))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt {} summaries in {:.1f}s'.format(
+                total, time.monotonic() - started)))
+
+    def get_missing(self, exchange_rates):
+        latest_date = DailyExchangeRates.objects.filter(
+            exchange_rate=OuterRef('pk')).order_by('-date').values('date')
+        summary_date = DailyRateSummary.objects.filter(
+            exchange_rate=OuterRef('pk')).order_by('-date').values('date')
+        return exchange_rates.annotate(
+            latest_date=Subquery(latest_date[:1]),
+            summary_date=Subquery(summary_date[:1]),
+        ).filter(latest_date__isnull=False).filter(
+            Q(summary_date__isnull=True) | ~Q(summary_date=F('latest_date')))
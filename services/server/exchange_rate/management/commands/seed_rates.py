@@ -0,0 +1,33 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exchange_rate.benchmarks import SEED_START_DATE, seed_rates
+
+
+class Command(BaseCommand):
+    help = ('Create synthetic exchange rates with a random walk of daily '
+            'rates, for benchmarks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=100)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--start-date', default=str(SEED_START_DATE))
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['pairs'] < 1 or options['days'] < 1:
+            raise CommandError('--pairs and --days must be positive')
+        try:
+            start_date = datetime.datetime.strptime(
+                options['start_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('--start-date must be YYYY-MM-DD')
+
+        started = time.monotonic()
+        pairs = seed_rates(options['pairs'], options['days'], start_date,
+                           options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded {} pairs x {} days in {:.1f}s'.format(
+                len(pairs), options['days'], time.monotonic() - started)))
@@ -1,19 +1,44 @@
 from django.db import models
 
+from .currencies import currency_index
+
 # Create your models here.
 
 
+class Currency(models.Model):
+    """
+    Currency of exchange rates, the id is the ISO 4217 numeric code or
+    from 1000 for other codes, see exchange_rate.currencies
+    """
+    id = models.SmallIntegerField(primary_key=True)
+    # upper case code
+    code = models.CharField(max_length=8, unique=True)
+    name = models.CharField(max_length=64, blank=True)
+
+    def __str__(self):
+        return self.code
+
+
 class ExchangeRates(models.Model):
     class Meta:
-        unique_together = ("from_code", "to_code")
-        indexes = [
-            models.Index(fields=['from_code', 'to_code', ]),
-        ]
+        unique_together = ("from_currency", "to_currency")
+
+    # from currency exchange rate
+    # indexed by the unique constraint on both currencies
+    from_currency = models.ForeignKey(Currency, on_delete=models.PROTECT,
+                                      related_name='+', db_index=False)
+    # to currency exchange rate
+    to_currency = models.ForeignKey(Currency, on_delete=models.PROTECT,
+                                    related_name='+')
 
-    # from code exchange rate
-    from_code = models.CharField(max_length=255, null=False)
-    # to code exchange rate
-    to_code = models.CharField(max_length=255, null=False)
+    # codes come from the per process currency map instead of a query
+    @property
+    def from_code(self):
+        return currency_index.get_code(self.from_currency_id)
+
+    @property
+    def to_code(self):
+        return currency_index.get_code(self.to_currency_id)
 
     def __str__(self):
         return "{} - {}".format(self.from_code, self.to_code)
@@ -22,10 +47,63 @@ class ExchangeRates(models.Model):
 class DailyExchangeRates(models.Model):
     class Meta:
         unique_together = ("date", "exchange_rate")
+        indexes = [
+            # most recent rates of a pair first, serves every
+            # order_by('-date') and as-of lookup with one index probe
+            models.Index(fields=['exchange_rate', '-date', ],
+                         name='daily_rate_pair_date_idx'),
+        ]
 
     # rate
     rate = models.FloatField()
     # date the daily exchange rate
     date = models.DateField()
     # foreign key to model ExchangeRates
-    exchange_rate = models.ForeignKey(ExchangeRates, on_delete=models.CASCADE)
+    # indexed by daily_rate_pair_date_idx
+    exchange_rate = models.ForeignKey(ExchangeRates, on_delete=models.CASCADE,
+                                      db_index=False)
+
+
+class DailyRateSummary(models.Model):
+    """
+    Statistics of the last 7, 30 and 90 daily exchange rates of a pair
+    up to and including date, kept in sync by exchange_rate.summaries
+    """
+    WINDOWS = (7, 30, 90)
+
+    class Meta:
+        unique_together = ("exchange_rate", "date")
+
+    # foreign key to model ExchangeRates
+    exchange_rate = models.ForeignKey(ExchangeRates, on_delete=models.CASCADE,
+                                      db_index=False)
+    # date of the daily exchange rate the windows end at
+    date = models.DateField()
+    # rate of that daily exchange rate
+    rate = models.FloatField()
+    # number of daily exchange rates in each window, lower than the
+    # window at the start of the history
+    count_7 = models.IntegerField()
+    count_30 = models.IntegerField()
+    count_90 = models.IntegerField()
+    min_7 = models.FloatField()
+    min_30 = models.FloatField()
+    min_90 = models.FloatField()
+    max_7 = models.FloatField()
+    max_30 = models.FloatField()
+    max_90 = models.FloatField()
+    average_7 = models.FloatField()
+    average_30 = models.FloatField()
+    average_90 = models.FloatField()
+    # population variance
+    variance_7 = models.FloatField()
+    variance_30 = models.FloatField()
+    variance_90 = models.FloatField()
+
+    def get_statistics(self, window):
+        return {'total': getattr(self, 'count_{}'.format(window)),
+                'min': getattr(self, 'min_{}'.format(window)),
+                'max': getattr(self, 'max_{}'.format(window)),
+                'average': getattr(self, 'average_{}'.format(window)),
+                'variance': getattr(self, 'variance_{}'.format(window)),
+                'latest_rate': self.rate}
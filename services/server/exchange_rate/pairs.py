@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .cache import bump_versions, get_versions, read_consistently
+from .currencies import currency_index, normalize_code
+from .models import ExchangeRates
+
+VERSION_NAME = 'pairs'
+
+
+class PairIndex:
+    """
+    Per process LRU map of (from_code, to_code) to exchange rate id.
+
+    Entries, unknown pairs included, are dropped whenever the shared
+    'pairs' version in the cache moves, see invalidate_pairs. Codes are
+    turned into currency ids first, unknown currencies need no query.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, from_code, to_code):
+        """
+        Return the id of the exchange rate or None if it doesn't exist
+        """
+        pair = self.get_pair(from_code, to_code)
+        return None if pair is None else pair[0]
+
+    def get_pair(self, from_code, to_code):
+        """
+        Return (id, from_currency_id, to_currency_id) of the exchange
+        rate or None if it doesn't exist
+        """
+        key = (from_code, to_code)
+        version = get_versions([VERSION_NAME])[0]
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            elif key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        ids = currency_index.load()[0]
+        from_currency_id = ids.get(normalize_code(from_code))
+        to_currency_id = ids.get(normalize_code(to_code))
+        pair = None
+        if from_currency_id is not None and to_currency_id is not None:
+            with read_consistently():
+                pk = ExchangeRates.objects.filter(
+                    from_currency_id=from_currency_id,
+                    to_currency_id=to_currency_id
+                ).values_list('id', flat=True).first()
+            if pk is not None:
+                pair = (pk, from_currency_id, to_currency_id)
+
+        self.store(version, {key: pair})
+        return pair
+
+    def get_many(self, keys):
+        """
+        Map every (from_code, to_code) in keys to the id of its exchange
+        rate or None if it doesn't exist, with a single query for the
+        pairs not in the index
+        """
+        version = get_versions([VERSION_NAME])[0]
+        pairs = {}
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    pairs[key] = self.entries[key]
+
+        ids = currency_index.load()[0]
+        missing = {}
+        for key in set(keys) - set(pairs):
+            pairs[key] = None
+            currencies = (ids.get(normalize_code(key[0])),
+                          ids.get(normalize_code(key[1])))
+            if None not in currencies:
+                missing.setdefault(currencies, []).append(key)
+        if missing:
+            # the product of the currencies holds every missing pair,
+            # and stays a flat condition however many they are
+            with read_consistently():
+                rows = ExchangeRates.objects.filter(
+                    from_currency_id__in={pair[0] for pair in missing},
+                    to_currency_id__in={pair[1] for pair in missing}
+                ).values_list('id', 'from_currency_id', 'to_currency_id')
+                for pk, from_currency_id, to_currency_id in rows:
+                    for key in missing.get(
+                            (from_currency_id, to_currency_id), ()):
+                        pairs[key] = (pk, from_currency_id, to_currency_id)
+        self.store(version, pairs)
+        return {key: None if pair is None else pair[0]
+                for key, pair in pairs.items()}
+
+    def store(self, version, pairs):
+        with self.lock:
+            if version == self.version:
+                for key, pair in pairs.items():
+                    self.entries[key] = pair
+                    self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+
+pair_index = PairIndex(
+    getattr(settings, 'EXCHANGE_RATE_PAIR_INDEX_SIZE', 10000))
+
+
+def invalidate_pairs():
+    bump_versions([VERSION_NAME])
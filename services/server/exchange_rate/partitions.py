@@ -0,0 +1,242 @@
+import datetime
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ExchangeRates, DailyExchangeRates
+
+# periods of the partitions this process knows to exist
+known_partitions = set()
+# whether the table is partitioned, looked up once per process
+state = {'partitioned': None}
+# bounds of a range partition as pg_get_expr prints them
+PARTITION_BOUND = re.compile(
+    r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+def get_interval():
+    return getattr(settings, 'EXCHANGE_RATE_PARTITION_INTERVAL', 'year')
+
+
+def get_table():
+    return DailyExchangeRates._meta.db_table
+
+
+def get_period(date, interval=None):
+    """
+    Return the first day of the partition holding date
+    """
+    if (interval or get_interval()) == 'month':
+        return datetime.date(date.year, date.month, 1)
+    return datetime.date(date.year, 1, 1)
+
+
+def get_next_period(period, interval=None):
+    if (interval or get_interval()) == 'month':
+        if period.month == 12:
+            return datetime.date(period.year + 1, 1, 1)
+        return datetime.date(period.year, period.month + 1, 1)
+    return datetime.date(period.year + 1, 1, 1)
+
+
+def get_partition_name(period, interval=None):
+    if (interval or get_interval()) == 'month':
+        return '{}_y{:04d}m{:02d}'.format(
+            get_table(), period.year, period.month)
+    return '{}_y{:04d}'.format(get_table(), period.year)
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    if state['partitioned'] is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_partitioned_table p '
+                'JOIN pg_class c ON c.oid = p.partrelid '
+                'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+                [get_table()])
+            state['partitioned'] = cursor.fetchone() is not None
+    return state['partitioned']
+
+
+def get_archive_name(cursor, name):
+    """
+    Return the first of name_archive, name_archive_2... not taken
+    """
+    candidate = '{}_archive'.format(name)
+    number = 1
+    while True:
+        cursor.execute('SELECT to_regclass(%s)', [candidate])
+        if cursor.fetchone()[0] is None:
+            return candidate
+        number += 1
+        candidate = '{}_archive_{}'.format(name, number)
+
+
+def archive_table(cursor, name):
+    """
+    Rename the standalone table name out of the way of the partition
+    of the same period, return its new name
+    """
+    archive_name = get_archive_name(cursor, name)
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(
+        connection.ops.quote_name(name),
+        connection.ops.quote_name(archive_name)))
+    return archive_name
+
+
+def create_partition(cursor, period):
+    """
+    Create the partition of period unless attached already. A table of
+    the same name that isn't a partition, e.g. one detached before
+    archive tables were renamed, is renamed first, IF NOT EXISTS would
+    skip the partition because of it
+    """
+    quote_name = connection.ops.quote_name
+    name = get_partition_name(period)
+    cursor.execute('SELECT relispartition FROM pg_class '
+                   'WHERE oid = to_regclass(%s)', [name])
+    row = cursor.fetchone()
+    if row is not None and not row[0]:
+        archive_table(cursor, name)
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS {} PARTITION OF {} '
+        'FOR VALUES FROM (%s) TO (%s)'.format(
+            quote_name(name), quote_name(get_table())),
+        [period, get_next_period(period)])
+
+
+def ensure_partitions(dates):
+    """
+    Create the missing partitions of dates, does nothing unless the
+    table is partitioned. Partitions created or seen once are
+    remembered, so the common case costs no query
+    """
+    periods = {get_period(date) for date in dates} - known_partitions
+    if not periods or not is_partitioned():
+        return
+    with connection.cursor() as cursor:
+        for period in sorted(periods):
+            create_partition(cursor, period)
+    known_partitions.update(periods)
+
+
+def get_partitions():
+    """
+    Return the (name, start, end) of the attached range partitions,
+    oldest first, end excluded
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+            'FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent '
+            'WHERE p.relname = %s AND pg_table_is_visible(p.oid)',
+            [get_table()])
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND.search(bound or '')
+        # a DEFAULT or MINVALUE/MAXVALUE partition has no dates to compare
+        if match is not None:
+            start, end = (datetime.datetime.strptime(value, '%Y-%m-%d').date()
+                          for value in match.groups())
+            partitions.append((name, start, end))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def convert_to_partitioned(ahead):
+    """
+    Rebuild DailyExchangeRates as a table partitioned by range of date,
+    with partitions from its oldest rate up to ahead periods from today.
+    The primary key becomes (id, date) as PostgreSQL requires the
+    partition key in every unique constraint
+    """
+    table = get_table()
+    quote_name = connection.ops.quote_name
+    old_table = '{}_unpartitioned'.format(table)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s), MIN(date) '
+                       'FROM {}'.format(quote_name(table)), [table, 'id'])
+        sequence, oldest = cursor.fetchone()
+
+        cursor.execute('ALTER TABLE {} RENAME TO {}'.format(
+            quote_name(table), quote_name(old_table)))
+        cursor.execute('ALTER INDEX IF EXISTS daily_rate_pair_date_idx '
+                       'RENAME TO daily_rate_pair_date_idx_unpartitioned')
+        cursor.execute(
+            'CREATE TABLE {table} ('
+            'id integer NOT NULL DEFAULT nextval(%s::regclass), '
+            'rate double precision NOT NULL, '
+            'date date NOT NULL, '
+            'exchange_rate_id integer NOT NULL REFERENCES {pairs} (id) '
+            'DEFERRABLE INITIALLY DEFERRED, '
+            'CONSTRAINT {pk} PRIMARY KEY (id, date), '
+            'CONSTRAINT {unique} UNIQUE (date, exchange_rate_id)'
+            ') PARTITION BY RANGE (date)'.format(
+                table=quote_name(table),
+                pairs=quote_name(ExchangeRates._meta.db_table),
+                pk=quote_name('{}_id_date_pk'.format(table)),
+                unique=quote_name('{}_date_exchange_rate_id_uniq'.format(
+                    table))),
+            [sequence])
+        cursor.execute('CREATE INDEX daily_rate_pair_date_idx '
+                       'ON {} (exchange_rate_id, date DESC)'.format(
+                           quote_name(table)))
+
+        known_partitions.clear()
+        create_future_partitions(cursor, ahead, oldest)
+        cursor.execute(
+            'INSERT INTO {} (id, rate, date, exchange_rate_id) '
+            'SELECT id, rate, date, exchange_rate_id FROM {}'.format(
+                quote_name(table), quote_name(old_table)))
+        cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(
+            sequence, quote_name(table)))
+        cursor.execute('DROP TABLE {}'.format(quote_name(old_table)))
+    state['partitioned'] = True
+
+
+def create_future_partitions(cursor, ahead, oldest=None):
+    """
+    Create the partitions from oldest (or today) to ahead periods after
+    today, return the names of the ones created
+    """
+    today = datetime.date.today()
+    period = get_period(oldest or today)
+    last = get_period(today)
+    for _ in range(ahead):
+        last = get_next_period(last)
+
+    names = []
+    while period <= last:
+        create_partition(cursor, period)
+        known_partitions.add(period)
+        names.append(get_partition_name(period))
+        period = get_next_period(period)
+    return names
+
+
+def detach_partitions_before(date, drop=False):
+    """
+    Detach the partitions holding only rates older than date, going by
+    their bounds. They are dropped if drop is set, otherwise kept as
+    standalone tables renamed to <name>_archive, so the partition of
+    their period can be created again. Return the names they had
+    """
+    quote_name = connection.ops.quote_name
+    detached = [name for name, _, end in get_partitions() if end <= date]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name in detached:
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(
+                quote_name(get_table()), quote_name(name)))
+            if drop:
+                cursor.execute('DROP TABLE {}'.format(quote_name(name)))
+            else:
+                archive_table(cursor, name)
+    known_partitions.clear()
+    return detached
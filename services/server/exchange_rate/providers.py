@@ -0,0 +1,208 @@
+"""
+Daily exchange rates pulled from a provider feed.
+
+manage.py fetch_rates asks the configured provider for the rate of every
+pair on a date that has none stored yet. Requests run on a thread pool
+sharing one HTTP session, so connections to the provider are kept alive
+and reused, while the rows are written from the calling thread in
+batches through upsert_daily_exchange_rates.
+
+A provider is any class with a fetch(session, from_code, to_code, date)
+method returning the rate, configured like the channel layer:
+
+    EXCHANGE_RATE_PROVIDER = {
+        'BACKEND': 'exchange_rate.providers.JSONProvider',
+        'OPTIONS': {'url': 'https://.../{from_code}/{to_code}/{date}'},
+    }
+
+It raises RateLimited when the provider asks to slow down, every worker
+then waits until the provider allows requests again, and ProviderError
+for failures worth retrying.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .ingest import upsert_daily_exchange_rates
+from .models import DailyExchangeRates
+
+
+class ProviderError(Exception):
+    """
+    Failure of a provider request that may succeed when retried
+    """
+
+
+class RateLimited(ProviderError):
+
+    def __init__(self, retry_after=None):
+        super().__init__('rate limited')
+        self.retry_after = retry_after
+
+
+class JSONProvider:
+    """
+    One GET per pair and date on url, formatted with from_code, to_code
+    and date (YYYY-MM-DD), answering a JSON object with the rate in
+    rate_field
+    """
+
+    def __init__(self, url, rate_field='rate', headers=None, timeout=10):
+        self.url = url
+        self.rate_field = rate_field
+        self.headers = headers or {}
+        self.timeout = timeout
+
+    def get_retry_after(self, response):
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            # absent or an HTTP date, left to the fetcher backoff
+            return None
+
+    def fetch(self, session, from_code, to_code, date):
+        url = self.url.format(from_code=from_code, to_code=to_code,
+                              date=date.isoformat())
+        try:
+            response = session.get(url, headers=self.headers,
+                                   timeout=self.timeout)
+        except requests.RequestException as exc:
+            raise ProviderError(exc)
+        if response.status_code == 429:
+            raise RateLimited(self.get_retry_after(response))
+        if response.status_code >= 500:
+            raise ProviderError('{} from {}'.format(
+                response.status_code, url))
+        response.raise_for_status()
+        return float(response.json()[self.rate_field])
+
+
+def get_provider(url=None):
+    """
+    Return the EXCHANGE_RATE_PROVIDER, or a JSONProvider of url
+    """
+    if url:
+        return JSONProvider(url)
+    config = getattr(settings, 'EXCHANGE_RATE_PROVIDER', None) or {}
+    if not config.get('BACKEND'):
+        return None
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def get_missing_pairs(pairs, date):
+    """
+    Return the (exchange_rate_id, from_code, to_code) of pairs without a
+    daily exchange rate on date
+    """
+    existing = set(DailyExchangeRates.objects.filter(
+        date=date, exchange_rate_id__in=[pair[0] for pair in pairs]
+    ).values_list('exchange_rate_id', flat=True))
+    return [pair for pair in pairs if pair[0] not in existing]
+
+
+class RateFetcher:
+    """
+    Fetch the rates of many pairs concurrently from provider.
+
+    Failed requests are retried with exponential backoff and jitter, a
+    rate limited one pauses every worker for the Retry-After the
+    provider sent, or the backoff when it sent none.
+    """
+
+    def __init__(self, provider, workers=16, retries=3, backoff=0.5,
+                 max_backoff=60):
+        self.provider = provider
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.resume_at = 0
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers,
+                              pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_delay(self, attempt):
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def pause(self, delay):
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + delay)
+
+    def wait(self):
+        while True:
+            delay = self.resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def fetch(self, from_code, to_code, date):
+        attempt = 0
+        while True:
+            self.wait()
+            try:
+                return self.provider.fetch(self.session, from_code, to_code,
+                                           date)
+            except RateLimited as exc:
+                delay = exc.retry_after
+                if delay is None:
+                    delay = self.get_delay(attempt)
+                self.pause(min(delay, self.max_backoff))
+                if attempt >= self.retries:
+                    raise
+            except ProviderError:
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.get_delay(attempt))
+            attempt += 1
+
+    def fetch_all(self, pairs, date):
+        """
+        Yield (exchange_rate_id, from_code, to_code, rate, error) for
+        every (exchange_rate_id, from_code, to_code) in pairs, in
+        completion order, rate is None when the pair failed with error
+        """
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = {
+                executor.submit(self.fetch, from_code, to_code, date): (
+                    exchange_rate_id, from_code, to_code)
+                for exchange_rate_id, from_code, to_code in pairs}
+            for future in as_completed(futures):
+                error = future.exception()
+                rate = None if error is not None else future.result()
+                yield futures[future] + (rate, error)
+
+    def run(self, pairs, date, batch_size=100):
+        """
+        Fetch pairs and write their rates on date in batches of
+        batch_size. Return the number of rows written and the
+        (from_code, to_code, error) of the failed pairs
+        """
+        written = 0
+        failed = []
+        batch = []
+        for exchange_rate_id, from_code, to_code, rate, error in (
+                self.fetch_all(pairs, date)):
+            if error is not None:
+                failed.append((from_code, to_code, error))
+                continue
+            batch.append((exchange_rate_id, rate, date))
+            if len(batch) >= batch_size:
+                written += upsert_daily_exchange_rates(batch)
+                batch = []
+        if batch:
+            written += upsert_daily_exchange_rates(batch)
+        return written, failed
+
+    def close(self):
+        self.session.close()
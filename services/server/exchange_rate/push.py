@@ -0,0 +1,266 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+NOTIFY_CHANNEL = 'daily_exchange_rates'
+# postgres refuses NOTIFY payloads from 8000 bytes on
+NOTIFY_PAYLOAD_SIZE = 7000
+# seconds between reconnections of a listener, doubled up to the max
+LISTEN_RETRY_DELAY = 1
+LISTEN_RETRY_MAX_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+
+def get_group_name(exchange_rate_id):
+    return 'daily-exchange-rates:{}'.format(exchange_rate_id)
+
+
+class Subscription:
+    """
+    Messages published to any of a set of groups, in publish order.
+
+    A subscriber that falls capacity messages behind loses the newest
+    ones instead of holding up the publisher.
+    """
+
+    def __init__(self, layer, groups, capacity):
+        self.layer = layer
+        self.groups = set(groups)
+        self.messages = queue.Queue(capacity)
+
+    def put(self, message):
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            pass
+
+    def get(self, timeout=None):
+        """
+        Return the next message or None after timeout seconds
+        """
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.layer.unsubscribe(self)
+
+
+class InMemoryChannelLayer:
+    """
+    Fan out of messages to the subscriptions of this process only, for
+    the tests and single process servers.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, groups):
+        subscription = Subscription(self, groups, self.capacity)
+        with self.lock:
+            for group in subscription.groups:
+                self.groups.setdefault(group, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for group in subscription.groups:
+                subscriptions = self.groups.get(group, set())
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    self.groups.pop(group, None)
+
+    def dispatch(self, messages):
+        for message in messages:
+            with self.lock:
+                subscriptions = list(self.groups.get(message['group'], ()))
+            for subscription in subscriptions:
+                subscription.put(message)
+
+    def publish(self, messages):
+        self.dispatch(messages)
+
+
+class PostgresChannelLayer(InMemoryChannelLayer):
+    """
+    Fan out across every server process with postgres LISTEN/NOTIFY.
+
+    Messages are published with pg_notify and each process delivers the
+    notifications to its own subscriptions from a listener thread, which
+    holds a dedicated connection and starts with the first subscription.
+    The connection options override the ones of the default database,
+    e.g. to bypass a pooler in transaction mode.
+    """
+
+    def __init__(self, capacity=100, channel=NOTIFY_CHANNEL, timeout=5,
+                 connection=None):
+        super().__init__(capacity)
+        self.channel = channel
+        self.timeout = timeout
+        self.connection_params = connection or {}
+        self.listener = None
+
+    def subscribe(self, groups):
+        with self.lock:
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self.listen,
+                                                 daemon=True)
+                self.listener.start()
+        return super().subscribe(groups)
+
+    def get_connection(self):
+        import psycopg2
+
+        params = connection.get_connection_params()
+        params.update((key, value)
+                      for key, value in self.connection_params.items()
+                      if value)
+        listen_connection = psycopg2.connect(**params)
+        listen_connection.autocommit = True
+        return listen_connection
+
+    def listen_once(self, on_listen):
+        """
+        Dispatch the notifications of one connection until it fails
+        """
+        listen_connection = self.get_connection()
+        try:
+            with listen_connection.cursor() as cursor:
+                cursor.execute('LISTEN {}'.format(self.channel))
+            on_listen()
+            while True:
+                select.select([listen_connection], [], [], self.timeout)
+                listen_connection.poll()
+                while listen_connection.notifies:
+                    notify = listen_connection.notifies.pop(0)
+                    self.dispatch(json.loads(notify.payload))
+        finally:
+            listen_connection.close()
+
+    def listen(self):
+        """
+        Listen for the life of the process, reconnecting after the
+        connection fails. Notifications sent while reconnecting are lost
+        """
+        delay = LISTEN_RETRY_DELAY
+
+        def reset_delay():
+            nonlocal delay
+            delay = LISTEN_RETRY_DELAY
+
+        while True:
+            try:
+                self.listen_once(reset_delay)
+            except Exception:
+                logger.exception('Listening to %s failed, reconnecting '
+                                 'in %ss', self.channel, delay)
+            time.sleep(delay)
+            delay = min(delay * 2, LISTEN_RETRY_MAX_DELAY)
+
+    def publish(self, messages):
+        payloads = []
+        payload = []
+        size = 0
+        for message in messages:
+            message_size = len(json.dumps(message)) + 2
+            if payload and size + message_size > NOTIFY_PAYLOAD_SIZE:
+                payloads.append(payload)
+                payload = []
+                size = 0
+            payload.append(message)
+            size += message_size
+        if payload:
+            payloads.append(payload)
+
+        with connection.cursor() as cursor:
+            for payload in payloads:
+                cursor.execute('SELECT pg_notify(%s, %s)',
+                               [self.channel, json.dumps(payload)])
+
+
+class StreamSlots:
+    """
+    Streams this process serves at once. Each holds a server thread
+    until it ends, so they're kept to a share of the threads
+    """
+
+    def __init__(self):
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        limit = getattr(settings, 'EXCHANGE_RATE_STREAM_SLOTS', 4)
+        with self.lock:
+            if self.used >= limit:
+                return False
+            self.used += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.used -= 1
+
+
+stream_slots = StreamSlots()
+
+
+class EventStream:
+    """
+    Response content of a stream, the server closes it once the client
+    is gone or the stream ended, which releases the subscription and
+    the slot, even when it was never iterated
+    """
+
+    def __init__(self, content, subscription):
+        self.content = content
+        self.subscription = subscription
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self):
+        if self.subscription is None:
+            return
+        self.content.close()
+        self.subscription.close()
+        self.subscription = None
+        stream_slots.release()
+
+
+channel_layer = None
+
+
+def get_channel_layer():
+    global channel_layer
+    if channel_layer is None:
+        config = getattr(settings, 'EXCHANGE_RATE_CHANNEL_LAYER', {})
+        backend = config.get('BACKEND',
+                             'exchange_rate.push.InMemoryChannelLayer')
+        channel_layer = import_string(backend)(**config.get('OPTIONS', {}))
+    return channel_layer
+
+
+def publish_daily_exchange_rates(rows):
+    """
+    Publish (exchange_rate_id, rate, date) rows to the subscribers of
+    their pair once the current transaction commits
+    """
+    messages = [{'group': get_group_name(exchange_rate_id),
+                 'exchange_rate': exchange_rate_id,
+                 'rate': float(rate),
+                 'date': str(date)}
+                for exchange_rate_id, rate, date in rows]
+    if messages:
+        transaction.on_commit(
+            lambda: get_channel_layer().publish(messages))
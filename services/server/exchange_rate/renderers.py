@@ -0,0 +1,109 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Echo:
+    """
+    File-like object that hands back what is written, lets csv.writer
+    produce one line at a time for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same compact output with orjson, several
+    times faster on large responses. Pretty printing, non compact
+    settings or a missing orjson fall back to the stock renderer.
+    """
+
+    def default(self, obj):
+        return self.encoder_class().default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        if data is None:
+            return bytes()
+
+        # dates go through the encoder, orjson formats datetimes apart
+        ret = orjson.dumps(data, default=self.default,
+                           option=orjson.OPT_PASSTHROUGH_DATETIME
+                           | orjson.OPT_NON_STR_KEYS)
+        # escaped like JSONRenderer does, for JSON embedded in javascript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace(
+            '\u2029'.encode(), b'\\u2029')
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Renderer that can also turn an iterator of rows into an iterator of
+    encoded lines, so large results never sit in memory as a whole.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = [data]
+        fields = list(data[0].keys()) if data else []
+        rows = ([item.get(field) for field in fields] for item in data)
+        return b''.join(self.render_rows(fields, rows))
+
+    def render_rows(self, fields, rows):
+        raise NotImplementedError(
+            'StreamingRenderer.render_rows() must be implemented.')
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render_rows(self, fields, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields).encode(self.charset)
+        for row in rows:
+            yield writer.writerow(row).encode(self.charset)
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render_rows(self, fields, rows):
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            line = encoder.encode(dict(zip(fields, row))) + '\n'
+            yield line.encode(self.charset)
+
+
+class EventStreamRenderer(StreamingRenderer):
+    """
+    Server-Sent Events, every row is a message event and a None row a
+    comment that keeps an idle connection open.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render_rows(self, fields, rows):
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            if row is None:
+                yield b': keep-alive\n\n'
+                continue
+            data = encoder.encode(dict(zip(fields, row)))
+            yield 'data: {}\n\n'.format(data).encode(self.charset)
@@ -1,14 +1,99 @@
 from rest_framework import serializers
-from .models import ExchangeRates, DailyExchangeRates
+from .currencies import currency_index, normalize_code, register_currency
+from .models import Currency, ExchangeRates, DailyExchangeRates
+
+
+class CurrencyCodeField(serializers.CharField):
+    """
+    Currency foreign key read and written as its code, through the per
+    process currency map. An unknown code gives an unsaved currency
+    without id, registered when the exchange rate is saved
+    """
+    code_max_length = Currency._meta.get_field('code').max_length
+
+    def get_attribute(self, instance):
+        return getattr(instance, '{}_id'.format(self.source))
+
+    def to_internal_value(self, data):
+        code = normalize_code(super().to_internal_value(data))
+        if len(code) > self.code_max_length:
+            self.fail('max_length', max_length=self.code_max_length)
+        return Currency(id=currency_index.get_id(code), code=code)
+
+    def to_representation(self, value):
+        return currency_index.get_code(value)
 
 
 class ExchangeRatesSerializer(serializers.ModelSerializer):
+    from_code = CurrencyCodeField(source='from_currency')
+    to_code = CurrencyCodeField(source='to_currency')
+
     class Meta:
         model = ExchangeRates
         fields = ("id", "from_code", "to_code")
 
+    def register_currencies(self, validated_data):
+        for currency in validated_data.values():
+            if isinstance(currency, Currency) and currency.id is None:
+                currency.id = register_currency(currency.code)
+
+    def create(self, validated_data):
+        self.register_currencies(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self.register_currencies(validated_data)
+        return super().update(instance, validated_data)
+
 
 class DailyExchangeRatesSerializer(serializers.ModelSerializer):
     class Meta:
         model = DailyExchangeRates
         fields = ("id", "exchange_rate", "rate", "date")
+
+
+def get_exchange_rates_values(queryset):
+    """
+    ExchangeRatesSerializer fields as a values() queryset, currencies as
+    ids, see get_exchange_rates_data
+    """
+    return queryset.values('id', 'from_currency_id', 'to_currency_id')
+
+
+def get_exchange_rates_data(values):
+    """
+    Same output as ExchangeRatesSerializer from get_exchange_rates_values
+    dicts, codes are looked up in the per process currency map
+    """
+    codes = currency_index.load()[1]
+    return [{'id': value['id'],
+             'from_code': codes.get(value['from_currency_id']),
+             'to_code': codes.get(value['to_currency_id'])}
+            for value in values]
+
+
+def get_daily_exchange_rates_data(queryset):
+    """
+    Same output as DailyExchangeRatesSerializer(queryset, many=True),
+    built from value tuples without instantiating models or fields
+    """
+    return [{'id': pk,
+             'exchange_rate': exchange_rate_id,
+             'rate': rate,
+             'date': date.isoformat()}
+            for pk, exchange_rate_id, rate, date in queryset.values_list(
+                *DailyExchangeRatesSerializer.Meta.fields)]
+
+
+class BulkDailyExchangeRatesSerializer(serializers.Serializer):
+    from_code = serializers.CharField(max_length=255)
+    to_code = serializers.CharField(max_length=255)
+    rate = serializers.FloatField()
+    date = serializers.DateField()
+
+
+class QuoteSerializer(serializers.Serializer):
+    from_code = serializers.CharField(max_length=255)
+    to_code = serializers.CharField(max_length=255)
+    amount = serializers.FloatField()
+    date = serializers.DateField(required=False)
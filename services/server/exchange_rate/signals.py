@@ -0,0 +1,58 @@
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, router
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate_exchange_rates
+from .conversion import invalidate_latest_rates
+from .currencies import invalidate_currencies, seed_currencies
+from .models import Currency, ExchangeRates, DailyExchangeRates
+from .pairs import invalidate_pairs
+from .partitions import ensure_partitions
+from .push import publish_daily_exchange_rates
+from .summaries import refresh_summaries
+
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+def invalidate_currency(sender, instance, **kwargs):
+    invalidate_currencies()
+
+
+def create_currencies(sender, using=DEFAULT_DB_ALIAS, apps=global_apps,
+                      **kwargs):
+    """
+    post_migrate receiver of this app, creating the ISO 4217 currencies
+    """
+    try:
+        Currency = apps.get_model('exchange_rate', 'Currency')
+    except LookupError:
+        return
+    if router.allow_migrate_model(using, Currency):
+        seed_currencies(Currency, using)
+        invalidate_currencies()
+
+
+@receiver(post_save, sender=ExchangeRates)
+@receiver(post_delete, sender=ExchangeRates)
+def invalidate_exchange_rate(sender, instance, **kwargs):
+    invalidate_exchange_rates([instance.pk])
+    invalidate_pairs()
+
+
+# DailyExchangeRates post_delete is left out on purpose, a receiver
+# would stop Django from fast deleting the rows of a deleted pair, which
+# is already invalidated by the ExchangeRates receiver above
+@receiver(post_save, sender=DailyExchangeRates)
+def invalidate_daily_exchange_rate(sender, instance, **kwargs):
+    refresh_summaries(instance.exchange_rate_id, [instance.date])
+    invalidate_exchange_rates([instance.exchange_rate_id])
+    invalidate_latest_rates({instance.exchange_rate_id: [instance.date]})
+    publish_daily_exchange_rates(
+        [(instance.exchange_rate_id, instance.rate, instance.date)])
+
+
+@receiver(pre_save, sender=DailyExchangeRates)
+def create_daily_exchange_rate_partition(sender, instance, **kwargs):
+    ensure_partitions([DailyExchangeRates._meta.get_field(
+        'date').to_python(instance.date)])
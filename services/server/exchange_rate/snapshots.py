@@ -0,0 +1,260 @@
+"""
+Latest rate of every pair in a memory-mapped file.
+
+manage.py build_rate_snapshot writes the latest daily exchange rate of
+every pair and the statistics of the daily list over the week before
+the snapshot date as a currency-code index followed by a float64
+matrix, indexed by [from currency][to currency][field]. Every worker
+maps the same file, so they share one copy in the page cache and read
+rates without copying or querying the database. A new snapshot is
+written aside and renamed over the old one, workers map it on their
+next check.
+
+A snapshot is fresh while the 'list' version of the cache, bumped by
+every write, is still the one it was built at. Workers only see the
+version of the builder through a cache shared between processes, with
+the per process default cache they always fall back to the database.
+"""
+
+import datetime
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+
+from .cache import get_versions
+from .currencies import currency_index, normalize_code
+from .models import ExchangeRates, DailyExchangeRates
+from .summaries import annotate_week_statistics, get_week_statistics
+
+MAGIC = b'XRSNAP\x00\x01'
+# magic, data version, created, date ordinal, codes, codes blob size
+HEADER = struct.Struct('<8sqdiII')
+FIELDS = ('id', 'rate', 'date', 'week_total', 'week_average', 'week_rate')
+ID, RATE, DATE, WEEK_TOTAL, WEEK_AVERAGE, WEEK_RATE = range(len(FIELDS))
+NAN = float('nan')
+# bumped on every daily exchange rate or pair change, see cache.py
+VERSION_NAME = 'list'
+
+
+def get_snapshot_path():
+    return getattr(settings, 'EXCHANGE_RATE_SNAPSHOT_PATH', None)
+
+
+def get_pairs(date):
+    """
+    Return (id, from_code, to_code, rate, date, week_total, week_average,
+    week_rate) of every exchange rate in a single query, the statistics
+    of the week before date are the ones of the daily list, read from
+    the summaries, see annotate_week_statistics
+    """
+    last_week_date = date - datetime.timedelta(days=7)
+    latest = DailyExchangeRates.objects.filter(
+        exchange_rate=OuterRef('pk')).order_by('-date')
+    codes = currency_index.load()[1]
+    pairs = []
+    for (pk, from_currency_id, to_currency_id, rate, rate_date, week_date,
+         week_total, week_average, week_rate) in annotate_week_statistics(
+            ExchangeRates.objects.annotate(
+                rate=Subquery(latest.values('rate')[:1]),
+                rate_date=Subquery(latest.values('date')[:1])),
+            last_week_date, date).values_list(
+                'id', 'from_currency_id', 'to_currency_id', 'rate',
+                'rate_date', 'latest_date', 'total', 'average',
+                'latest_rate'):
+        if week_date is None:
+            week_total = 0
+        elif week_total is None:
+            # summaries missing, e.g. of rates written before they existed
+            week_total, week_average = get_week_statistics(pk, week_date)
+        pairs.append((pk, codes.get(from_currency_id),
+                      codes.get(to_currency_id), rate, rate_date,
+                      week_total, week_average, week_rate))
+    return pairs
+
+
+def to_ordinal(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    return value.toordinal()
+
+
+def build_snapshot(path, date=None):
+    """
+    Write the snapshot of date (default today) to path, atomically
+    replacing the previous one. Return the number of pairs written
+    """
+    date = date or datetime.date.today()
+    # read before the data, a write in between makes the snapshot stale
+    version = get_versions([VERSION_NAME])[0]
+    pairs = get_pairs(date)
+
+    codes = sorted({code for _, from_code, to_code, *_ in pairs
+                    for code in (from_code, to_code)})
+    index = {code: position for position, code in enumerate(codes)}
+    size = len(codes)
+    matrix = [NAN] * (size * size * len(FIELDS))
+    for pk, from_code, to_code, *values in pairs:
+        offset = (index[from_code] * size + index[to_code]) * len(FIELDS)
+        rate, rate_date, week_total, week_average, week_rate = values
+        for field, value in ((ID, pk), (RATE, rate),
+                             (DATE, to_ordinal(rate_date)),
+                             (WEEK_TOTAL, week_total),
+                             (WEEK_AVERAGE, week_average),
+                             (WEEK_RATE, week_rate)):
+            if value is not None:
+                matrix[offset + field] = value
+
+    blob = '\n'.join(codes).encode()
+    padding = -(HEADER.size + len(blob)) % 8
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(dir=directory,
+                                             prefix='.rate-snapshot-')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(HEADER.pack(MAGIC, version, time.time(),
+                                     date.toordinal(), size, len(blob)))
+            output.write(blob + b'\0' * padding)
+            output.write(struct.pack('<{}d'.format(len(matrix)), *matrix))
+            output.flush()
+            os.fsync(output.fileno())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return len(pairs)
+
+
+class RateSnapshot:
+    """
+    Read only view of a snapshot file, floats are read straight from the
+    mapped pages
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot:
+            self.stat = os.fstat(snapshot.fileno())
+            self.map = mmap.mmap(snapshot.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        (magic, self.version, self.created, date, size,
+         blob_size) = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError('{} is not a rate snapshot'.format(path))
+        self.date = datetime.date.fromordinal(date)
+        start = HEADER.size
+        self.codes = self.map[start:start + blob_size].decode().split('\n')
+        if not blob_size:
+            self.codes = []
+        self.index = {code: position
+                      for position, code in enumerate(self.codes)}
+        self.size = size
+        start += blob_size + (-(start + blob_size) % 8)
+        self.matrix = memoryview(self.map)[start:].cast('d')
+
+    def is_same_file(self, stat):
+        return (stat.st_ino, stat.st_mtime_ns) == (self.stat.st_ino,
+                                                   self.stat.st_mtime_ns)
+
+    def get_offset(self, from_code, to_code):
+        try:
+            return (self.index[normalize_code(from_code)] * self.size
+                    + self.index[normalize_code(to_code)]) * len(FIELDS)
+        except KeyError:
+            return None
+
+    def read(self, offset):
+        """
+        Return the fields at offset as a dict, None for missing values,
+        or None when no pair is stored there
+        """
+        values = self.matrix[offset:offset + len(FIELDS)]
+        if math.isnan(values[ID]):
+            return None
+        data = {field: None if math.isnan(value) else value
+                for field, value in zip(FIELDS, values)}
+        data['id'] = int(data['id'])
+        data['week_total'] = int(data['week_total'] or 0)
+        if data['date'] is not None:
+            data['date'] = datetime.date.fromordinal(int(data['date']))
+        return data
+
+    def get(self, from_code, to_code):
+        offset = self.get_offset(from_code, to_code)
+        return None if offset is None else self.read(offset)
+
+    def pairs(self):
+        """
+        Yield (from_code, to_code, fields) of every stored pair
+        """
+        for from_index, from_code in enumerate(self.codes):
+            for to_index, to_code in enumerate(self.codes):
+                data = self.read(
+                    (from_index * self.size + to_index) * len(FIELDS))
+                if data is not None:
+                    yield from_code, to_code, data
+
+
+class SnapshotStore:
+    """
+    Per process handle on the current snapshot file, looked up again at
+    most every check_interval seconds
+    """
+
+    def __init__(self, check_interval=1):
+        self.check_interval = check_interval
+        self.snapshot = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def load(self, path):
+        now = time.monotonic()
+        if (self.checked_at is not None
+                and now - self.checked_at < self.check_interval):
+            return self.snapshot
+        with self.lock:
+            self.checked_at = now
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.snapshot = None
+                return None
+            if self.snapshot is None or not self.snapshot.is_same_file(stat):
+                try:
+                    # the previous map is unmapped once no reader holds it
+                    self.snapshot = RateSnapshot(path)
+                except (OSError, ValueError, struct.error):
+                    self.snapshot = None
+            return self.snapshot
+
+    def get(self, date=None):
+        """
+        Return the snapshot when one is configured and fresh, and of date
+        if given, otherwise None
+        """
+        path = get_snapshot_path()
+        if not path:
+            return None
+        snapshot = self.load(path)
+        if snapshot is None or (date is not None and snapshot.date != date):
+            return None
+        if snapshot.version != get_versions([VERSION_NAME])[0]:
+            return None
+        return snapshot
+
+    def clear(self):
+        with self.lock:
+            self.snapshot = None
+            self.checked_at = None
+
+
+snapshot_store = SnapshotStore(
+    getattr(settings, 'EXCHANGE_RATE_SNAPSHOT_CHECK_INTERVAL', 1))
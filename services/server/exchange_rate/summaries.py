@@ -0,0 +1,137 @@
+from collections import deque
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import DailyExchangeRates, DailyRateSummary
+
+MAX_WINDOW = max(DailyRateSummary.WINDOWS)
+BATCH_SIZE = 500
+WEEK_WINDOW = 7
+
+
+def get_window_statistics(rates):
+    count = len(rates)
+    average = sum(rates) / count
+    return {'count': count,
+            'min': min(rates),
+            'max': max(rates),
+            'average': average,
+            'variance': sum((rate - average) ** 2 for rate in rates) / count}
+
+
+def build_summary(exchange_rate_id, history):
+    """
+    Summary of the last item of history, a sequence of the (date, rate)
+    preceding it in date order, at most MAX_WINDOW long
+    """
+    date, rate = history[-1]
+    rates = [rate for _, rate in history]
+    fields = {}
+    for window in DailyRateSummary.WINDOWS:
+        statistics = get_window_statistics(rates[-window:])
+        for name, value in statistics.items():
+            fields['{}_{}'.format(name, window)] = value
+    return DailyRateSummary(exchange_rate_id=exchange_rate_id, date=date,
+                            rate=rate, **fields)
+
+
+def refresh_summaries(exchange_rate_id, dates):
+    """
+    Update the summaries affected by daily exchange rates written on
+    dates: the ones of those dates and of the next MAX_WINDOW - 1 daily
+    exchange rates. Appending the most recent rate only reads the
+    MAX_WINDOW - 1 rates before it and writes a single summary
+    """
+    date_field = DailyExchangeRates._meta.get_field('date')
+    dates = sorted({date_field.to_python(date) for date in dates})
+    if not dates:
+        return
+    start, end = dates[0], dates[-1]
+
+    rows = DailyExchangeRates.objects.filter(
+        exchange_rate_id=exchange_rate_id).values_list('date', 'rate')
+    before = list(rows.filter(date__lt=start).order_by('-date')[
+        :MAX_WINDOW - 1])
+    before.reverse()
+    history = before + list(
+        rows.filter(date__gte=start, date__lte=end).order_by('date'))
+    history.extend(
+        rows.filter(date__gt=end).order_by('date')[:MAX_WINDOW - 1])
+
+    summaries = [
+        build_summary(exchange_rate_id,
+                      history[max(0, index - MAX_WINDOW + 1):index + 1])
+        for index in range(len(before), len(history))]
+
+    last = end
+    if len(history) > len(before):
+        last = max(end, history[-1][0])
+    with transaction.atomic():
+        DailyRateSummary.objects.filter(
+            exchange_rate_id=exchange_rate_id,
+            date__gte=start, date__lte=last).delete()
+        DailyRateSummary.objects.bulk_create(summaries, batch_size=BATCH_SIZE)
+
+
+def rebuild_summaries(exchange_rate_id):
+    """
+    Recompute every summary of an exchange rate in one pass over its
+    daily exchange rates, holding at most BATCH_SIZE summaries in memory
+    """
+    rows = DailyExchangeRates.objects.filter(
+        exchange_rate_id=exchange_rate_id
+    ).order_by('date').values_list('date', 'rate').iterator(
+        chunk_size=BATCH_SIZE)
+
+    with transaction.atomic():
+        DailyRateSummary.objects.filter(
+            exchange_rate_id=exchange_rate_id).delete()
+        history = deque(maxlen=MAX_WINDOW)
+        summaries = []
+        count = 0
+        for row in rows:
+            history.append(row)
+            summaries.append(build_summary(exchange_rate_id, list(history)))
+            if len(summaries) == BATCH_SIZE:
+                DailyRateSummary.objects.bulk_create(summaries)
+                count += len(summaries)
+                summaries = []
+        DailyRateSummary.objects.bulk_create(summaries)
+    return count + len(summaries)
+
+
+def annotate_week_statistics(exchange_rates, start, end):
+    """
+    Annotate exchange_rates with the date and rate of their latest daily
+    exchange rate between start and end (latest_date, latest_rate), and
+    the number and average of the WEEK_WINDOW daily exchange rates up to
+    it (total, average) read from its summary. All are None without a
+    rate in the range, total and average when the summary is missing
+    """
+    latest = DailyExchangeRates.objects.filter(
+        exchange_rate=OuterRef('pk'),
+        date__range=[start, end]).order_by('-date')
+    summary = DailyRateSummary.objects.filter(
+        exchange_rate=OuterRef('pk'), date=OuterRef('latest_date'))
+    return exchange_rates.annotate(
+        latest_date=Subquery(latest.values('date')[:1]),
+        latest_rate=Subquery(latest.values('rate')[:1]),
+    ).annotate(
+        total=Subquery(summary.values(
+            'count_{}'.format(WEEK_WINDOW))[:1]),
+        average=Subquery(summary.values(
+            'average_{}'.format(WEEK_WINDOW))[:1]),
+    )
+
+
+def get_week_statistics(exchange_rate_id, date):
+    """
+    Return the (total, average) annotate_week_statistics reads from the
+    summary of the daily exchange rate of date, computed from the daily
+    exchange rates when the summary is missing
+    """
+    rates = list(DailyExchangeRates.objects.filter(
+        exchange_rate_id=exchange_rate_id, date__lte=date
+    ).order_by('-date').values_list('rate', flat=True)[:WEEK_WINDOW])
+    return len(rates), sum(rates) / len(rates)
@@ -1,21 +1,90 @@
+import datetime
+import io
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import mock
+from urllib.parse import urlencode, urlsplit
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APITestCase, APIClient
+from django.utils.http import http_date, parse_http_date
+from rest_framework.test import (
+    APIClient,
+    APITestCase,
+    APITransactionTestCase
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import status
-from .models import ExchangeRates, DailyExchangeRates
+from .cache import (
+    POSITION_KEY,
+    bump_versions,
+    get_cache,
+    get_pair_version_name,
+    get_version_key,
+    stats
+)
+from .conversion import rate_graph
+from .currencies import ISO_4217, currency_index, register_currency
+from .history import AS_OF_BATCH_SIZE
+from .ingest import upsert_daily_exchange_rates
+from .models import (
+    Currency,
+    ExchangeRates,
+    DailyExchangeRates,
+    DailyRateSummary
+)
+from .pairs import PairIndex, invalidate_pairs
+from .push import (
+    EventStream,
+    PostgresChannelLayer,
+    get_channel_layer,
+    stream_slots
+)
+from .renderers import FastJSONRenderer
+from .partitions import (
+    detach_partitions_before,
+    ensure_partitions,
+    get_next_period,
+    get_partition_name,
+    get_period
+)
 from .serializers import ExchangeRatesSerializer, DailyExchangeRatesSerializer
+from .snapshots import build_snapshot, snapshot_store
+from .summaries import build_summary, rebuild_summaries
+from .views import MAX_QUOTE_ITEMS, DailyExchangeRatesDetail
+from server.asgi import get_asgi_application
+from server.db.pool import ConnectionPool, PoolTimeout
+from server.metrics import registry
+from server.profiling import sampler
+from server.replicas import PIN_COOKIE, ReplicaSelector, replayed
 
 # Create your tests here.
 
 
-class BaseViewTest(APITestCase):
+class ViewTestMixin:
     client = APIClient()
 
     @staticmethod
     def create_exchange_rate(from_code="", to_code=""):
         assert from_code != ""
         assert to_code != ""
-        return ExchangeRates.objects.create(from_code=from_code,
-                                            to_code=to_code)
+        return ExchangeRates.objects.create(
+            from_currency_id=register_currency(from_code),
+            to_currency_id=register_currency(to_code))
 
     @staticmethod
     def create_daily_exchange_rate(exchange_rate_id, rate, date):
@@ -26,6 +95,9 @@ class BaseViewTest(APITestCase):
             exchange_rate=exchange_rate_id, rate=rate, date=date)
 
     def setUp(self):
+        # ids are reused between tests, start from an empty cache
+        get_cache().clear()
+
         # add test data
         exchange_rate_1 = self.create_exchange_rate("GBP", "USD")
         exchange_rate_2 = self.create_exchange_rate("USD", "GBP")
@@ -56,6 +128,10 @@ class BaseViewTest(APITestCase):
         return len(data)
 
 
+class BaseViewTest(ViewTestMixin, APITestCase):
+    pass
+
+
 class GetAllExchangeRatesTest(BaseViewTest):
 
     def test_get_all_exchange_rates(self):
@@ -69,7 +145,29 @@ class GetAllExchangeRatesTest(BaseViewTest):
         )
         # fetch the data from db
         serialized = self.get_list_or_detail_serialized_data_from_db()
-        self.assertEqual(response.data, serialized.data)
+        self.assertEqual(response.data["results"], serialized.data)
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_exchange_rates_with_cursor(self):
+        """
+        This test ensures that we can walk every exchange rates page by
+        page with a constant number of queries when make a GET request
+        to the exchange_rates/ endpoint with query param page_size
+        """
+
+        url = reverse("exchange-rate:index", kwargs={"version": "v1"})
+        data = {"page_size": 3}
+        results = []
+        while url is not None:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, data=data)
+            results.extend(response.data["results"])
+            url = response.data["next"]
+            data = None
+
+        serialized = self.get_list_or_detail_serialized_data_from_db()
+        self.assertEqual(results, serialized.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
@@ -326,6 +424,397 @@ class CreateDailyExchangeRate(BaseViewTest):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class BulkCreateDailyExchangeRate(BaseViewTest):
+
+    def api_call(self, data, content_type="application/json"):
+        return self.client.post(
+            reverse("exchange-rate:daily-bulk",
+                    kwargs={"version": "v1"}),
+            data=data,
+            content_type=content_type
+        )
+
+    def test_bulk_create_daily_exchange_rate_success(self):
+        """
+        This test ensures that we can create and update many daily
+        exchange rate when make a POST request with a JSON array to
+        daily-exchange-rates/bulk endpoint
+        """
+
+        data = [{"from_code": "JPY", "to_code": "IDR",
+                 "rate": 100, "date": "2018-07-03"},
+                {"from_code": "GBP", "to_code": "USD",
+                 "rate": 2, "date": "2018-07-08"},
+                {"from_code": "JPY", "to_code": "IDR",
+                 "rate": 101, "date": "2018-07-04"}]
+
+        # 4 queries for the upsert, 7 per pair to refresh its summaries
+        # and 1 for the latest dates of the pairs
+        with self.assertNumQueries(19):
+            response = self.api_call(json.dumps(data))
+
+        self.assertEqual(response.data, {"upserted": 3, "errors": []})
+        self.assertEqual(DailyExchangeRates.objects.count(), 12)
+        self.assertEqual(DailyExchangeRates.objects.get(
+            exchange_rate__from_currency__code="GBP",
+            exchange_rate__to_currency__code="USD",
+            date="2018-07-08").rate, 2.0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_create_daily_exchange_rate_with_ndjson(self):
+        """
+        This test ensures that we can create many daily exchange rate
+        when make a POST request with NDJSON to daily-exchange-rates/bulk
+        endpoint
+        """
+
+        data = "\n".join([
+            json.dumps({"from_code": "JPY", "to_code": "IDR",
+                        "rate": 100, "date": "2018-07-03"}),
+            "",
+            json.dumps({"from_code": "USD", "to_code": "IDR",
+                        "rate": 14000, "date": "2018-07-03"}),
+        ])
+
+        response = self.api_call(data, "application/x-ndjson")
+        self.assertEqual(response.data, {"upserted": 2, "errors": []})
+        self.assertEqual(DailyExchangeRates.objects.count(), 12)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_create_daily_exchange_rate_with_invalid_rows(self):
+        """
+        This test ensures that invalid rows are reported without
+        aborting the batch when make a POST request to
+        daily-exchange-rates/bulk endpoint
+        """
+
+        data = [{"from_code": "RZL", "to_code": "LZR",
+                 "rate": 100, "date": "2018-07-03"},
+                {"from_code": "JPY", "to_code": "IDR",
+                 "rate": 100, "date": "2018-07-03"},
+                {"from_code": "JPY", "to_code": "IDR", "date": "2018-07-04"}]
+
+        response = self.api_call(json.dumps(data))
+        self.assertEqual(response.data["upserted"], 1)
+        self.assertEqual(
+            [error["index"] for error in response.data["errors"]], [0, 2])
+        self.assertIn("exchange_rate", response.data["errors"][0]["errors"])
+        self.assertIn("rate", response.data["errors"][1]["errors"])
+        self.assertEqual(DailyExchangeRates.objects.count(), 11)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_create_failed_with_invalid_data(self):
+        """
+        This test ensures that we can't create daily exchange rate
+        when make a POST request to daily-exchange-rates/bulk endpoint
+        with a body that isn't a list and return 400
+        """
+
+        response = self.api_call(json.dumps({"from_code": "JPY"}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.api_call("{", "application/x-ndjson")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportRatesCommandTest(BaseViewTest):
+
+    def import_rates(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix) as file:
+            file.write(content)
+            file.flush()
+            out = io.StringIO()
+            call_command("import_rates", file.name, *args, stdout=out,
+                         stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_import_rates_from_csv(self):
+        """
+        This test ensures that import_rates command imports a CSV file
+        in chunks, updating existing rates and skipping invalid rows
+        """
+
+        out = self.import_rates(
+            "from_code,to_code,rate,date\n"
+            "JPY,IDR,100,2018-07-03\n"
+            "JPY,IDR,101,2018-07-04\n"
+            "GBP,USD,2,2018-07-08\n"
+            "RZL,LZR,1,2018-07-08\n"
+            "JPY,IDR,abc,2018-07-05\n",
+            ".csv", "--chunk-size", "2")
+
+        self.assertIn("Read 5 rows, 1 invalid, 3 written", out)
+        self.assertIn("rows/sec", out)
+        self.assertEqual(DailyExchangeRates.objects.count(), 12)
+        self.assertEqual(DailyExchangeRates.objects.get(
+            exchange_rate__from_currency__code="GBP",
+            exchange_rate__to_currency__code="USD",
+            date="2018-07-08").rate, 2.0)
+
+    def test_import_rates_summarizes_once(self):
+        """
+        This test ensures that import_rates command rebuilds the summaries
+        of every pair it wrote to once, after all of its chunks
+        """
+
+        rebuild = mock.Mock(wraps=rebuild_summaries)
+        with mock.patch("exchange_rate.management.commands.import_rates."
+                        "rebuild_summaries", rebuild):
+            out = self.import_rates(
+                "from_code,to_code,rate,date\n"
+                "JPY,IDR,101,2018-07-04\n"
+                "GBP,USD,2,2018-07-08\n"
+                "JPY,IDR,100,2018-07-03\n",
+                ".csv", "--chunk-size", "1")
+
+        self.assertIn("Summarized 2 pairs", out)
+        self.assertEqual(rebuild.call_count, 2)
+        summary = DailyRateSummary.objects.get(
+            exchange_rate__from_currency__code="JPY",
+            exchange_rate__to_currency__code="IDR", date="2018-07-04")
+        self.assertEqual((summary.rate, summary.count_7), (101, 3))
+
+    def test_import_rates_from_ndjson(self):
+        """
+        This test ensures that import_rates command imports a NDJSON file
+        """
+
+        out = self.import_rates(
+            json.dumps({"from_code": "USD", "to_code": "IDR",
+                        "rate": 14000, "date": "2018-07-03"}) + "\n"
+            "{not json\n",
+            ".ndjson")
+
+        self.assertIn("Read 2 rows, 1 invalid, 1 written", out)
+        self.assertEqual(DailyExchangeRates.objects.count(), 11)
+
+    def test_import_rates_failed_with_unknown_format(self):
+        """
+        This test ensures that import_rates command refuses files it
+        can't guess the format of
+        """
+
+        with self.assertRaises(CommandError):
+            self.import_rates("", ".txt")
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        from_code, to_code, date = self.path.strip("/").split("/")
+        server = self.server
+        with server.lock:
+            server.requests.append((from_code, to_code, date))
+            responses = server.responses.get((from_code, to_code), [])
+            status_code = responses.pop(0) if responses else 200
+        self.send_response(status_code)
+        if status_code == 429:
+            self.send_header("Retry-After", "0")
+        body = json.dumps({"rate": len(from_code + to_code)}).encode()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubProviderServer(ThreadingMixIn, HTTPServer):
+    """
+    Provider feed answering /<from_code>/<to_code>/<date> with the
+    statuses queued in responses for the pair, then 200
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubProviderHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.responses = {}
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/{{from_code}}/{{to_code}}/{{date}}".format(
+            self.server_address[1])
+
+
+class FetchRatesCommandTest(BaseViewTest):
+
+    def setUp(self):
+        super().setUp()
+        self.provider = StubProviderServer()
+        thread = threading.Thread(target=self.provider.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.addCleanup(self.provider.server_close)
+        self.addCleanup(self.provider.shutdown)
+
+    def fetch_rates(self, *args):
+        out = io.StringIO()
+        err = io.StringIO()
+        call_command("fetch_rates", "--url", self.provider.url,
+                     "--date", "2018-07-08", "--backoff", "0.01", *args,
+                     stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_fetch_rates_skips_stored_rates(self):
+        """
+        This test ensures that fetch_rates command fetches the rate of
+        every pair without one on the date and writes them in batches
+        """
+
+        out, _ = self.fetch_rates("--batch-size", "2")
+
+        self.assertIn("Fetched 4 pairs on 2018-07-08, 1 already stored, "
+                      "3 written, 0 failed", out)
+        self.assertEqual(sorted(self.provider.requests), [
+            ("JPY", "IDR", "2018-07-08"),
+            ("USD", "GBP", "2018-07-08"),
+            ("USD", "IDR", "2018-07-08")])
+        self.assertEqual(DailyExchangeRates.objects.filter(
+            date="2018-07-08").count(), 4)
+        self.assertEqual(DailyExchangeRates.objects.get(
+            exchange_rate__from_currency__code="USD",
+            exchange_rate__to_currency__code="IDR",
+            date="2018-07-08").rate, 6.0)
+
+        out, _ = self.fetch_rates()
+        self.assertIn("4 already stored, 0 written", out)
+        self.assertEqual(len(self.provider.requests), 3)
+
+    def test_fetch_rates_retries_failed_requests(self):
+        """
+        This test ensures that fetch_rates command retries rate limited
+        and failed requests and reports the pairs that keep failing
+        """
+
+        self.provider.responses = {("USD", "IDR"): [429, 429],
+                                   ("JPY", "IDR"): [503],
+                                   ("USD", "GBP"): [404]}
+
+        out, err = self.fetch_rates("USD/IDR", "JPY/IDR", "USD/GBP")
+
+        self.assertIn("2 written, 1 failed", out)
+        self.assertIn("USD/GBP: 404", err)
+        self.assertEqual(len(self.provider.requests), 6)
+        self.assertFalse(DailyExchangeRates.objects.filter(
+            exchange_rate__from_currency__code="USD",
+            exchange_rate__to_currency__code="GBP",
+            date="2018-07-08").exists())
+
+    def test_fetch_rates_failed_with_unknown_pair(self):
+        """
+        This test ensures that fetch_rates command refuses unknown pairs
+        and runs only with a provider
+        """
+
+        with self.assertRaises(CommandError):
+            self.fetch_rates("RZL/LZR")
+        with self.assertRaises(CommandError):
+            call_command("fetch_rates", stdout=io.StringIO())
+
+    def test_fetch_rates_interval_needs_shared_cache(self):
+        """
+        This test ensures that fetch_rates and build_rate_snapshot
+        commands refuse to keep running with a cache the server processes
+        don't share, and only warn for a single run
+        """
+
+        with self.assertRaisesMessage(CommandError, "CACHE_BACKEND"):
+            self.fetch_rates("--interval", "60")
+        with self.assertRaisesMessage(CommandError, "CACHE_BACKEND"):
+            call_command("build_rate_snapshot", "--path", "snapshot",
+                         "--interval", "5", stdout=io.StringIO())
+
+        _, err = self.fetch_rates()
+        self.assertIn("CACHE_BACKEND", err)
+
+    def test_fetch_rates_interval_survives_failures(self):
+        """
+        This test ensures that fetch_rates command logs a failed run and
+        fetches again on the next interval
+        """
+
+        fetch = mock.Mock(side_effect=[DatabaseError("gone"), None,
+                                       KeyboardInterrupt])
+        with mock.patch("exchange_rate.management.commands.fetch_rates."
+                        "is_process_local", return_value=False), \
+                mock.patch("exchange_rate.management.commands.fetch_rates."
+                           "Command.fetch", fetch), \
+                mock.patch("time.sleep"), \
+                self.assertLogs("exchange_rate.management.commands."
+                                "fetch_rates", "ERROR") as logs, \
+                self.assertRaises(KeyboardInterrupt):
+            self.fetch_rates("--interval", "60")
+
+        self.assertEqual(fetch.call_count, 3)
+        self.assertEqual(len(logs.records), 1)
+
+
+class ExportDailyExchangeRate(BaseViewTest):
+
+    def api_call(self, data, export_format="csv"):
+        data = dict(data, format=export_format)
+        return self.client.get(
+            reverse("exchange-rate:daily-export",
+                    kwargs={"version": "v1"}),
+            data=data,
+        )
+
+    def get_content(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_daily_exchange_rate_as_csv(self):
+        """
+        This test ensures that we can stream daily exchange rate as CSV
+        when make a GET request to daily-exchange-rates/export endpoint
+        with query param from_code, to_code and date range
+        """
+
+        response = self.api_call({"from_code": "GBP", "to_code": "USD",
+                                  "start_date": "2018-07-03",
+                                  "end_date": "2018-07-04"})
+
+        self.assertEqual(self.get_content(response).splitlines(), [
+            "from_code,to_code,rate,date",
+            "GBP,USD,1.0,2018-07-03",
+            "GBP,USD,1.0,2018-07-04",
+        ])
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_export_daily_exchange_rate_as_ndjson(self):
+        """
+        This test ensures that we can stream all daily exchange rate as
+        NDJSON when make a GET request to daily-exchange-rates/export
+        endpoint without filter
+        """
+
+        response = self.api_call({}, "ndjson")
+        lines = self.get_content(response).splitlines()
+
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(json.loads(lines[0]), {
+            "from_code": "GBP", "to_code": "USD",
+            "rate": 1.0, "date": "2018-07-02"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_export_failed_with_invalid_data(self):
+        """
+        This test ensures that we can't export daily exchange rate with
+        unknown pair or invalid date when make a GET request to
+        daily-exchange-rates/export endpoint
+        """
+
+        response = self.api_call({"from_code": "GBP", "to_code": "LZR"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.api_call({"start_date": "2018-13-01"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class RetrieveDailyExchangeRate(BaseViewTest):
     def api_call(self, from_code, to_code):
         return self.client.get(
@@ -344,7 +833,7 @@ class RetrieveDailyExchangeRate(BaseViewTest):
         # hit the API endpoint
         response = self.api_call(from_code="GBP", to_code="USD")
         exchange_rate = ExchangeRates.objects.get(
-            from_code="GBP", to_code="USD")
+            from_currency__code="GBP", to_currency__code="USD")
         expected = DailyExchangeRates.objects.filter(
             exchange_rate=exchange_rate)
         serialized = DailyExchangeRatesSerializer(expected, many=True)
@@ -353,6 +842,66 @@ class RetrieveDailyExchangeRate(BaseViewTest):
         self.assertEqual(response.data["daily_exchange_rate"], serialized.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_retrieve_daily_exchange_rate_with_window(self):
+        """
+        This test ensures that we can retrieve statistics over a custom
+        window when make a GET request to daily-exchange-rates/ endpoint
+        with query param window and limit
+        """
+
+        exchange_rate = ExchangeRates.objects.get(
+            from_currency__code="USD", to_currency__code="IDR")
+        for day, rate in enumerate([2, 4, 4, 4, 5, 5, 7, 9], start=3):
+            self.create_daily_exchange_rate(
+                exchange_rate, rate, "2018-07-{:02d}".format(day))
+
+        response = self.client.get(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "USD", "to_code": "IDR",
+                  "window": 8, "limit": 2},
+        )
+        self.assertEqual(len(response.data["daily_exchange_rate"]), 2)
+        self.assertEqual(response.data["window"], 8)
+        self.assertEqual(response.data["total"], 8)
+        self.assertEqual(response.data["min"], 2.0)
+        self.assertEqual(response.data["max"], 9.0)
+        self.assertEqual(response.data["range"], 7.0)
+        self.assertEqual(response.data["average"], 5.0)
+        self.assertAlmostEqual(response.data["variance"], 4.0)
+        self.assertAlmostEqual(response.data["stddev"], 2.0)
+        self.assertEqual(response.data["latest_rate"], 9.0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_daily_exchange_rate_with_constant_queries(self):
+        """
+        This test ensures that a wide window doesn't load more rows
+        when make a GET request to daily-exchange-rates/ endpoint
+        """
+
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse("exchange-rate:daily-detail",
+                        kwargs={"version": "v1"}),
+                data={"from_code": "GBP", "to_code": "USD",
+                      "window": 365, "limit": 1},
+            )
+        self.assertEqual(response.data["total"], 7)
+        self.assertEqual(response.data["latest_rate"], 1.0)
+        self.assertEqual(len(response.data["daily_exchange_rate"]), 1)
+
+    def test_retrieve_failed_with_invalid_window(self):
+        """
+        This test ensures that we can't retrieve data when make
+        a GET request to daily-exchange-rates/ endpoint with
+        invalid query param window
+        """
+
+        response = self.client.get(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "GBP", "to_code": "USD", "window": "a"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_retrieve_failed_with_not_found_exchange_rate(self):
         """
         This test ensures that we can't retrieve data when make
@@ -382,11 +931,12 @@ class ListDailyExchangeRates(BaseViewTest):
         """
 
         response = self.api_call({"date": "2018-07-08"})
-        self.assertEqual(response.data[0]["rate"], 1.0)
-        self.assertEqual(response.data[0]["average"], 1.0)
-        self.assertEqual(response.data[1]["rate"], "insufficient data")
-        self.assertEqual(response.data[2]["rate"], "insufficient data")
-        self.assertEqual(response.data[3]["rate"], "insufficient data")
+        results = response.data["results"]
+        self.assertEqual(results[0]["rate"], 1.0)
+        self.assertEqual(results[0]["average"], 1.0)
+        self.assertEqual(results[1]["rate"], "insufficient data")
+        self.assertEqual(results[2]["rate"], "insufficient data")
+        self.assertEqual(results[3]["rate"], "insufficient data")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_get_list_daily_exchange_without_date(self):
@@ -398,8 +948,1698 @@ class ListDailyExchangeRates(BaseViewTest):
         """
 
         response = self.api_call({})
-        self.assertEqual(response.data[0]["rate"], "insufficient data")
-        self.assertEqual(response.data[1]["rate"], "insufficient data")
-        self.assertEqual(response.data[2]["rate"], "insufficient data")
-        self.assertEqual(response.data[3]["rate"], "insufficient data")
+        results = response.data["results"]
+        self.assertEqual(results[0]["rate"], "insufficient data")
+        self.assertEqual(results[1]["rate"], "insufficient data")
+        self.assertEqual(results[2]["rate"], "insufficient data")
+        self.assertEqual(results[3]["rate"], "insufficient data")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_list_daily_exchange_with_constant_queries(self):
+        """
+        This test ensures that daily-exchange-rates/list endpoint
+        run the same number of queries no matter how many exchange
+        rates exist
+        """
+
+        with self.assertNumQueries(1):
+            self.api_call({"date": "2018-07-08"})
+
+        for index in range(50):
+            exchange_rate = self.create_exchange_rate(
+                "A{:02d}".format(index), "IDR")
+            self.create_daily_exchange_rate(exchange_rate, 1, "2018-07-08")
+
+        with self.assertNumQueries(1):
+            response = self.api_call({"date": "2018-07-08"})
+        self.assertEqual(len(response.data["results"]), 54)
+        self.assertEqual(response.data["results"][0]["rate"], 1.0)
+        self.assertEqual(response.data["results"][0]["average"], 1.0)
+        self.assertEqual(response.data["results"][0]["from_code"], "GBP")
+        self.assertEqual(response.data["results"][0]["to_code"], "USD")
+
+    def test_get_list_daily_exchange_from_summaries(self):
+        """
+        This test ensures that daily-exchange-rates/list endpoint reads
+        the statistics of the week from the summaries without grouping
+        the daily rates, and computes them when summaries are missing
+        """
+
+        self.create_daily_exchange_rate(
+            ExchangeRates.objects.get(from_currency__code="GBP",
+                                      to_currency__code="USD"),
+            5, "2018-06-01")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_call({"date": "2018-07-08"})
+        sql = queries.captured_queries[0]["sql"]
+        self.assertIn(DailyRateSummary._meta.db_table, sql)
+        self.assertNotIn(" GROUP BY ", sql)
+        self.assertEqual(response.data["results"][0]["average"], 1.0)
+
+        DailyRateSummary.objects.all().delete()
+        response = self.api_call({"date": "2018-07-08", "page_size": 2})
+        self.assertEqual(response.data["results"][0]["average"], 1.0)
+        self.assertEqual(response.data["results"][0]["rate"], 1.0)
+        self.assertEqual(response.data["results"][1]["rate"],
+                         "insufficient data")
+
+    def test_get_list_daily_exchange_with_cursor(self):
+        """
+        This test ensures that we can page through daily-exchange-rates/list
+        endpoint with query param page_size and cursor
+        """
+
+        response = self.api_call({"date": "2018-07-08", "page_size": 3})
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(response.data["results"][0]["rate"], 1.0)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["from_code"], "JPY")
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CacheDailyExchangeRates(BaseViewTest):
+
+    def detail_call(self, from_code="GBP", to_code="USD"):
+        return self.client.get(
+            reverse("exchange-rate:daily-detail",
+                    kwargs={"version": "v1"}),
+            data={"from_code": from_code, "to_code": to_code},
+        )
+
+    def list_call(self):
+        return self.client.get(
+            reverse("exchange-rate:daily-list",
+                    kwargs={"version": "v1"}),
+            data={"date": "2018-07-08"},
+        )
+
+    def setUp(self):
+        super().setUp()
+        stats.update(hits=0, misses=0)
+
+    def test_cache_hit_ratio(self):
+        """
+        This test ensures that repeated GET requests to daily-exchange-rates
+        endpoints are answered from cache without aggregate queries
+        """
+
+        self.detail_call()
+        self.list_call()
+        for _ in range(4):
+            with self.assertNumQueries(0):
+                response = self.detail_call()
+            with self.assertNumQueries(0):
+                self.list_call()
+
+        self.assertEqual(response.data["average"], 1.0)
+        self.assertEqual(stats, {"hits": 8, "misses": 2})
+
+    def test_cache_hit_round_trips(self):
+        """
+        This test ensures that a cached GET request to daily-exchange-rates/
+        endpoint reads the pairs version, the pair version and the entry
+        from the cache and nothing else
+        """
+
+        self.detail_call()
+        cache = get_cache()
+        # LocMemCache.get_many calls get, count it as one round trip
+        get_many = mock.Mock(side_effect=lambda keys: {
+            key: value for key, value in (
+                (key, LocMemCache.get(cache, key)) for key in keys)
+            if value is not None})
+        with mock.patch.object(cache, "get", wraps=cache.get) as get, \
+                mock.patch.object(cache, "get_many", get_many), \
+                self.assertNumQueries(0):
+            self.assertEqual(self.detail_call().data["average"], 1.0)
+        self.assertEqual(get.call_count + get_many.call_count, 3)
+
+    def test_cache_keyed_by_pair(self):
+        """
+        This test ensures that pairs whose versions are equal don't share
+        a cached response or an ETag
+        """
+
+        for from_code, to_code in (("GBP", "USD"), ("USD", "GBP")):
+            pk = ExchangeRates.objects.get(
+                from_currency__code=from_code, to_currency__code=to_code).pk
+            get_cache().set(get_version_key(get_pair_version_name(pk)), 1,
+                            None)
+
+        gbp_usd = self.detail_call()
+        usd_gbp = self.detail_call(from_code="USD", to_code="GBP")
+        self.assertEqual(usd_gbp.data["exchange_rate"]["from_code"], "USD")
+        self.assertEqual(len(usd_gbp.data["daily_exchange_rate"]), 1)
+        self.assertNotEqual(usd_gbp["ETag"], gbp_usd["ETag"])
+
+    def test_cache_invalidated_on_create(self):
+        """
+        This test ensures that cached responses aren't stale after a POST
+        request to daily-exchange-rates/ and daily-exchange-rates/bulk
+        """
+
+        self.detail_call("JPY", "IDR")
+        self.list_call()
+        self.client.post(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "JPY", "to_code": "IDR",
+                  "rate": 100, "date": "2018-07-03"},
+            format="json")
+        response = self.detail_call("JPY", "IDR")
+        self.assertEqual(response.data["latest_rate"], 100.0)
+
+        self.client.post(
+            reverse("exchange-rate:daily-bulk", kwargs={"version": "v1"}),
+            data=json.dumps([{"from_code": "GBP", "to_code": "USD",
+                              "rate": 8, "date": "2018-07-08"}]),
+            content_type="application/json")
+        self.assertEqual(self.detail_call().data["latest_rate"], 8.0)
+        self.assertEqual(self.list_call().data["results"][0]["rate"], 8.0)
+        self.assertEqual(stats["hits"], 0)
+
+    def test_cache_invalidated_on_model_change(self):
+        """
+        This test ensures that cached responses aren't stale after rates
+        are saved from the ORM or a pair is updated or deleted
+        """
+
+        self.detail_call()
+        daily_exchange_rate = DailyExchangeRates.objects.get(
+            exchange_rate__from_currency__code="GBP",
+            exchange_rate__to_currency__code="USD",
+            date="2018-07-08")
+        daily_exchange_rate.rate = 3
+        daily_exchange_rate.save()
+        self.assertEqual(self.detail_call().data["latest_rate"], 3.0)
+
+        self.list_call()
+        self.client.put(
+            reverse("exchange-rate:detail",
+                    kwargs={"version": "v1", "pk": 1}),
+            data={"from_code": "DZD", "to_code": "EUR"},
+            format="json")
+        response = self.list_call()
+        self.assertEqual(response.data["results"][0]["from_code"], "DZD")
+
+        self.client.delete(
+            reverse("exchange-rate:detail",
+                    kwargs={"version": "v1", "pk": 1}))
+        self.assertEqual(len(self.list_call().data["results"]), 3)
+        self.assertEqual(stats["hits"], 0)
+
+    def test_cache_invalidated_on_commit(self):
+        """
+        This test ensures that responses cached while a write is not
+        committed yet aren't served once it is
+        """
+
+        connection.run_on_commit = []
+        upsert_daily_exchange_rates([(1, 9, datetime.date(2018, 7, 8))])
+        # a concurrent read before the commit sees the previous rows
+        self.list_call()
+        callbacks = connection.run_on_commit
+        connection.run_on_commit = []
+        for _, callback in callbacks:
+            callback()
+
+        self.list_call()
+        self.assertEqual(stats, {"hits": 0, "misses": 2})
+
+
+class CurrencyTest(BaseViewTest):
+
+    def create_call(self, from_code, to_code):
+        return self.client.post(
+            reverse("exchange-rate:index", kwargs={"version": "v1"}),
+            data={"from_code": from_code, "to_code": to_code},
+            format="json"
+        )
+
+    def test_iso_currencies_are_seeded(self):
+        """
+        This test ensures that ISO 4217 currencies exist after migrate
+        with their numeric code as id
+        """
+
+        self.assertEqual(Currency.objects.get(code="USD").id, 840)
+        self.assertEqual(Currency.objects.get(code="IDR").id, 360)
+        self.assertEqual(Currency.objects.filter(id__lt=1000).count(),
+                         len(ISO_4217))
+
+    def test_create_exchange_rate_normalizes_codes(self):
+        """
+        This test ensures that codes are stored upper case, so a pair
+        in another case is a duplicate, when make a POST request to
+        exchange-rates/ endpoint
+        """
+
+        response = self.create_call("gbp", " usd")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.create_call("eur", "usd")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["from_code"], "EUR")
+        self.assertEqual(response.data["to_code"], "USD")
+
+    def test_create_exchange_rate_registers_currency(self):
+        """
+        This test ensures that a currency outside of ISO 4217 is
+        registered when make a POST or a PUT request with its code to
+        exchange-rates/ endpoint
+        """
+
+        response = self.create_call("GBP", "xyz")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["to_code"], "XYZ")
+        self.assertGreaterEqual(Currency.objects.get(code="XYZ").id, 1000)
+
+        response = self.client.put(
+            reverse("exchange-rate:detail",
+                    kwargs={"version": "v1", "pk": response.data["id"]}),
+            data={"from_code": "ABC", "to_code": "XYZ"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["from_code"], "ABC")
+        self.assertEqual(currency_index.get_code(
+            Currency.objects.get(code="ABC").id), "ABC")
+
+        response = self.create_call("GBP", "X" * 9)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("to_code", response.data)
+
+    def test_lookup_pairs_in_any_case(self):
+        """
+        This test ensures that daily exchange rates of a pair are found
+        whatever the case of its codes
+        """
+
+        response = self.client.get(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "gbp", "to_code": "Usd"})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["exchange_rate"]["from_code"], "GBP")
+        self.assertEqual(response.data["exchange_rate"]["to_code"], "USD")
+
+    def test_currency_index_reload_on_change(self):
+        """
+        This test ensures that the currency index maps codes and ids
+        from memory until a currency is created
+        """
+
+        currency_index.load()
+        with self.assertNumQueries(0):
+            self.assertEqual(currency_index.get_id("usd"), 840)
+            self.assertEqual(currency_index.get_code(826), "GBP")
+            self.assertIsNone(currency_index.get_id("XYZ"))
+
+        pk = register_currency("xyz")
+        with self.assertNumQueries(1):
+            self.assertEqual(currency_index.get_id("XYZ"), pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(currency_index.get_code(pk), "XYZ")
+
+    def test_register_currency_concurrently(self):
+        """
+        This test ensures that register_currency returns the currency a
+        concurrent insert created for the same code, and takes the next
+        id when one for another code got the id first
+        """
+
+        pk = register_currency("XYZ")
+        with mock.patch.object(currency_index, "get_id", return_value=None):
+            self.assertEqual(register_currency("xyz"), pk)
+
+        with mock.patch("exchange_rate.currencies.get_next_custom_id",
+                        side_effect=[pk, pk + 1]):
+            self.assertEqual(register_currency("ABC"), pk + 1)
+        self.assertEqual(Currency.objects.get(code="ABC").id, pk + 1)
+
+    def test_link_pair_currencies(self):
+        """
+        This test ensures that link_pair_currencies command leaves pairs
+        already linked to their currencies alone
+        """
+
+        out = io.StringIO()
+        call_command("link_pair_currencies", stdout=out)
+        self.assertIn("Pairs are linked to their currencies", out.getvalue())
+
+    def test_link_pair_currencies_failed_without_migration(self):
+        """
+        This test ensures that link_pair_currencies command fails when
+        the pairs still have their codes and no migration links them
+        """
+
+        command = "exchange_rate.management.commands.link_pair_currencies"
+        with mock.patch(command + ".get_link_migration",
+                        return_value=(None, [])), \
+                mock.patch(command + ".has_pair_codes", return_value=True), \
+                self.assertRaisesMessage(CommandError, "no migration"):
+            call_command("link_pair_currencies", stdout=io.StringIO())
+
+
+class PairIndexTest(BaseViewTest):
+
+    def test_pair_index_lookup_and_eviction(self):
+        """
+        This test ensures that the pair index answers repeated lookups
+        from memory and evicts the least recently used pair
+        """
+
+        pair_index = PairIndex(max_size=2)
+        with self.assertNumQueries(2):
+            self.assertEqual(pair_index.get("GBP", "USD"), 1)
+            self.assertIsNone(pair_index.get("GBP", "IDR"))
+        with self.assertNumQueries(0):
+            self.assertEqual(pair_index.get("GBP", "USD"), 1)
+            self.assertIsNone(pair_index.get("GBP", "IDR"))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(pair_index.get("USD", "GBP"), 2)
+        self.assertEqual(list(pair_index.entries),
+                         [("GBP", "IDR"), ("USD", "GBP")])
+
+    def test_pair_index_lookup_many(self):
+        """
+        This test ensures that the pair index looks up many pairs with a
+        single query for the ones it doesn't hold yet
+        """
+
+        pair_index = PairIndex(max_size=10)
+        self.assertEqual(pair_index.get("GBP", "USD"), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                pair_index.get_many([("GBP", "USD"), ("USD", "GBP"),
+                                     ("GBP", "IDR"), ("GBP", "LZR")]),
+                {("GBP", "USD"): 1, ("USD", "GBP"): 2,
+                 ("GBP", "IDR"): None, ("GBP", "LZR"): None})
+        with self.assertNumQueries(0):
+            self.assertEqual(pair_index.get("USD", "GBP"), 2)
+            self.assertIsNone(pair_index.get("GBP", "IDR"))
+
+    def test_pair_index_reload_on_version_bump(self):
+        """
+        This test ensures that the pair index doesn't serve stale ids
+        after exchange rates are created, updated or deleted
+        """
+
+        pair_index = PairIndex(max_size=10)
+        self.assertIsNone(pair_index.get("IDR", "USD"))
+        self.client.post(
+            reverse("exchange-rate:index", kwargs={"version": "v1"}),
+            data={"from_code": "IDR", "to_code": "USD"},
+            format="json")
+        self.assertEqual(pair_index.get("IDR", "USD"), 5)
+
+        self.client.delete(
+            reverse("exchange-rate:detail",
+                    kwargs={"version": "v1", "pk": 5}))
+        self.assertIsNone(pair_index.get("IDR", "USD"))
+
+        pair_index.get("GBP", "USD")
+        invalidate_pairs()
+        with self.assertNumQueries(1):
+            pair_index.get("GBP", "USD")
+
+
+class ConditionalDailyExchangeRates(BaseViewTest):
+
+    def api_call(self, name, data, **headers):
+        return self.client.get(
+            reverse("exchange-rate:" + name, kwargs={"version": "v1"}),
+            data=data, **headers)
+
+    def test_detail_not_modified_with_etag(self):
+        """
+        This test ensures that a GET request to daily-exchange-rates/
+        endpoint with a matching If-None-Match returns 304 without
+        running any query, until a new daily exchange rate is created
+        """
+
+        data = {"from_code": "JPY", "to_code": "IDR"}
+        response = self.api_call("daily-detail", data)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("public", response["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            response = self.api_call(
+                "daily-detail", data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        response = self.api_call("daily-detail", {"from_code": "GBP",
+                                                  "to_code": "USD"},
+                                 HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.post(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "JPY", "to_code": "IDR",
+                  "rate": 100, "date": "2018-07-03"},
+            format="json")
+        response = self.api_call(
+            "daily-detail", data, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["latest_rate"], 100.0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_not_modified_with_last_modified(self):
+        """
+        This test ensures that a GET request to daily-exchange-rates/list
+        endpoint with If-Modified-Since after Last-Modified returns 304,
+        and 200 when it is older or in the same second, which a write may
+        share
+        """
+
+        data = {"date": "2018-07-08"}
+        response = self.api_call("daily-list", data)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+        later = http_date(parse_http_date(last_modified) + 1)
+
+        with self.assertNumQueries(0):
+            response = self.api_call(
+                "daily-list", data, HTTP_IF_MODIFIED_SINCE=later)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.api_call(
+            "daily-list", data,
+            HTTP_IF_MODIFIED_SINCE="Mon, 02 Jul 2018 00:00:00 GMT")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.post(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "JPY", "to_code": "IDR",
+                  "rate": 100, "date": "2018-07-08"},
+            format="json")
+        response = self.api_call(
+            "daily-list", data, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class ConvertExchangeRates(BaseViewTest):
+
+    def api_call(self, data):
+        return self.client.get(
+            reverse("exchange-rate:convert", kwargs={"version": "v1"}),
+            data=data,
+        )
+
+    def create_rates(self, rates):
+        self.client.post(
+            reverse("exchange-rate:daily-bulk", kwargs={"version": "v1"}),
+            data=json.dumps([{"from_code": from_code, "to_code": to_code,
+                              "rate": rate, "date": "2018-07-09"}
+                             for from_code, to_code, rate in rates]),
+            content_type="application/json")
+
+    def test_convert_through_base_currency(self):
+        """
+        This test ensures that we can convert between currencies without
+        a stored pair when make a GET request to convert endpoint
+        """
+
+        self.create_rates([("USD", "IDR", 14000), ("JPY", "IDR", 125),
+                           ("USD", "GBP", 0.8)])
+
+        response = self.api_call(
+            {"from_code": "JPY", "to_code": "GBP", "amount": 1000})
+        self.assertEqual(response.data["path"], ["JPY", "IDR", "USD", "GBP"])
+        self.assertAlmostEqual(response.data["rate"], 125 / 14000 * 0.8)
+        self.assertAlmostEqual(response.data["converted"],
+                               1000 * 125 / 14000 * 0.8)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.api_call({"from_code": "USD", "to_code": "IDR"})
+        self.assertEqual(response.data["path"], ["USD", "IDR"])
+        self.assertEqual(response.data["rate"], 14000.0)
+
+    def test_convert_reuses_graph_until_rates_change(self):
+        """
+        This test ensures that conversions don't query the database until
+        a new daily exchange rate arrives
+        """
+
+        self.api_call({"from_code": "JPY", "to_code": "USD"})
+        with self.assertNumQueries(0):
+            response = self.api_call({"from_code": "JPY", "to_code": "USD"})
+        self.assertEqual(response.data["rate"], 1.0)
+
+        self.create_rates([("USD", "IDR", 4), ("JPY", "IDR", 2)])
+        response = self.api_call({"from_code": "JPY", "to_code": "USD"})
+        self.assertEqual(response.data["rate"], 0.5)
+
+        # a backfill before the latest rates leaves the graph as it is
+        self.client.post(
+            reverse("exchange-rate:daily-bulk", kwargs={"version": "v1"}),
+            data=json.dumps([{"from_code": "USD", "to_code": "IDR",
+                              "rate": 8, "date": "2018-06-01"}]),
+            content_type="application/json")
+        with self.assertNumQueries(0):
+            response = self.api_call({"from_code": "JPY", "to_code": "USD"})
+        self.assertEqual(response.data["rate"], 0.5)
+
+    def test_convert_failed_with_unknown_currency(self):
+        """
+        This test ensures that we can't convert to a currency that isn't
+        connected or with an invalid amount
+        """
+
+        response = self.api_call({"from_code": "JPY", "to_code": "LZR"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.api_call({"from_code": "LZR", "to_code": "JPY"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("LZR", rate_graph.paths)
+
+        response = self.api_call(
+            {"from_code": "JPY", "to_code": "USD", "amount": "a"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QuoteExchangeRates(BaseViewTest):
+
+    def api_call(self, data):
+        return self.client.post(
+            reverse("exchange-rate:quotes", kwargs={"version": "v1"}),
+            data=json.dumps(data),
+            content_type="application/json"
+        )
+
+    def test_quote_many_items_with_one_query(self):
+        """
+        This test ensures that we can convert many amounts with a single
+        query when make a POST request to quotes endpoint
+        """
+
+        self.create_daily_exchange_rate(
+            ExchangeRates.objects.get(from_currency__code="GBP",
+                                      to_currency__code="USD"),
+            1.5, "2018-07-09")
+        data = [{"from_code": "GBP", "to_code": "USD", "amount": 10},
+                {"from_code": "GBP", "to_code": "USD", "amount": 2,
+                 "date": "2018-07-03"},
+                {"from_code": "USD", "to_code": "USD", "amount": 3},
+                {"from_code": "USD", "to_code": "IDR", "amount": 4,
+                 "date": "2018-07-05"},
+                {"from_code": "GBP", "to_code": "USD", "amount": 5}] * 100
+
+        # the first lookup of a pair fills the pair index
+        self.api_call(data)
+        with self.assertNumQueries(1):
+            response = self.api_call(data)
+
+        results = response.data["results"]
+        self.assertEqual(len(results), 500)
+        self.assertEqual(results[0]["rate"], 1.5)
+        self.assertEqual(results[0]["converted"], 15.0)
+        self.assertEqual(results[1]["rate"], 1.0)
+        self.assertEqual(results[1]["date"], "2018-07-03")
+        self.assertEqual(results[1]["rate_date"], datetime.date(2018, 7, 3))
+        self.assertEqual(results[2]["converted"], 3.0)
+        self.assertEqual(results[3]["converted"], 4.0)
+        self.assertEqual(results[4]["converted"], 7.5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_quote_at_the_item_limit(self):
+        """
+        This test ensures that quotes endpoint answers the maximum number
+        of items, each on its own date, with a query per batch of them
+        """
+
+        start = datetime.date(2016, 1, 1)
+        data = [{"from_code": "GBP", "to_code": "USD", "amount": 1,
+                 "date": str(start + datetime.timedelta(days=index))}
+                for index in range(MAX_QUOTE_ITEMS)]
+
+        self.api_call(data[:1])
+        with self.assertNumQueries(MAX_QUOTE_ITEMS // AS_OF_BATCH_SIZE):
+            response = self.api_call(data)
+
+        results = response.data["results"]
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(results), MAX_QUOTE_ITEMS)
+        self.assertIn("rate", results[0]["errors"])
+        self.assertEqual(results[-1]["rate"], 1.0)
+        self.assertEqual(results[-1]["rate_date"],
+                         datetime.date(2018, 7, 8))
+
+    def test_quote_with_invalid_items(self):
+        """
+        This test ensures that invalid items and missing rates are
+        reported per item when make a POST request to quotes endpoint
+        """
+
+        response = self.api_call([
+            {"from_code": "GBP", "to_code": "USD", "amount": "a"},
+            {"from_code": "GBP", "to_code": "USD", "amount": 1,
+             "date": "2018-06-01"},
+            {"from_code": "RZL", "to_code": "LZR", "amount": 1},
+            {"from_code": "GBP", "to_code": "USD", "amount": 1},
+        ])
+
+        results = response.data["results"]
+        self.assertIn("amount", results[0]["errors"])
+        self.assertIn("rate", results[1]["errors"])
+        self.assertIn("rate", results[2]["errors"])
+        self.assertEqual(results[3]["rate"], 1.0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.api_call({"from_code": "GBP"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsOfDailyExchangeRates(BaseViewTest):
+
+    def api_call(self, data):
+        return self.client.get(
+            reverse("exchange-rate:daily-as-of", kwargs={"version": "v1"}),
+            data=data,
+        )
+
+    def test_as_of_with_nearest_prior_rate(self):
+        """
+        This test ensures that we get the most recent rate at or before
+        every requested date with one query of the rates of the pair when
+        make a GET request to daily-exchange-rates/as-of endpoint
+        """
+
+        exchange_rate = ExchangeRates.objects.get(
+            from_currency__code="USD", to_currency__code="IDR")
+        self.create_daily_exchange_rate(exchange_rate, 14000, "2018-07-06")
+        self.create_daily_exchange_rate(exchange_rate, 14100, "2018-07-09")
+
+        # the first lookup of a pair fills the pair index
+        self.api_call({"from_code": "USD", "to_code": "IDR",
+                       "date": "2018-07-02"})
+        with self.assertNumQueries(1) as queries:
+            response = self.api_call({
+                "from_code": "USD", "to_code": "IDR",
+                "date": ["2018-07-01", "2018-07-02", "2018-07-08",
+                         "2018-07-09", "2019-01-01"]})
+        # the pair is resolved already, its rates need no join
+        self.assertNotIn(ExchangeRates._meta.db_table + '"',
+                         queries.captured_queries[0]["sql"])
+
+        rates = [(rate["rate_date"], rate["rate"])
+                 for rate in response.data["rates"]]
+        self.assertEqual(rates, [
+            (None, None),
+            (datetime.date(2018, 7, 2), 1.0),
+            (datetime.date(2018, 7, 6), 14000.0),
+            (datetime.date(2018, 7, 9), 14100.0),
+            (datetime.date(2018, 7, 9), 14100.0),
+        ])
+        self.assertEqual(response.data["exchange_rate"]["from_code"], "USD")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_as_of_failed_with_invalid_data(self):
+        """
+        This test ensures that we can't look up rates of an unknown pair
+        or without a valid date
+        """
+
+        response = self.api_call({"from_code": "GBP", "to_code": "LZR",
+                                  "date": "2018-07-02"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.api_call({"from_code": "GBP", "to_code": "USD"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.api_call({"from_code": "GBP", "to_code": "USD",
+                                  "date": "2018-07-32"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DailyRateSummaryTest(BaseViewTest):
+
+    def assert_summaries_match_rates(self, exchange_rate):
+        view = DailyExchangeRatesDetail()
+        for window in DailyRateSummary.WINDOWS:
+            expected = view.get_aggregate_statistics(exchange_rate, window)
+            statistics = view.get_statistics(exchange_rate, window)
+            self.assertEqual(statistics.keys(), expected.keys())
+            for name, value in expected.items():
+                self.assertAlmostEqual(statistics[name], value)
+
+    def test_summaries_follow_inserts_in_any_order(self):
+        """
+        This test ensures that summaries stay equal to statistics
+        computed from the daily exchange rates when rates are appended,
+        backfilled and corrected
+        """
+
+        exchange_rate = ExchangeRates.objects.get(
+            from_currency__code="USD", to_currency__code="IDR")
+        start = datetime.date(2018, 7, 3)
+        for day in list(range(60, 120)) + list(range(0, 60)):
+            self.create_daily_exchange_rate(
+                exchange_rate, 14000 + (day * 37) % 101,
+                start + datetime.timedelta(days=day))
+        self.assert_summaries_match_rates(exchange_rate)
+        self.assertEqual(
+            DailyRateSummary.objects.filter(
+                exchange_rate=exchange_rate).count(), 121)
+
+        self.client.post(
+            reverse("exchange-rate:daily-bulk", kwargs={"version": "v1"}),
+            data=json.dumps([{"from_code": "USD", "to_code": "IDR",
+                              "rate": 15000, "date": "2018-08-01"},
+                             {"from_code": "USD", "to_code": "IDR",
+                              "rate": 13000, "date": "2018-12-01"}]),
+            content_type="application/json")
+        self.assert_summaries_match_rates(exchange_rate)
+
+        summary = DailyRateSummary.objects.get(
+            exchange_rate=exchange_rate, date="2018-08-01")
+        self.assertEqual(summary.rate, 15000.0)
+        self.assertEqual(summary.count_7, 7)
+        self.assertEqual(summary.count_90, 31)
+
+    def test_retrieve_reads_single_summary(self):
+        """
+        This test ensures that a GET request to daily-exchange-rates/
+        endpoint with a summarized window reads statistics from one
+        summary row
+        """
+
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse("exchange-rate:daily-detail",
+                        kwargs={"version": "v1"}),
+                data={"from_code": "GBP", "to_code": "USD", "window": 30})
+        self.assertEqual(response.data["total"], 7)
+        self.assertEqual(response.data["average"], 1.0)
+        self.assertEqual(response.data["variance"], 0.0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rebuild_rate_summaries(self):
+        """
+        This test ensures that rebuild_rate_summaries command recreates
+        lost summaries
+        """
+
+        DailyRateSummary.objects.all().delete()
+        out = io.StringIO()
+        call_command("rebuild_rate_summaries", "GBP/USD", stdout=out)
+        self.assertIn("Rebuilt 7 summaries", out.getvalue())
+        self.assert_summaries_match_rates(
+            ExchangeRates.objects.get(from_currency__code="GBP",
+                                      to_currency__code="USD"))
+
+        call_command("rebuild_rate_summaries", stdout=out)
+        self.assertEqual(DailyRateSummary.objects.count(), 10)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rate_summaries", "RZL/LZR", stdout=out)
+
+    def test_statistics_without_summaries(self):
+        """
+        This test ensures that daily-exchange-rates/ endpoint computes
+        the statistics of pairs whose summaries are missing or behind,
+        and that rebuild_rate_summaries --missing only rebuilds those
+        """
+
+        exchange_rate = ExchangeRates.objects.get(from_currency__code="GBP",
+                                                  to_currency__code="USD")
+        DailyRateSummary.objects.filter(exchange_rate=exchange_rate,
+                                        date="2018-07-08").delete()
+        self.assert_summaries_match_rates(exchange_rate)
+        DailyRateSummary.objects.all().delete()
+        self.assert_summaries_match_rates(exchange_rate)
+        response = self.client.get(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "GBP", "to_code": "USD", "window": 7})
+        self.assertEqual(response.data["total"], 7)
+        self.assertEqual(response.data["average"], 1.0)
+
+        DailyRateSummary.objects.bulk_create([
+            build_summary(pk, [(datetime.date(2018, 7, 2), 1.0)])
+            for pk in ExchangeRates.objects.exclude(
+                id=exchange_rate.id).values_list("id", flat=True)])
+        out = io.StringIO()
+        call_command("rebuild_rate_summaries", "--missing", stdout=out)
+        self.assertIn("Rebuilt 7 summaries", out.getvalue())
+        self.assertEqual(DailyRateSummary.objects.count(), 10)
+
+
+class PartitionTest(BaseViewTest):
+
+    def test_partition_periods(self):
+        """
+        This test ensures that yearly and monthly partitions cover
+        consecutive date ranges with sortable names
+        """
+
+        date = datetime.date(2018, 12, 14)
+        self.assertEqual(get_period(date, "year"), datetime.date(2018, 1, 1))
+        self.assertEqual(get_next_period(get_period(date, "year"), "year"),
+                         datetime.date(2019, 1, 1))
+        self.assertEqual(get_period(date, "month"),
+                         datetime.date(2018, 12, 1))
+        self.assertEqual(get_next_period(get_period(date, "month"), "month"),
+                         datetime.date(2019, 1, 1))
+        self.assertEqual(
+            get_partition_name(datetime.date(2018, 1, 1), "year"),
+            "exchange_rate_dailyexchangerates_y2018")
+        self.assertEqual(
+            get_partition_name(datetime.date(2018, 7, 1), "month"),
+            "exchange_rate_dailyexchangerates_y2018m07")
+
+    def test_partitions_skipped_without_postgresql(self):
+        """
+        This test ensures that partitioning does nothing on SQLite
+        """
+
+        with self.assertNumQueries(0):
+            ensure_partitions([datetime.date(2001, 1, 1)])
+
+        out = io.StringIO()
+        call_command("partition_rates", "--convert", stdout=out)
+        self.assertIn("requires PostgreSQL", out.getvalue())
+
+    def test_detach_partitions_by_bounds(self):
+        """
+        This test ensures that partitions are detached by their date
+        bounds, whatever their name, and renamed out of the way of the
+        partitions created later for the same period
+        """
+
+        table = "exchange_rate_dailyexchangerates"
+        cursor = FakePartitionCursor([
+            # yearly partitions left from before a switch to monthly
+            ("{}_y2019".format(table),
+             "FOR VALUES FROM ('2019-01-01') TO ('2020-01-01')"),
+            ("{}_y2018".format(table),
+             "FOR VALUES FROM ('2018-01-01') TO ('2019-01-01')"),
+            ("{}_y2020m01".format(table),
+             "FOR VALUES FROM ('2020-01-01') TO ('2020-02-01')"),
+            ("{}_default".format(table), "DEFAULT"),
+        ])
+        with mock.patch("exchange_rate.partitions.connection",
+                        FakePartitionConnection(cursor)):
+            detached = detach_partitions_before(datetime.date(2019, 6, 1))
+
+        self.assertEqual(detached, ["{}_y2018".format(table)])
+        self.assertIn('ALTER TABLE "{0}_y2018" RENAME TO '
+                      '"{0}_y2018_archive"'.format(table), cursor.executed)
+
+
+class FakePartitionCursor:
+    """
+    Cursor answering the catalog queries of partitions.py with the
+    given (name, bound) partitions and no other table
+    """
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.executed = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        if "pg_inherits" in sql:
+            self.rows = self.partitions
+        elif "to_regclass" in sql:
+            self.rows = [(None,)]
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0]
+
+
+class FakePartitionConnection:
+
+    def __init__(self, cursor):
+        self.ops = connection.ops
+        self.fake_cursor = cursor
+
+    def cursor(self):
+        return self.fake_cursor
+
+
+@override_settings(EXCHANGE_RATE_STREAM_HEARTBEAT=0.01)
+class StreamDailyExchangeRates(BaseViewTest):
+
+    def setUp(self):
+        super().setUp()
+        # only publish what the test itself writes
+        connection.run_on_commit = []
+
+    def api_call(self, pairs):
+        response = self.client.get(
+            reverse("exchange-rate:daily-stream",
+                    kwargs={"version": "v1"}),
+            data={"pair": pairs},
+        )
+        self.addCleanup(response.close)
+        return response
+
+    def run_on_commit(self):
+        # TestCase never commits, run what would run after the commit
+        callbacks = connection.run_on_commit
+        connection.run_on_commit = []
+        for _, callback in callbacks:
+            callback()
+
+    def read_event(self, content):
+        event = next(content).decode()
+        if event.startswith("data: "):
+            return json.loads(event[len("data: "):])
+        return event
+
+    def test_stream_daily_exchange_rate(self):
+        """
+        This test ensures that a subscriber of daily-exchange-rates/stream
+        endpoint gets the daily exchange rate of its pairs once it's
+        created, without querying the database
+        """
+
+        response = self.api_call(["GBP-USD"])
+        content = iter(response.streaming_content)
+        self.client.post(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "USD", "to_code": "IDR",
+                  "rate": 14000, "date": "2018-07-03"},
+            format="json")
+        self.client.post(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "GBP", "to_code": "USD",
+                  "rate": 1.5, "date": "2018-07-09"},
+            format="json")
+        self.run_on_commit()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.read_event(content), {
+                "from_code": "GBP", "to_code": "USD",
+                "rate": 1.5, "date": "2018-07-09"})
+            self.assertEqual(self.read_event(content), ": keep-alive\n\n")
+        self.assertEqual(response["Content-Type"],
+                         "text/event-stream; charset=utf-8")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response.close()
+        self.assertEqual(get_channel_layer().groups, {})
+
+    def test_stream_bulk_daily_exchange_rate(self):
+        """
+        This test ensures that a subscriber of daily-exchange-rates/stream
+        endpoint gets every daily exchange rate upserted by a POST request
+        to daily-exchange-rates/bulk endpoint
+        """
+
+        response = self.api_call(["GBP-USD", "JPY-IDR"])
+        content = iter(response.streaming_content)
+        data = [{"from_code": "JPY", "to_code": "IDR",
+                 "rate": 100, "date": "2018-07-03"},
+                {"from_code": "GBP", "to_code": "USD",
+                 "rate": 2, "date": "2018-07-08"}]
+        self.client.post(
+            reverse("exchange-rate:daily-bulk", kwargs={"version": "v1"}),
+            data=data, format="json")
+        self.run_on_commit()
+
+        self.assertEqual(
+            [self.read_event(content), self.read_event(content)],
+            [dict(row, rate=float(row["rate"])) for row in data])
+
+    @override_settings(EXCHANGE_RATE_STREAM_SLOTS=1)
+    def test_stream_failed_without_free_slot(self):
+        """
+        This test ensures that daily-exchange-rates/stream endpoint
+        serves a bounded number of streams at once and frees the slot of
+        a stream once it is closed, even if it never started
+        """
+
+        response = self.api_call(["GBP-USD"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        busy = self.api_call(["GBP-USD"])
+        self.assertEqual(busy.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(busy["Retry-After"], "5")
+
+        response.close()
+        self.assertEqual(get_channel_layer().groups, {})
+        self.assertEqual(self.api_call(["GBP-USD"]).status_code,
+                         status.HTTP_200_OK)
+
+    @override_settings(EXCHANGE_RATE_STREAM_SLOTS=1)
+    def test_stream_failed_to_subscribe(self):
+        """
+        This test ensures that daily-exchange-rates/stream endpoint frees
+        the slot of a stream which failed before it started
+        """
+
+        layer = get_channel_layer()
+        with mock.patch.object(layer, "subscribe",
+                               side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.api_call(["GBP-USD"])
+        self.assertEqual(stream_slots.used, 0)
+
+        with mock.patch.object(EventStream, "__init__",
+                               side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.api_call(["GBP-USD"])
+        self.assertEqual(stream_slots.used, 0)
+        self.assertEqual(layer.groups, {})
+        self.assertEqual(self.api_call(["GBP-USD"]).status_code,
+                         status.HTTP_200_OK)
+
+    def test_stream_listener_reconnects(self):
+        """
+        This test ensures that the listener of the postgres channel layer
+        logs a failed connection and reconnects, waiting longer after
+        each failure in a row
+        """
+
+        class Stop(BaseException):
+            pass
+
+        connections = iter([DatabaseError, DatabaseError, "listen",
+                            DatabaseError, Stop])
+
+        def listen_once(on_listen):
+            failure = next(connections)
+            if failure == "listen":
+                on_listen()
+                failure = DatabaseError
+            raise failure
+
+        layer = PostgresChannelLayer()
+        with mock.patch.object(layer, "listen_once",
+                               side_effect=listen_once), \
+                mock.patch("exchange_rate.push.time.sleep") as sleep, \
+                self.assertLogs("exchange_rate.push", "ERROR") as logs:
+            with self.assertRaises(Stop):
+                layer.listen()
+        self.assertEqual([call[0][0] for call in sleep.call_args_list],
+                         [1, 2, 1, 2])
+        self.assertEqual(len(logs.records), 4)
+
+    def test_stream_failed_with_invalid_pair(self):
+        """
+        This test ensures that we can't subscribe without pair, with a
+        malformed pair or with an unknown pair when make a GET request to
+        daily-exchange-rates/stream endpoint
+        """
+
+        self.assertEqual(self.api_call([]).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.api_call(["GBPUSD"]).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.api_call(["GBP-IDR"]).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(get_channel_layer().groups, {})
+
+
+class SnapshotDailyExchangeRates(BaseViewTest):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = "{}/rates.snapshot".format(directory.name)
+        settings = override_settings(EXCHANGE_RATE_SNAPSHOT_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        snapshot_store.clear()
+        self.addCleanup(snapshot_store.clear)
+
+    def build(self, date="2018-07-08"):
+        call_command("build_rate_snapshot", "--date", date,
+                     stdout=io.StringIO())
+        # look the file up again without waiting for the check interval
+        snapshot_store.checked_at = None
+
+    def latest_call(self, from_code="GBP", to_code="USD"):
+        return self.client.get(
+            reverse("exchange-rate:daily-latest", kwargs={"version": "v1"}),
+            data={"from_code": from_code, "to_code": to_code},
+        )
+
+    def list_call(self, date="2018-07-08"):
+        get_cache().clear()
+        return self.client.get(
+            reverse("exchange-rate:daily-list", kwargs={"version": "v1"}),
+            data={"date": date},
+        )
+
+    def test_get_latest_rate_from_snapshot(self):
+        """
+        This test ensures that daily-exchange-rates/latest endpoint reads
+        the latest rate of a pair from a fresh snapshot without querying
+        the database
+        """
+
+        self.build()
+        with self.assertNumQueries(0):
+            response = self.latest_call()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["date"], datetime.date(2018, 7, 8))
+        self.assertEqual(response.data["rate"], 1.0)
+        self.assertEqual(response.data["exchange_rate"]["id"],
+                         ExchangeRates.objects.get(from_currency__code="GBP",
+                                                   to_currency__code="USD").id)
+
+        with self.assertNumQueries(0):
+            response = self.latest_call("GBP", "IDR")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_stale_snapshot_falls_back_to_database(self):
+        """
+        This test ensures that a write makes the snapshot stale, read
+        endpoints then query the database until the next snapshot
+        """
+
+        self.build()
+        self.client.post(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "GBP", "to_code": "USD", "rate": 2,
+                  "date": "2018-07-09"},
+            format="json")
+
+        response = self.latest_call()
+        self.assertEqual(response.data["date"], datetime.date(2018, 7, 9))
+        self.assertEqual(response.data["rate"], 2.0)
+
+        self.build("2018-07-09")
+        with self.assertNumQueries(0):
+            response = self.latest_call()
+        self.assertEqual(response.data["rate"], 2.0)
+
+    def test_list_daily_exchange_rates_from_snapshot(self):
+        """
+        This test ensures that daily-exchange-rates/list endpoint returns
+        the same page from a snapshot of the requested date as from the
+        database, built from the summaries without grouping daily rates
+        """
+
+        expected = self.list_call().data
+        with CaptureQueriesContext(connection) as queries:
+            self.build()
+        sql = " ".join(query["sql"] for query in queries.captured_queries)
+        self.assertIn(DailyRateSummary._meta.db_table, sql)
+        self.assertNotIn(" GROUP BY ", sql)
+        self.assertIsNotNone(snapshot_store.get(datetime.date(2018, 7, 8)))
+        self.assertEqual(self.list_call().data, expected)
+
+        # a snapshot of another date isn't used
+        self.assertIsNone(snapshot_store.get(datetime.date(2018, 7, 9)))
+        self.assertEqual(self.list_call("2018-07-09").data["results"][0][
+            "rate"], 1.0)
+
+    def test_convert_from_snapshot(self):
+        """
+        This test ensures that convert endpoint loads the latest rates
+        from a fresh snapshot
+        """
+
+        self.build()
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse("exchange-rate:convert", kwargs={"version": "v1"}),
+                data={"from_code": "GBP", "to_code": "IDR"})
+        self.assertEqual(response.data["path"], ["GBP", "USD", "IDR"])
+
+    def test_build_snapshot_replaces_file(self):
+        """
+        This test ensures that a new snapshot replaces the previous file
+        and workers map the new one
+        """
+
+        build_snapshot(self.path, datetime.date(2018, 7, 8))
+        snapshot = snapshot_store.get()
+        self.create_exchange_rate("EUR", "USD")
+        self.assertIsNone(snapshot_store.get())
+
+        self.build()
+        self.assertIsNot(snapshot_store.get(), snapshot)
+        self.assertIn("EUR", snapshot_store.get().codes)
+        # the previous map stays readable until dropped
+        self.assertEqual(snapshot.get("GBP", "USD")["rate"], 1.0)
+
+
+class BenchmarkCommandTest(BaseViewTest):
+
+    def test_benchmark_every_endpoint(self):
+        """
+        This test ensures that benchmark command runs every endpoint
+        without error on seeded data and writes the results as JSON
+        """
+
+        call_command("seed_rates", "--pairs", "6", "--days", "20",
+                     stdout=io.StringIO())
+        with tempfile.NamedTemporaryFile("r", suffix=".json") as output:
+            call_command("benchmark", "--pairs", "6", "--days", "20",
+                         "--requests", "3", "--output", output.name,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+            results = json.load(output)
+
+        self.assertEqual(results["meta"]["mode"], "in-process")
+        self.assertEqual(len(results["endpoints"]), 15)
+        for name, result in results["endpoints"].items():
+            self.assertEqual(result["errors"], 0, name)
+            self.assertEqual(result["requests"], 3)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertIsNotNone(result["queries_per_request"])
+
+    def test_benchmark_needs_seeded_data(self):
+        """
+        This test ensures that benchmark command refuses to run before
+        seed_rates
+        """
+
+        with self.assertRaises(CommandError):
+            call_command("benchmark", "--pairs", "6", "--days", "20",
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class MetricsTest(BaseViewTest):
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def get_metrics(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode().splitlines()
+
+    def test_metrics_by_url_name(self):
+        """
+        This test ensures that /metrics endpoint exposes the wall time,
+        queries, rendering time and response size of every request by
+        URL name
+        """
+
+        with self.assertNumQueries(3):
+            self.client.get(
+                reverse("exchange-rate:daily-detail",
+                        kwargs={"version": "v1"}),
+                data={"from_code": "GBP", "to_code": "USD"})
+        lines = self.get_metrics()
+
+        view = 'view="exchange-rate:daily-detail"'
+        self.assertIn('http_requests_total{method="GET",status="200",'
+                      + view + '} 1', lines)
+        self.assertIn('http_request_sql_queries_bucket{le="2",'
+                      + view + '} 0', lines)
+        self.assertIn('http_request_sql_queries_bucket{le="5",'
+                      + view + '} 1', lines)
+        self.assertIn('http_request_sql_queries_sum{' + view + '} 3',
+                      lines)
+        for name in ("http_request_duration_seconds_count{method=\"GET\",",
+                     "http_request_sql_duration_seconds_count{",
+                     "http_response_render_duration_seconds_count{",
+                     "http_response_size_bytes_count{"):
+            self.assertIn(name + view + "} 1", lines)
+
+    @override_settings(SLOW_REQUEST_LOG_THRESHOLD=0)
+    def test_slow_request_log(self):
+        """
+        This test ensures that a request slower than the threshold is
+        logged with its queries
+        """
+
+        with self.assertLogs("server.metrics.slow", "WARNING") as logs:
+            self.client.get(reverse("exchange-rate:index",
+                                    kwargs={"version": "v1"}))
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("exchange-rate:index", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+        self.assertEqual(len(logs.records[0].queries), 1)
+
+
+@override_settings(PROFILING_INTERVAL=0.0001, PROFILING_TOKEN="secret")
+class ProfilingTest(BaseViewTest):
+
+    def setUp(self):
+        super().setUp()
+        sampler.reset()
+        sampler_stop = sampler.stop
+
+        def stop(request):
+            # cached responses can end before the sampler thread runs,
+            # hold them until a stack of them is taken
+            thread_stacks = sampler.threads[threading.get_ident()]
+            deadline = time.monotonic() + 5
+            while not thread_stacks and time.monotonic() < deadline:
+                time.sleep(0.001)
+            sampler_stop(request)
+
+        patcher = mock.patch.object(sampler, "stop", stop)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def api_call(self, **headers):
+        for _ in range(5):
+            self.client.get(reverse("exchange-rate:daily-list",
+                                    kwargs={"version": "v1"}),
+                            data={"date": "2018-07-08"}, **headers)
+
+    def get_stacks(self, view=None):
+        staff = User.objects.create_user("staff", password="x",
+                                         is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("profiling-stacks"),
+                                   data={"view": view} if view else {})
+        self.client.logout()
+        return response
+
+    def test_profile_requests_with_token(self):
+        """
+        This test ensures that requests with the profiling token are
+        sampled and their collapsed stacks, rooted at the URL name, are
+        served to staff at /profiling/stacks
+        """
+
+        self.api_call()
+        self.assertEqual(sampler.samples, 0)
+        self.api_call(HTTP_X_PROFILE="secret")
+
+        response = self.get_stacks("exchange-rate:daily-list")
+        lines = response.content.decode().splitlines()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("exchange-rate:daily-list;"))
+            self.assertGreater(int(count), 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_profile_sampled_requests(self):
+        """
+        This test ensures that a sample rate of 1 profiles every request
+        """
+
+        self.api_call()
+        self.assertGreater(sampler.samples, 0)
+
+    def test_stacks_need_staff(self):
+        """
+        This test ensures that anonymous users can't read the stacks
+        """
+
+        response = self.client.get(reverse("profiling-stacks"))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+
+class FastJSONRendererTest(SimpleTestCase):
+
+    def test_same_output_as_json_renderer(self):
+        """
+        This test ensures that FastJSONRenderer renders exactly what
+        JSONRenderer renders
+        """
+
+        data = {"date": datetime.date(2018, 7, 2),
+                "datetime": datetime.datetime(2018, 7, 2, 1, 2, 3, 456789),
+                "rates": [{"id": 1, "rate": 1.1, "average": None}],
+                "text": "Rp \u2028 \u00e9", 1: "one"}
+
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"))
+
+
+class FakeConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def test_reuse_connection(self):
+        """
+        This test ensures that a released connection is handed out again
+        instead of opening a new one, unless it fails the check
+        """
+
+        pool = ConnectionPool(max_size=2, timeout=0)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        pool.release(connection)
+        other = pool.acquire(FakeConnection, lambda connection: False)
+        self.assertIsNot(other, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["opened"], 2)
+        self.assertEqual(pool.stats()["discarded"], 1)
+        self.assertEqual(pool.stats()["size"], 1)
+
+    def test_pool_timeout(self):
+        """
+        This test ensures that a full pool waits for a release and gives
+        up after its timeout
+        """
+
+        pool = ConnectionPool(max_size=1, timeout=0.01)
+        connection = pool.acquire(FakeConnection)
+
+        with self.assertRaises(PoolTimeout), \
+                self.assertLogs("server.db.pool", "WARNING"):
+            pool.acquire(FakeConnection)
+        pool.release(connection)
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        self.assertEqual(pool.stats()["timeouts"], 1)
+        self.assertEqual(pool.stats()["waits"], 1)
+        self.assertEqual(pool.stats()["max_in_use"], 1)
+
+
+# the replica is a second connection to the test database, which only
+# sees committed data
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTest(ViewTestMixin, APITransactionTestCase):
+    multi_db = True
+
+    def api_call(self):
+        return self.client.get(
+            reverse("exchange-rate:index", kwargs={"version": "v1"}))
+
+    def test_read_from_replica(self):
+        """
+        This test ensures that a GET request to exchange-rates/ endpoint
+        reads from a replica and not from the primary
+        """
+
+        # the currency codes are loaded from the primary once
+        self.api_call()
+        with self.assertNumQueries(0, using="default"), \
+                CaptureQueriesContext(connections["replica"]) as queries:
+            response = self.api_call()
+
+        self.assertTrue(queries.captured_queries)
+        self.assertEqual(len(response.data["results"]), 4)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cache_miss_read_from_replica_at_position(self):
+        """
+        This test ensures that a GET request to daily-exchange-rates/
+        endpoint computes what it caches on the replica once it has
+        replayed the last write, and on the primary before, a lagging
+        replica would cache old rates under the current version
+        """
+
+        url = reverse("exchange-rate:daily-detail", kwargs={"version": "v1"})
+        data = {"from_code": "GBP", "to_code": "USD"}
+        replayed.clear()
+        with mock.patch("exchange_rate.cache.get_write_position",
+                        return_value=10):
+            with transaction.atomic():
+                bump_versions(["list"])
+            self.assertEqual(get_cache().get(POSITION_KEY), 10)
+
+        replay = mock.patch("server.replicas.get_replay_position",
+                            return_value=5)
+        with replay, self.assertNumQueries(0, using="replica"):
+            response = self.client.get(url, data=data)
+        self.assertEqual(response.data["average"], 1.0)
+
+        with replay, self.assertNumQueries(0, using="replica"), \
+                self.assertNumQueries(0, using="default"):
+            self.assertEqual(self.client.get(url, data=data).data,
+                             response.data)
+
+        data["window"] = 6
+        with mock.patch("server.replicas.get_replay_position",
+                        return_value=10), \
+                self.assertNumQueries(0, using="default"), \
+                CaptureQueriesContext(connections["replica"]) as queries:
+            response = self.client.get(url, data=data)
+        self.assertTrue(queries.captured_queries)
+        self.assertEqual(response.data["window"], 6)
+
+    def test_read_your_own_writes(self):
+        """
+        This test ensures that a client reads from the primary for a
+        while after it makes a POST request to daily-exchange-rates/
+        endpoint
+        """
+
+        response = self.client.post(
+            reverse("exchange-rate:daily-detail", kwargs={"version": "v1"}),
+            data={"from_code": "GBP", "to_code": "USD",
+                  "rate": 2, "date": "2018-07-09"},
+            format="json")
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        with self.assertNumQueries(0, using="replica"):
+            self.api_call()
+        del self.client.cookies[PIN_COOKIE]
+        with self.assertNumQueries(0, using="default"):
+            self.api_call()
+
+    def test_select_replica(self):
+        """
+        This test ensures that replicas are picked in turn, or by lag
+        skipping the ones too far behind
+        """
+
+        selector = ReplicaSelector()
+        replicas = ["replica_1", "replica_2"]
+        self.assertEqual([selector.select(replicas) for _ in range(3)],
+                         ["replica_1", "replica_2", "replica_1"])
+
+        lags = {"replica_1": 3, "replica_2": 1}
+        selector.measure_lag = lags.get
+        with self.settings(DATABASE_REPLICA_SELECTION="least-lag",
+                           DATABASE_REPLICA_MAX_LAG=2):
+            self.assertEqual(selector.select(replicas), "replica_2")
+            selector.lags.clear()
+            lags["replica_2"] = 5
+            self.assertIsNone(selector.select(replicas))
+
+
+class AsgiAPIClient:
+    """
+    Minimal APIClient look-alike sending requests through the ASGI
+    application. Requests run on the test thread, so they see the data
+    of the test transaction
+    """
+
+    def __init__(self):
+        self.application = get_asgi_application(thread_sensitive=True)
+
+    def request(self, method, path, data=None, format=None,
+                content_type=None, **extra):
+        url = urlsplit(path)
+        query_string = url.query
+        body = b""
+        if method in ("GET", "DELETE"):
+            if data:
+                query_string = urlencode(data, doseq=True)
+        elif format == "json":
+            body = json.dumps(data).encode()
+            content_type = "application/json"
+        elif data is not None:
+            body = data.encode() if isinstance(data, str) else data
+
+        headers = [(b"host", b"testserver")]
+        if content_type is not None:
+            headers.append((b"content-type", content_type.encode()))
+        for name, value in extra.items():
+            if name.startswith("HTTP_"):
+                headers.append((name[5:].lower().replace("_", "-").encode(),
+                                value.encode()))
+        scope = {"type": "http", "http_version": "1.1", "method": method,
+                 "scheme": "http", "path": url.path, "root_path": "",
+                 "query_string": query_string.encode(), "headers": headers,
+                 "server": ("testserver", 80), "client": ("127.0.0.1", 0)}
+        return async_to_sync(self.communicate)(scope, body)
+
+    async def communicate(self, scope, body):
+        communicator = ApplicationCommunicator(self.application, scope)
+        await communicator.send_input(
+            {"type": "http.request", "body": body})
+        start = await communicator.receive_output()
+        content = b""
+        while True:
+            message = await communicator.receive_output()
+            content += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        response = HttpResponse(content, status=start["status"])
+        for name, value in start["headers"]:
+            response[name.decode()] = value.decode()
+        response.data = None
+        if response.get("Content-Type", "").startswith("application/json"):
+            response.data = json.loads(content.decode())
+        return response
+
+    def get(self, path, data=None, **extra):
+        return self.request("GET", path, data, **extra)
+
+    def post(self, path, data=None, format=None, content_type=None,
+             **extra):
+        return self.request("POST", path, data, format, content_type,
+                            **extra)
+
+    def put(self, path, data=None, format=None, content_type=None,
+            **extra):
+        return self.request("PUT", path, data, format, content_type,
+                            **extra)
+
+    def delete(self, path, data=None, **extra):
+        return self.request("DELETE", path, data, **extra)
+
+
+# the endpoint tests again, served by the ASGI application
+
+
+class AsgiGetAllExchangeRatesTest(GetAllExchangeRatesTest):
+    client = AsgiAPIClient()
+
+
+class AsgiCreateExchangeRatesTest(CreateExchangeRatesTest):
+    client = AsgiAPIClient()
+
+
+class AsgiDeleteExchangeRatesTest(DeleteExchangeRatesTest):
+    client = AsgiAPIClient()
+
+
+class AsgiRetrieveExchangeRatesTest(RetrieveExchangeRatesTest):
+    client = AsgiAPIClient()
+
+
+class AsgiUpdateExchangeRatesTest(UpdateExchangeRatesTest):
+    client = AsgiAPIClient()
+
+
+class AsgiCreateDailyExchangeRate(CreateDailyExchangeRate):
+    client = AsgiAPIClient()
+
+
+class AsgiRetrieveDailyExchangeRate(RetrieveDailyExchangeRate):
+    client = AsgiAPIClient()
+
+
+class AsgiListDailyExchangeRates(ListDailyExchangeRates):
+    client = AsgiAPIClient()
+
+
+class AsgiConditionalDailyExchangeRates(ConditionalDailyExchangeRates):
+    client = AsgiAPIClient()
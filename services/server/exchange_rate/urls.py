@@ -5,7 +5,14 @@ from .views import (
     ExchangeRatesDetail,
     ExchangeRatesList,
     DailyExchangeRatesDetail,
-    DailyExchangeRatesList
+    DailyExchangeRatesList,
+    DailyExchangeRatesBulk,
+    DailyExchangeRatesExport,
+    ExchangeRatesConvert,
+    ExchangeRatesQuote,
+    DailyExchangeRatesAsOf,
+    DailyExchangeRatesLatest,
+    DailyExchangeRatesStream
 )
 
 app_name = 'exchange-rate'
@@ -20,7 +27,21 @@ urlpatterns = [
     re_path('daily-exchange-rates/$',
             DailyExchangeRatesDetail.as_view(), name="daily-detail"),
     path('daily-exchange-rates/list',
-         DailyExchangeRatesList.as_view(), name="daily-list")
+         DailyExchangeRatesList.as_view(), name="daily-list"),
+    path('daily-exchange-rates/bulk',
+         DailyExchangeRatesBulk.as_view(), name="daily-bulk"),
+    path('daily-exchange-rates/export',
+         DailyExchangeRatesExport.as_view(), name="daily-export"),
+    path('daily-exchange-rates/as-of',
+         DailyExchangeRatesAsOf.as_view(), name="daily-as-of"),
+    path('daily-exchange-rates/latest',
+         DailyExchangeRatesLatest.as_view(), name="daily-latest"),
+    path('daily-exchange-rates/stream',
+         DailyExchangeRatesStream.as_view(), name="daily-stream"),
+    path('convert',
+         ExchangeRatesConvert.as_view(), name="convert"),
+    path('quotes',
+         ExchangeRatesQuote.as_view(), name="quotes")
 ]
 
 
@@ -1,30 +1,80 @@
 import math
+import time
 import datetime
 
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, F, Max, Min, Subquery
 
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import api_view
-
-from .models import ExchangeRates, DailyExchangeRates
-from .serializers import ExchangeRatesSerializer, DailyExchangeRatesSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+
+from .cache import get_or_compute, get_pair_version_name, get_state
+from .conditional import (
+    get_etag,
+    get_not_modified_response,
+    set_validators
+)
+from .conversion import rate_graph
+from .currencies import currency_index
+from .history import get_rates_as_of
+from .ingest import get_exchange_rate_ids, upsert_daily_exchange_rates
+from .models import ExchangeRates, DailyExchangeRates, DailyRateSummary
+from .pagination import IdCursorPagination
+from .pairs import pair_index
+from .parsers import NDJSONParser
+from .push import (
+    EventStream,
+    get_channel_layer,
+    get_group_name,
+    stream_slots
+)
+from .renderers import CSVRenderer, EventStreamRenderer, NDJSONRenderer
+from .serializers import (
+    ExchangeRatesSerializer,
+    DailyExchangeRatesSerializer,
+    BulkDailyExchangeRatesSerializer,
+    QuoteSerializer,
+    get_daily_exchange_rates_data,
+    get_exchange_rates_data,
+    get_exchange_rates_values
+)
+from .snapshots import snapshot_store
+from .summaries import annotate_week_statistics, get_week_statistics
 
 # Create your views here.
 
+MAX_DAILY_EXCHANGE_RATE_WINDOW = 3650
+EXPORT_CHUNK_SIZE = 2000
+MAX_QUOTE_ITEMS = 1000
+MAX_AS_OF_DATES = 366
+MAX_STREAM_PAIRS = 100
+
 
 class ExchangeRatesList(APIView):
+    pagination_class = IdCursorPagination
+    read_from_replicas = True
 
     def get_serializer(self):
         return ExchangeRatesSerializer()
 
     def get(self, request, format=None, version="v1"):
-        queryset = ExchangeRates.objects.all()
-        serializer = ExchangeRatesSerializer(queryset, many=True)
-        return Response(serializer.data)
+        """
+        Return a page of exchange rates ordered by id
+        """
+        paginator = self.pagination_class()
+        exchange_rates = paginator.paginate_queryset(
+            get_exchange_rates_values(ExchangeRates.objects.all()),
+            request, view=self)
+        return paginator.get_paginated_response(
+            get_exchange_rates_data(exchange_rates))
 
     def post(self, request, format=None, version="v1"):
         """
@@ -82,51 +132,123 @@ class DailyExchangeRatesDetail(APIView):
     """
     Detail daily exchange rates, or create a new daily exchange rates.
     """
+    read_from_replicas = True
 
     def get_serializer(self):
         return DailyExchangeRatesSerializer()
 
     def get_object(self, from_code, to_code):
-        try:
-            return ExchangeRates.objects.get(
-                from_code=from_code, to_code=to_code)
-        except ExchangeRates.DoesNotExist:
+        # currency ids come with the pair, no lookup of the currency index
+        pair = pair_index.get_pair(from_code, to_code)
+        if pair is None:
             raise Http404
+        pk, from_currency_id, to_currency_id = pair
+        return ExchangeRates(id=pk, from_currency_id=from_currency_id,
+                             to_currency_id=to_currency_id)
 
-    def get_variance_and_average(self, daily_exchange_rate):
-        sum_rate = 0
-        min_rate = math.inf
-        max_rate = -math.inf
-        for data in daily_exchange_rate:
-            sum_rate = sum_rate + data.rate
-            if data.rate < min_rate:
-                min_rate = data.rate
-            if data.rate > max_rate:
-                max_rate = data.rate
-        average = sum_rate/len(daily_exchange_rate)
-        variance = max_rate - min_rate
-        return (variance, average)
+    def get_positive_int_param(self, request, name, default):
+        value = int(request.query_params.get(name, default))
+        if value < 1 or value > MAX_DAILY_EXCHANGE_RATE_WINDOW:
+            raise ValueError(name)
+        return value
+
+    def get_statistics(self, exchange_rate, window):
+        """
+        Return min, max, average, variance and the latest rate of the
+        last window daily exchange rates, read from the most recent
+        DailyRateSummary when it covers window and is the one of the
+        latest daily exchange rate, computed otherwise
+        """
+        if window not in DailyRateSummary.WINDOWS:
+            return self.get_aggregate_statistics(exchange_rate, window)
+
+        latest_date = DailyExchangeRates.objects.filter(
+            exchange_rate=exchange_rate).order_by('-date').values('date')[:1]
+        summary = DailyRateSummary.objects.filter(
+            exchange_rate=exchange_rate).annotate(
+                latest_date=Subquery(latest_date)).order_by('-date').first()
+        # summaries missing, e.g. of rates written before they existed
+        if summary is None or summary.date != summary.latest_date:
+            return self.get_aggregate_statistics(exchange_rate, window)
+
+        statistics = summary.get_statistics(window)
+        statistics.update({
+            'range': statistics['max'] - statistics['min'],
+            'stddev': math.sqrt(statistics['variance'])})
+        return statistics
+
+    def get_aggregate_statistics(self, exchange_rate, window):
+        """
+        Compute min, max, average, variance and the latest rate of the
+        last window daily exchange rates in a single aggregate query
+        """
+        recent = DailyExchangeRates.objects.filter(
+            exchange_rate=exchange_rate).order_by('-date')
+        statistics = DailyExchangeRates.objects.filter(
+            pk__in=recent.values('pk')[:window]
+        ).aggregate(
+            total=Count('id'),
+            min=Min('rate'),
+            max=Max('rate'),
+            average=Avg('rate'),
+            average_square=Avg(F('rate') * F('rate')),
+            # uncorrelated subquery, wrapped so it fits in the aggregate
+            latest_rate=Max(Subquery(recent.values('rate')[:1])),
+        )
+
+        average_square = statistics.pop('average_square')
+        if statistics['total'] == 0:
+            statistics.update({'range': None, 'variance': None,
+                               'stddev': None})
+            return statistics
+
+        # population variance, E[X^2] - E[X]^2, clamped against rounding
+        variance = max(average_square - statistics['average'] ** 2, 0.0)
+        statistics.update({'range': statistics['max'] - statistics['min'],
+                           'variance': variance,
+                           'stddev': math.sqrt(variance)})
+        return statistics
+
+    def get_summary(self, exchange_rate, window, limit):
+        daily_exchange_rate = DailyExchangeRates.objects.filter(
+            exchange_rate=exchange_rate).order_by('-date')[:limit]
+        data = {'exchange_rate': {'id': exchange_rate.id,
+                                  'from_code': exchange_rate.from_code,
+                                  'to_code': exchange_rate.to_code},
+                'daily_exchange_rate': get_daily_exchange_rates_data(
+                    daily_exchange_rate),
+                'window': window}
+        data.update(self.get_statistics(exchange_rate, window))
+        return data
 
     def get(self, request, format=None, version="v1"):
         """
-        Return 7 most recent daily exchange rate
+        Return most recent daily exchange rate with statistics over
+        the last window daily exchange rate (default 7)
         """
         from_code = request.query_params.get('from_code', '')
         to_code = request.query_params.get('to_code', '')
+        try:
+            window = self.get_positive_int_param(request, 'window', 7)
+            limit = self.get_positive_int_param(request, 'limit', 7)
+        except ValueError:
+            return Response({'errors': 'Your request is invalid'},
+                            status=status.HTTP_400_BAD_REQUEST)
         exchange_rate = self.get_object(from_code, to_code)
 
-        daily_exchange_rate = DailyExchangeRates.objects.filter(
-            exchange_rate=exchange_rate).order_by('-date')[:7]
-        daily_exchange_rate_serializer = DailyExchangeRatesSerializer(
-            daily_exchange_rate, many=True)
-        exchange_rate_serializer = ExchangeRatesSerializer(exchange_rate)
-        variance, average = self.get_variance_and_average(daily_exchange_rate)
-        data = {'exchange_rate': exchange_rate_serializer.data,
-                'daily_exchange_rate': daily_exchange_rate_serializer.data,
-                'variance': variance,
-                'average': average
-                }
-        return Response(data, status=status.HTTP_200_OK)
+        versions, last_modified = get_state(
+            [get_pair_version_name(exchange_rate.id)])
+        # versions of different pairs can be equal, the key names the pair
+        etag = get_etag('daily-detail', versions,
+                        (exchange_rate.id, window, limit,
+                         request.accepted_renderer.format))
+        response = get_not_modified_response(request, etag, last_modified)
+        if response is None:
+            data = get_or_compute(
+                'daily-detail', versions, (exchange_rate.id, window, limit),
+                lambda: self.get_summary(exchange_rate, window, limit))
+            response = Response(data, status=status.HTTP_200_OK)
+        return set_validators(response, etag, last_modified)
 
     def post(self, request, format=None, version="v1"):
         """
@@ -153,51 +275,464 @@ class DailyExchangeRatesDetail(APIView):
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class DailyExchangeRatesList(APIView):
+class DailyExchangeRatesBulk(APIView):
     """
-    List daily exchange rates
+    Create or update many daily exchange rates at once.
+    """
+    parser_classes = (JSONParser, NDJSONParser)
+
+    def get_serializer(self):
+        return BulkDailyExchangeRatesSerializer()
+
+    def post(self, request, format=None, version="v1"):
+        """
+        Upsert a JSON array or NDJSON stream of daily exchange rate,
+        invalid rows are reported and skipped
+        """
+        if not isinstance(request.data, list):
+            return Response({'errors': 'Your request is invalid'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+        valid = []
+        for index, row in enumerate(request.data):
+            serializer = BulkDailyExchangeRatesSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        exchange_rate_ids = get_exchange_rate_ids(
+            (row['from_code'], row['to_code']) for _, row in valid)
+        rows = []
+        for index, row in valid:
+            pair = (row['from_code'], row['to_code'])
+            if pair not in exchange_rate_ids:
+                errors.append({'index': index,
+                               'errors': {'exchange_rate': ['Not found.']}})
+                continue
+            rows.append((exchange_rate_ids[pair], row['rate'], row['date']))
+
+        upserted = upsert_daily_exchange_rates(rows)
+        errors.sort(key=lambda error: error['index'])
+        return Response({'upserted': upserted, 'errors': errors},
+                        status=status.HTTP_200_OK)
+
+
+class DailyExchangeRatesExport(APIView):
     """
+    Export daily exchange rates as CSV or NDJSON.
+    """
+    renderer_classes = (CSVRenderer, NDJSONRenderer)
+    fields = ('from_code', 'to_code', 'rate', 'date')
 
     def get_serializer(self):
         return DailyExchangeRatesSerializer()
 
-    def get_average_rate(self, daily_exhange_rate):
-        sum_rate = 0
-        for data in daily_exhange_rate:
-            sum_rate = sum_rate + data.rate
-        return sum_rate/len(daily_exhange_rate)
+    def get_object(self, from_code, to_code):
+        pk = pair_index.get(from_code or '', to_code or '')
+        if pk is None:
+            raise Http404
+        return pk
 
-    def get_daily_exchange_rate(self, exchange_rate, date, last_week_date):
-        return DailyExchangeRates.objects.filter(
-            exchange_rate=exchange_rate.id,
-            date__range=[last_week_date, date]).order_by("-date")
+    def get_date_param(self, request, name):
+        value = request.query_params.get(name, None)
+        if value is None:
+            return None
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
 
     def get(self, request, format=None, version="v1"):
         """
-        Return list rate and average per data by date
+        Stream daily exchange rate ordered by pair and date, optionally
+        filtered by from_code and to_code and by start_date and end_date
         """
-        date = request.query_params.get('date', None)
-        if date is None:
-            date = datetime.date.today()
-        else:
-            date = datetime.datetime.strptime(date, '%Y-%m-%d')
+        try:
+            start_date = self.get_date_param(request, 'start_date')
+            end_date = self.get_date_param(request, 'end_date')
+        except ValueError:
+            return Response({'errors': 'Your request is invalid'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = DailyExchangeRates.objects.all()
+        from_code = request.query_params.get('from_code', None)
+        to_code = request.query_params.get('to_code', None)
+        if from_code is not None or to_code is not None:
+            queryset = queryset.filter(
+                exchange_rate_id=self.get_object(from_code, to_code))
+        if start_date is not None:
+            queryset = queryset.filter(date__gte=start_date)
+        if end_date is not None:
+            queryset = queryset.filter(date__lte=end_date)
+
+        codes = currency_index.load()[1]
+        rows = (
+            (codes.get(from_currency_id), codes.get(to_currency_id), rate,
+             date)
+            for from_currency_id, to_currency_id, rate, date
+            in queryset.order_by('exchange_rate_id', 'date').values_list(
+                'exchange_rate__from_currency_id',
+                'exchange_rate__to_currency_id', 'rate', 'date'
+            ).iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.render_rows(self.fields, rows),
+            content_type='{}; charset={}'.format(
+                renderer.media_type, renderer.charset))
+        response['Content-Disposition'] = (
+            'attachment; filename="daily-exchange-rates.{}"'.format(
+                renderer.format))
+        return response
+
+
+class DailyExchangeRatesStream(APIView):
+    """
+    Server-Sent Events of daily exchange rates as they are written.
+    """
+    renderer_classes = (EventStreamRenderer,)
+    fields = ('from_code', 'to_code', 'rate', 'date')
+
+    def get_serializer(self):
+        return DailyExchangeRatesSerializer()
+
+    def get_rows(self, subscription, pairs):
+        timeout = getattr(settings, 'EXCHANGE_RATE_STREAM_TIMEOUT', 300)
+        heartbeat = getattr(settings, 'EXCHANGE_RATE_STREAM_HEARTBEAT', 15)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            message = subscription.get(
+                timeout=min(heartbeat, deadline - time.monotonic()))
+            if message is None:
+                yield None
+                continue
+            from_code, to_code = pairs[message['exchange_rate']]
+            yield [from_code, to_code, message['rate'], message['date']]
+
+    def get(self, request, format=None, version="v1"):
+        """
+        Subscribe to the daily exchange rates of every pair query param,
+        written as FROM-TO. The stream ends after a minute and
+        EventSource reconnects by itself, 503 when the server already
+        serves as many streams as it can
+        """
+        codes = [pair.split('-')
+                 for pair in request.query_params.getlist('pair')]
+        if (not codes or len(codes) > MAX_STREAM_PAIRS
+                or any(len(pair) != 2 for pair in codes)):
+            return Response({'errors': 'Your request is invalid'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        pairs = {}
+        for from_code, to_code in codes:
+            pk = pair_index.get(from_code, to_code)
+            if pk is None:
+                raise Http404
+            pairs[pk] = (from_code, to_code)
+        if not stream_slots.acquire():
+            return Response({'errors': 'Too many streams, retry later'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': '5'})
+        # the stream releases the slot once closed, until it exists
+        # a failure has to
+        subscription = None
+        try:
+            # the stream holds on to the request without touching the
+            # database, hand the connection back before it starts
+            if not connection.in_atomic_block:
+                connection.close()
+
+            subscription = get_channel_layer().subscribe(
+                get_group_name(pk) for pk in pairs)
+            renderer = request.accepted_renderer
+            stream = EventStream(renderer.render_rows(
+                self.fields, self.get_rows(subscription, pairs)),
+                subscription)
+        except Exception:
+            if subscription is not None:
+                subscription.close()
+            stream_slots.release()
+            raise
+        response = StreamingHttpResponse(
+            stream,
+            content_type='{}; charset={}'.format(
+                renderer.media_type, renderer.charset))
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class DailyExchangeRatesAsOf(APIView):
+    """
+    Daily exchange rate of a pair as of one or many dates.
+    """
+
+    def get_serializer(self):
+        return DailyExchangeRatesSerializer()
+
+    def get(self, request, format=None, version="v1"):
+        """
+        Return the most recent rate at or before every date query param,
+        a date without rate so far gets a null rate
+        """
+        from_code = request.query_params.get('from_code', '')
+        to_code = request.query_params.get('to_code', '')
+        try:
+            dates = [datetime.datetime.strptime(date, '%Y-%m-%d').date()
+                     for date in request.query_params.getlist('date')]
+        except ValueError:
+            dates = []
+        if not dates or len(dates) > MAX_AS_OF_DATES:
+            return Response({'errors': 'Your request is invalid'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        pk = pair_index.get(from_code, to_code)
+        if pk is None:
+            raise Http404
+
+        rates = get_rates_as_of((pk, date) for date in dates)
+        datas = []
+        for date in dates:
+            rate_date, rate = rates.get((pk, date), (None, None))
+            datas.append({'date': date, 'rate_date': rate_date,
+                          'rate': rate})
+        data = {'exchange_rate': {'id': pk,
+                                  'from_code': from_code,
+                                  'to_code': to_code},
+                'rates': datas}
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class DailyExchangeRatesLatest(APIView):
+    """
+    Latest daily exchange rate of a pair.
+    """
+    read_from_replicas = True
+
+    def get_serializer(self):
+        return DailyExchangeRatesSerializer()
+
+    def get_latest(self, from_code, to_code):
+        """
+        Return (id, date, rate) of the pair, from the snapshot when it's
+        fresh, or None when the pair doesn't exist
+        """
+        snapshot = snapshot_store.get()
+        if snapshot is not None:
+            data = snapshot.get(from_code, to_code)
+            if data is not None:
+                return data['id'], data['date'], data['rate']
+            # pairs without rates are stored too, it doesn't exist
+            return None
+
+        pk = pair_index.get(from_code, to_code)
+        if pk is None:
+            return None
+        latest = DailyExchangeRates.objects.filter(
+            exchange_rate_id=pk).order_by('-date').values_list(
+                'date', 'rate').first()
+        return (pk,) + (latest or (None, None))
+
+    def get(self, request, format=None, version="v1"):
+        """
+        Return the most recent rate of the from_code to_code pair, null
+        when it has none yet
+        """
+        from_code = request.query_params.get('from_code', '')
+        to_code = request.query_params.get('to_code', '')
+        latest = self.get_latest(from_code, to_code)
+        if latest is None:
+            raise Http404
+
+        pk, date, rate = latest
+        data = {'exchange_rate': {'id': pk,
+                                  'from_code': from_code,
+                                  'to_code': to_code},
+                'date': date,
+                'rate': rate}
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ExchangeRatesConvert(APIView):
+    """
+    Convert an amount between any two connected currencies.
+    """
+
+    def get(self, request, format=None, version="v1"):
+        """
+        Convert amount (default 1) from from_code to to_code with the
+        latest daily exchange rates, through other currencies when the
+        pair isn't stored
+        """
+        from_code = request.query_params.get('from_code', '')
+        to_code = request.query_params.get('to_code', '')
+        try:
+            amount = float(request.query_params.get('amount', 1))
+        except ValueError:
+            return Response({'errors': 'Your request is invalid'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        conversion = rate_graph.convert(from_code, to_code)
+        if conversion is None:
+            raise Http404
+        rate, path = conversion
+        data = {'from_code': from_code,
+                'to_code': to_code,
+                'amount': amount,
+                'rate': rate,
+                'converted': amount * rate,
+                'path': path}
+        return Response(data, status=status.HTTP_200_OK)
+
 
+class ExchangeRatesQuote(APIView):
+    """
+    Convert many amounts at once.
+    """
+
+    def get_serializer(self):
+        return QuoteSerializer()
+
+    def post(self, request, format=None, version="v1"):
+        """
+        Convert a list of {from_code, to_code, amount, date} with the
+        most recent rate at or before date, date is optional and defaults
+        to the most recent rate. Results follow the order of the request
+        """
+        if (not isinstance(request.data, list) or
+                len(request.data) > MAX_QUOTE_ITEMS):
+            return Response({'errors': 'Your request is invalid'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # a single serializer validates every item, instantiating one
+        # per item would copy its fields each time
+        serializer = QuoteSerializer()
+        results = []
+        keys = []
+        for item in request.data:
+            try:
+                row = serializer.run_validation(item)
+            except ValidationError as exc:
+                results.append({'errors': exc.detail})
+                keys.append(None)
+                continue
+            results.append(dict(serializer.to_representation(row)))
+            keys.append((row['from_code'], row['to_code'], row.get('date')))
+
+        # a rate is looked up by the id of its pair, converting to the
+        # same currency needs none
+        pairs = pair_index.get_many(
+            {key[:2] for key in keys if key is not None and key[0] != key[1]})
+        rates = get_rates_as_of(
+            (pairs[key[:2]], key[2]) for key in keys
+            if key is not None and pairs.get(key[:2]) is not None)
+        for result, key in zip(results, keys):
+            if key is None:
+                continue
+            pk = pairs.get(key[:2])
+            if key[0] == key[1]:
+                rate_date, rate = key[2], 1.0
+            elif (pk, key[2]) in rates:
+                rate_date, rate = rates[(pk, key[2])]
+            else:
+                result['errors'] = {'rate': ['Not found.']}
+                continue
+            result['rate_date'] = rate_date
+            result['rate'] = rate
+            result['converted'] = result['amount'] * rate
+
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class DailyExchangeRatesList(APIView):
+    """
+    List daily exchange rates
+    """
+    pagination_class = IdCursorPagination
+    read_from_replicas = True
+
+    def get_serializer(self):
+        return DailyExchangeRatesSerializer()
+
+    def get_daily_exchange_rate_summary(self, date, last_week_date):
+        """
+        Annotate every exchange rate with its latest rate between
+        last_week_date and date, and the number and average of the 7
+        daily rates up to it from their summary, see
+        annotate_week_statistics. Rows missing their summary are
+        completed by get_page
+        """
+        return annotate_week_statistics(
+            ExchangeRates.objects.all(), last_week_date, date
+        ).values(
+            'id', 'from_currency_id', 'to_currency_id', 'latest_date',
+            'latest_rate', 'total', 'average'
+        )
+
+    def get_snapshot_summary(self, snapshot, exchange_rates):
+        """
+        Same rows as get_daily_exchange_rate_summary, with the statistics
+        of the page of exchange_rates read from the snapshot
+        """
+        codes = currency_index.load()[1]
+        for data in exchange_rates:
+            fields = snapshot.get(codes.get(data['from_currency_id']),
+                                  codes.get(data['to_currency_id'])) or {}
+            yield dict(data, total=fields.get('week_total', 0),
+                       average=fields.get('week_average'),
+                       latest_rate=fields.get('week_rate'))
+
+    def get_page(self, request, date):
         last_week_date = date - datetime.timedelta(days=7)
 
-        exchange_rate = ExchangeRates.objects.all()
+        paginator = self.pagination_class()
+        snapshot = snapshot_store.get(date)
+        if snapshot is None:
+            exchange_rate = paginator.paginate_queryset(
+                self.get_daily_exchange_rate_summary(date, last_week_date),
+                request, view=self)
+        else:
+            exchange_rate = self.get_snapshot_summary(
+                snapshot, paginator.paginate_queryset(
+                    ExchangeRates.objects.values('id', 'from_currency_id',
+                                                 'to_currency_id'),
+                    request, view=self))
+        codes = currency_index.load()[1]
         datas = []
         for data in exchange_rate:
-            daily_exchange_rate = self.get_daily_exchange_rate(
-                data, date, last_week_date)
-            if len(daily_exchange_rate) < 7:
+            if data['total'] is None and data.get('latest_date'):
+                # summaries missing, e.g. of rates written before they existed
+                data['total'], data['average'] = get_week_statistics(
+                    data['id'], data['latest_date'])
+            if not data['total'] or data['total'] < 7:
                 average = ""
                 rate = "insufficient data"
             else:
-                average = self.get_average_rate(daily_exchange_rate)
-                rate = daily_exchange_rate[0].rate
-            tmp_data = {'average': average, 'rate': rate}
-            exchange_rate_serializer = ExchangeRatesSerializer(data)
-            tmp_data.update(exchange_rate_serializer.data)
-            datas.append(tmp_data)
-
-        return Response(data=datas, status=status.HTTP_200_OK)
+                average = data['average']
+                rate = data['latest_rate']
+            datas.append({'average': average,
+                          'rate': rate,
+                          'id': data['id'],
+                          'from_code': codes.get(data['from_currency_id']),
+                          'to_code': codes.get(data['to_currency_id'])})
+
+        return paginator.get_paginated_response(datas).data
+
+    def get(self, request, format=None, version="v1"):
+        """
+        Return a page of rate and average per exchange rate by date
+        """
+        date = request.query_params.get('date', None)
+        if date is None:
+            date = datetime.date.today()
+        else:
+            date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+
+        versions, last_modified = get_state(['list'])
+        parts = (str(date), request.build_absolute_uri())
+        etag = get_etag('daily-list', versions,
+                        parts + (request.accepted_renderer.format,))
+        response = get_not_modified_response(request, etag, last_modified)
+        if response is None:
+            data = get_or_compute('daily-list', versions, parts,
+                                  lambda: self.get_page(request, date))
+            response = Response(data, status=status.HTTP_200_OK)
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,66 @@
+"""
+ASGI config for server project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.1 has no native ASGI support, so the WSGI application is served
+from a pool of threads (sized by the ASGI_THREADS environment variable)
+and a slow query only holds its own thread, not the event loop. Run it
+with ``gunicorn -k uvicorn.workers.UvicornWorker server.asgi:application``.
+"""
+
+import os
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+
+
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+
+    def __init__(self, wsgi_application, thread_sensitive):
+        super().__init__(wsgi_application)
+        # asgiref runs every request on one shared thread by default
+        self.run_wsgi_app = sync_to_async(
+            self.run_wsgi_app_in_thread, thread_sensitive=thread_sensitive)
+
+    def run_wsgi_app_in_thread(self, body):
+        wsgi_application = self.wsgi_application
+        responses = []
+
+        def capture(environ, start_response):
+            response = wsgi_application(environ, start_response)
+            responses.append(response)
+            return response
+
+        self.wsgi_application = capture
+        try:
+            WsgiToAsgiInstance.run_wsgi_app.func(self, body)
+        finally:
+            # closing the response sends request_finished, which is what
+            # releases the database connection of the thread
+            for response in responses:
+                if hasattr(response, 'close'):
+                    response.close()
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+
+    def __init__(self, wsgi_application, thread_sensitive=False):
+        super().__init__(wsgi_application)
+        self.thread_sensitive = thread_sensitive
+
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiToAsgiInstance(
+            self.wsgi_application, self.thread_sensitive
+        )(scope, receive, send)
+
+
+def get_asgi_application(thread_sensitive=False):
+    return ThreadPoolWsgiToAsgi(get_wsgi_application(), thread_sensitive)
+
+
+application = get_asgi_application()
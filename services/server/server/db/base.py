@@ -0,0 +1,82 @@
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.base import Database
+
+from .pool import PoolTimeout, get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend with health checked persistent connections and an
+    optional per process connection pool.
+
+    With CONN_HEALTH_CHECKS a connection kept from an earlier request is
+    checked before its first use in the next one. POOL = {'MAX_SIZE': ...,
+    'TIMEOUT': ...} hands connections back to a pool instead of closing
+    them, pair it with CONN_MAX_AGE = 0.
+    """
+    health_check_done = False
+
+    def get_pool(self):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        return get_pool(self.alias, options.get('MAX_SIZE', 10),
+                        options.get('TIMEOUT', 5.0))
+
+    def check_connection(self, connection):
+        if connection.closed:
+            return False
+        if not self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Database.Error:
+            return False
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            return pool.acquire(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params),
+                self.check_connection)
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc))
+
+    def _close(self):
+        pool = self.get_pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        connection = self.connection
+        reusable = not connection.closed
+        if reusable and self.errors_occurred:
+            reusable = self.is_usable()
+        if reusable and (connection.get_transaction_status()
+                         != Database.extensions.TRANSACTION_STATUS_IDLE):
+            try:
+                connection.rollback()
+            except Database.Error:
+                reusable = False
+        pool.release(connection, reusable)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and not self.in_atomic_block
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.errors_occurred = True
+                self.close()
+        super().ensure_connection()
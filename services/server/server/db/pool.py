@@ -0,0 +1,128 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of at most max_size open database connections.
+
+    acquire hands out the most recently released idle connection, opens a
+    new one while the pool isn't full and otherwise waits up to timeout
+    seconds for a release. stats tells how saturated the pool runs.
+    """
+
+    def __init__(self, max_size=10, timeout=5.0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle = collections.deque()
+        self.size = 0
+        self.in_use = 0
+        self.condition = threading.Condition()
+        self.counters = {'acquired': 0, 'opened': 0, 'discarded': 0,
+                         'waits': 0, 'wait_time': 0.0, 'timeouts': 0,
+                         'max_in_use': 0}
+
+    def acquire(self, connect, check=None):
+        """
+        Return an idle connection that passes check, or a new one made by
+        connect. Raise PoolTimeout when none frees up in time
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        logger.warning(
+                            'No database connection free after %.1fs, '
+                            '%d in use', self.timeout, self.in_use)
+                        raise PoolTimeout(
+                            'connection pool exhausted ({} in use)'.format(
+                                self.in_use))
+                    if not waited:
+                        waited = True
+                        self.counters['waits'] += 1
+                    self.condition.wait(remaining)
+                connection = self.idle.pop() if self.idle else None
+                if connection is None:
+                    self.size += 1
+                self.in_use += 1
+                self.counters['acquired'] += 1
+                self.counters['max_in_use'] = max(
+                    self.counters['max_in_use'], self.in_use)
+                if waited:
+                    waited = False
+                    self.counters['wait_time'] += time.monotonic() - started
+                    started = time.monotonic()
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self.discard()
+                    raise
+                with self.condition:
+                    self.counters['opened'] += 1
+                return connection
+            if check is None or check(connection):
+                return connection
+            self.release(connection, reusable=False)
+
+    def release(self, connection, reusable=True):
+        """
+        Give back a connection, a connection that isn't reusable is closed
+        and frees its place for a new one
+        """
+        if not reusable:
+            try:
+                connection.close()
+            except Exception:
+                pass
+            self.discard()
+            return
+        with self.condition:
+            self.in_use -= 1
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def discard(self):
+        with self.condition:
+            self.in_use -= 1
+            self.size -= 1
+            self.counters['discarded'] += 1
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return dict(self.counters, size=self.size, in_use=self.in_use,
+                        idle=len(self.idle), max_size=self.max_size)
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias, max_size, timeout):
+    with pools_lock:
+        if alias not in pools:
+            pools[alias] = ConnectionPool(max_size, timeout)
+        return pools[alias]
+
+
+def get_pool_stats():
+    """
+    Return the stats of every pool of this process by database alias
+    """
+    with pools_lock:
+        return {alias: pool.stats() for alias, pool in pools.items()}
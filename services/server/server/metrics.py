@@ -0,0 +1,260 @@
+"""
+Per request instrumentation exposed in the Prometheus text format.
+
+MetricsMiddleware times every request by resolved URL name and, through
+a database execute wrapper, counts its SQL queries and their time.
+Rendering the response (JSON encoding of the serialized data) is timed
+apart. Histograms live in the memory of each worker process, a scrape of
+/metrics sees the worker that answers it.
+
+Requests slower than SLOW_REQUEST_LOG_THRESHOLD seconds are logged with
+their queries to the 'server.metrics.slow' logger, for a
+SLOW_REQUEST_LOG_SAMPLE_RATE fraction of them. Both are off by default.
+"""
+
+import bisect
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from exchange_rate.cache import stats as cache_stats
+from server.db.pool import get_pool_stats
+
+slow_logger = logging.getLogger('server.metrics.slow')
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                    0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """
+    Cumulative histogram over fixed upper bounds, one lock per instance
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def collect(self):
+        """
+        Return the (upper bound, cumulative count) pairs, +Inf last, and
+        the sum of observed values
+        """
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        samples = []
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            samples.append((bound, cumulative))
+        return samples, total
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, kind, help_text, buckets=None):
+        self.metrics[name] = {'kind': kind, 'help': help_text,
+                              'buckets': buckets, 'series': {}}
+
+    def get_series(self, name, labels, factory):
+        series = self.metrics[name]['series']
+        key = tuple(sorted(labels.items()))
+        value = series.get(key)
+        if value is None:
+            with self.lock:
+                value = series.setdefault(key, factory())
+        return value
+
+    def observe(self, name, value, **labels):
+        metric = self.metrics[name]
+        self.get_series(
+            name, labels, lambda: Histogram(metric['buckets'])
+        ).observe(value)
+
+    def inc(self, name, **labels):
+        counter = self.get_series(name, labels, lambda: [0])
+        with self.lock:
+            counter[0] += 1
+
+    def items(self):
+        with self.lock:
+            return [(name, metric, list(metric['series'].items()))
+                    for name, metric in sorted(self.metrics.items())]
+
+    def clear(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric['series'].clear()
+
+
+registry = Registry()
+registry.register('http_requests_total', 'counter',
+                  'Requests by URL name, method and status')
+registry.register('http_request_duration_seconds', 'histogram',
+                  'Wall time of requests', DURATION_BUCKETS)
+registry.register('http_request_sql_queries', 'histogram',
+                  'SQL queries per request', COUNT_BUCKETS)
+registry.register('http_request_sql_duration_seconds', 'histogram',
+                  'Time spent in SQL per request', DURATION_BUCKETS)
+registry.register('http_response_render_duration_seconds', 'histogram',
+                  'Time spent rendering the response body',
+                  DURATION_BUCKETS)
+registry.register('http_response_size_bytes', 'histogram',
+                  'Size of response bodies, streams excluded',
+                  SIZE_BUCKETS)
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting the queries of a request, keeping
+    them when they may end up in the slow request log
+    """
+
+    def __init__(self, keep):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = [] if keep else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if self.queries is not None:
+                self.queries.append((context['connection'].alias,
+                                     round(duration * 1000, 3), sql))
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unresolved'
+    return resolver_match.view_name
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = getattr(settings, 'SLOW_REQUEST_LOG_THRESHOLD', None)
+        log_slow = threshold is not None and random.random() < getattr(
+            settings, 'SLOW_REQUEST_LOG_SAMPLE_RATE', 1)
+        recorder = QueryRecorder(keep=log_slow)
+        request.render_duration = None
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = get_view_name(request)
+        registry.inc('http_requests_total', view=view,
+                     method=request.method, status=str(response.status_code))
+        registry.observe('http_request_duration_seconds', duration,
+                         view=view, method=request.method)
+        registry.observe('http_request_sql_queries', recorder.count,
+                         view=view)
+        registry.observe('http_request_sql_duration_seconds',
+                         recorder.duration, view=view)
+        if request.render_duration is not None:
+            registry.observe('http_response_render_duration_seconds',
+                             request.render_duration, view=view)
+        if not response.streaming:
+            registry.observe('http_response_size_bytes',
+                             len(response.content), view=view)
+
+        if log_slow and duration >= threshold:
+            slow_logger.warning(
+                'Slow request %s %s (%s) %.1f ms, %d queries in %.1f ms%s',
+                request.method, request.get_full_path(), view,
+                duration * 1000, recorder.count, recorder.duration * 1000,
+                ''.join('\n  [{}] {:.3f} ms {}'.format(*query)
+                        for query in recorder.queries),
+                extra={'queries': recorder.queries})
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render right after the template response hooks
+        started = time.perf_counter()
+
+        def record(response):
+            request.render_duration = time.perf_counter() - started
+
+        response.add_post_render_callback(record)
+        return response
+
+
+def format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"'))
+        for name, value in sorted(labels.items())))
+
+
+def render_metrics():
+    lines = []
+    for name, metric, series in registry.items():
+        lines.append('# HELP {} {}'.format(name, metric['help']))
+        lines.append('# TYPE {} {}'.format(name, metric['kind']))
+        for key, value in sorted(series, key=lambda item: item[0]):
+            labels = dict(key)
+            if metric['kind'] == 'counter':
+                lines.append('{}{} {}'.format(
+                    name, format_labels(labels), value[0]))
+                continue
+            samples, total = value.collect()
+            for bound, count in samples:
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels(labels, le=bound), count))
+            lines.append('{}_sum{} {}'.format(
+                name, format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(
+                name, format_labels(labels), samples[-1][1]))
+
+    lines.append('# TYPE exchange_rate_cache_requests_total counter')
+    for result in ('hits', 'misses'):
+        lines.append('exchange_rate_cache_requests_total{{result="{}"}} '
+                     '{}'.format(result, cache_stats[result]))
+
+    for alias, pool in sorted(get_pool_stats().items()):
+        for stat in ('size', 'in_use', 'idle', 'max_size', 'waits',
+                     'timeouts', 'wait_time'):
+            lines.append('db_pool_{}{} {}'.format(
+                stat, format_labels({'database': alias}), pool[stat]))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4')
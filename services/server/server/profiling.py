@@ -0,0 +1,157 @@
+"""
+Statistical profiler of live requests.
+
+ProfilingMiddleware picks a PROFILING_SAMPLE_RATE fraction of requests,
+plus the ones sending PROFILING_HEADER with the PROFILING_TOKEN value.
+While any picked request runs, a sampler thread reads its stack every
+PROFILING_INTERVAL seconds and counts it under the URL name of the
+request. Requests that aren't picked only pay for a random number, and
+picked ones for the stack walks of the sampler, instead of the tracing
+of every call cProfile does.
+
+The counts are per worker process, served as flamegraph.pl collapsed
+stacks to staff users at /profiling/stacks.
+"""
+
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+
+from server.metrics import get_view_name
+
+
+class Sampler:
+
+    def __init__(self, max_stacks=10000):
+        self.max_stacks = max_stacks
+        self.stacks = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            self.threads[threading.get_ident()] = Counter()
+            self.active.set()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def stop(self, request):
+        """
+        Count the stacks sampled from the request of this thread under
+        its URL name, only known once it's resolved
+        """
+        root = get_view_name(request)
+        with self.lock:
+            stacks = self.threads.pop(threading.get_ident(), Counter())
+            if not self.threads:
+                self.active.clear()
+            for stack, count in stacks.items():
+                stack = '{};{}'.format(root, stack)
+                self.samples += count
+                if (stack not in self.stacks
+                        and len(self.stacks) >= self.max_stacks):
+                    self.dropped += count
+                    continue
+                self.stacks[stack] += count
+
+    def run(self):
+        while True:
+            self.active.wait()
+            self.sample()
+            time.sleep(getattr(settings, 'PROFILING_INTERVAL', 0.005))
+
+    def sample(self):
+        with self.lock:
+            threads = list(self.threads.items())
+        frames = sys._current_frames()
+        stacks = [(thread_stacks, self.collapse(frames[thread_id]))
+                  for thread_id, thread_stacks in threads
+                  if thread_id in frames]
+        with self.lock:
+            for thread_stacks, stack in stacks:
+                thread_stacks[stack] += 1
+
+    def collapse(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('{}:{}'.format(
+                frame.f_globals.get('__name__', code.co_filename),
+                code.co_name))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def collect(self, view=None):
+        """
+        Return collapsed stack lines, only the stacks of the view URL
+        name if given
+        """
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        prefix = None if view is None else view + ';'
+        return ['{} {}'.format(stack, count) for stack, count in stacks
+                if prefix is None or stack.startswith(prefix)]
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.dropped = 0
+
+
+sampler = Sampler(getattr(settings, 'PROFILING_MAX_STACKS', 10000))
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_profiled(self, request):
+        token = getattr(settings, 'PROFILING_TOKEN', None)
+        if token and request.META.get(
+                getattr(settings, 'PROFILING_HEADER', 'HTTP_X_PROFILE')
+        ) == token:
+            return True
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self.is_profiled(request):
+            return self.get_response(request)
+
+        sampler.start()
+        try:
+            return self.get_response(request)
+        finally:
+            sampler.stop(request)
+
+
+@staff_member_required
+@require_http_methods(['GET', 'DELETE'])
+def stacks_view(request):
+    """
+    Collapsed stacks of the sampled requests, GET ?view=<URL name> for
+    one endpoint, DELETE to start over
+    """
+    if request.method == 'DELETE':
+        sampler.reset()
+        return HttpResponse(status=204)
+    lines = sampler.collect(request.GET.get('view'))
+    response = HttpResponse(''.join(line + '\n' for line in lines),
+                            content_type='text/plain')
+    response['X-Profile-Samples'] = sampler.samples
+    response['X-Profile-Dropped'] = sampler.dropped
+    return response
@@ -0,0 +1,219 @@
+"""
+Read replica routing.
+
+GET requests to views with ``read_from_replicas = True`` read from one of
+the DATABASE_REPLICAS aliases, everything else uses the primary. A
+request that writes sends back a cookie that keeps the reads of that
+client on the primary for DATABASE_REPLICA_PIN_SECONDS, so clients read
+their own writes despite the replication lag.
+
+DATABASE_REPLICA_SELECTION is 'round-robin', or 'least-lag' to pick the
+replica with the smallest replay lag, skipping the ones more than
+DATABASE_REPLICA_MAX_LAG seconds behind.
+
+Reads that fill a cache keyed by the current versions run in
+read_from_replica_at, with the WAL position of the last write: a replica
+that hasn't replayed it yet would store rows older than the version
+they are cached under, the primary is read instead.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'pin_primary'
+LAG_SQL = ('SELECT COALESCE(EXTRACT(EPOCH FROM now() - '
+           'pg_last_xact_replay_timestamp()), 0)')
+# WAL positions as a number of bytes, NULL replayed when not a standby
+WRITE_POSITION_SQL = "SELECT pg_current_wal_lsn() - '0/0'"
+REPLAY_POSITION_SQL = "SELECT pg_last_wal_replay_lsn() - '0/0'"
+
+state = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaSelector:
+    """
+    Pick a replica alias, lags are measured at most every check_interval
+    seconds per replica
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self.counter = itertools.count()
+        self.lags = {}
+        self.lock = threading.Lock()
+
+    def round_robin(self, replicas):
+        return replicas[next(self.counter) % len(replicas)]
+
+    def measure_lag(self, alias):
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            return 0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            return float('inf')
+
+    def get_lag(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            lag, checked_at = self.lags.get(alias, (None, None))
+        if checked_at is None or now - checked_at >= self.check_interval:
+            lag = self.measure_lag(alias)
+            with self.lock:
+                self.lags[alias] = (lag, now)
+        return lag
+
+    def least_lag(self, replicas):
+        max_lag = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 5)
+        lag, alias = min((self.get_lag(alias), alias) for alias in replicas)
+        return alias if lag <= max_lag else None
+
+    def select(self, replicas):
+        if getattr(settings, 'DATABASE_REPLICA_SELECTION',
+                   'round-robin') == 'least-lag':
+            return self.least_lag(replicas)
+        return self.round_robin(replicas)
+
+
+selector = ReplicaSelector()
+
+# highest position every replica was seen at, replay never goes back
+replayed = {}
+
+
+def get_read_alias():
+    replicas = get_replicas()
+    if (not replicas or not getattr(state, 'read_from_replicas', False)
+            or getattr(state, 'pinned', False)):
+        return DEFAULT_DB_ALIAS
+    if getattr(state, 'replica', None) is None:
+        # one replica for the whole request, for consistent reads
+        state.replica = selector.select(replicas) or DEFAULT_DB_ALIAS
+    return state.replica
+
+
+def query_position(alias, sql):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        position = cursor.fetchone()[0]
+    return None if position is None else int(position)
+
+
+def get_write_position():
+    """
+    Return the WAL position of the primary, None on other databases
+    """
+    return query_position(DEFAULT_DB_ALIAS, WRITE_POSITION_SQL)
+
+
+def get_replay_position(alias):
+    """
+    Return the WAL position alias has replayed, None when it isn't a
+    PostgreSQL standby
+    """
+    return query_position(alias, REPLAY_POSITION_SQL)
+
+
+def has_replayed(alias, position):
+    if position is not None and replayed.get(alias, -1) >= position:
+        return True
+    try:
+        replay = get_replay_position(alias)
+    except DatabaseError:
+        return False
+    if replay is None:
+        return True
+    replayed[alias] = max(replayed.get(alias, -1), replay)
+    # an unknown position, e.g. evicted from the cache, may be any write
+    return position is not None and replay >= position
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Send the reads of the block to the primary, whatever the view
+    """
+    pinned = getattr(state, 'pinned', False)
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = pinned
+
+
+@contextmanager
+def read_from_replica_at(get_position):
+    """
+    Keep the reads of the block on the replica of the request when it
+    has replayed the primary up to get_position(), send them to the
+    primary otherwise. get_position is only called for replica reads
+    """
+    alias = get_read_alias()
+    if alias == DEFAULT_DB_ALIAS or has_replayed(alias, get_position()):
+        yield
+    else:
+        with read_from_primary():
+            yield
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        state.pinned = True
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_replicas()
+
+
+class ReplicaMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state.read_from_replicas = False
+        state.pinned = PIN_COOKIE in request.COOKIES
+        state.wrote = False
+        state.replica = None
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = state.wrote
+            state.read_from_replicas = False
+            state.pinned = False
+            state.replica = None
+
+        if wrote and get_replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1', httponly=True,
+                max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        state.read_from_replicas = (
+            request.method in ('GET', 'HEAD')
+            and getattr(view_class, 'read_from_replicas', False))
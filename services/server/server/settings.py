@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'server.metrics.MetricsMiddleware',
+    'server.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'server.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'server.urls'
@@ -77,22 +80,158 @@ WSGI_APPLICATION = 'server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
+# DATABASE_POOL_MODE is 'none' for persistent connections, 'pool' for the
+# per process pool of server.db or 'pgbouncer' when POSTGRES_HOST is a
+# PgBouncer in transaction pooling mode. LISTEN/NOTIFY can't go through
+# PgBouncer, it connects to POSTGRES_DIRECT_HOST instead
+DATABASE_POOL_MODE = os.getenv('DATABASE_POOL_MODE') or 'none'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'server.db',
         'NAME': os.getenv('POSTGRES_DB', ''),
         'USER': os.getenv('POSTGRES_USER', ''),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('POSTGRES_HOST', ''),
         'PORT': os.getenv('POSTGRES_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('POSTGRES_CONN_MAX_AGE') or 60),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+if DATABASE_POOL_MODE == 'pool':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': int(os.getenv('POSTGRES_POOL_SIZE') or 10),
+        'TIMEOUT': float(os.getenv('POSTGRES_POOL_TIMEOUT') or 5),
     }
+elif DATABASE_POOL_MODE == 'pgbouncer':
+    # named cursors don't survive the end of a transaction in PgBouncer
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Read replicas of the primary, as host[:port] separated by commas. See
+# server/replicas.py for how reads are routed to them
+DATABASE_REPLICAS = []
+
+for index, replica in enumerate(filter(None, (os.getenv(
+        'POSTGRES_REPLICA_HOSTS') or '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    alias = 'replica_{}'.format(index + 1)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host,
+                            PORT=port or DATABASES['default']['PORT'])
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['server.replicas.ReplicaRouter']
+
+DATABASE_REPLICA_SELECTION = os.getenv(
+    'DATABASE_REPLICA_SELECTION') or 'round-robin'
+
+DATABASE_REPLICA_MAX_LAG = float(
+    os.getenv('DATABASE_REPLICA_MAX_LAG') or 5)
+
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.getenv('DATABASE_REPLICA_PIN_SECONDS') or 5)
+
+# Range partitions of daily exchange rates, 'year' or 'month', see
+# manage.py partition_rates
+EXCHANGE_RATE_PARTITION_INTERVAL = os.getenv(
+    'EXCHANGE_RATE_PARTITION_INTERVAL') or 'year'
+
+# Fan out of new daily exchange rates to daily-exchange-rates/stream,
+# through postgres LISTEN/NOTIFY so every server process sees them
+EXCHANGE_RATE_CHANNEL_LAYER = {
+    'BACKEND': 'exchange_rate.push.PostgresChannelLayer',
+    'OPTIONS': {
+        'connection': {
+            'host': os.getenv('POSTGRES_DIRECT_HOST') or os.getenv(
+                'POSTGRES_HOST', ''),
+            'port': os.getenv('POSTGRES_DIRECT_PORT') or os.getenv(
+                'POSTGRES_PORT', ''),
+        },
+    },
 }
 
+# a stream holds a server thread until it ends, at most
+# EXCHANGE_RATE_STREAM_SLOTS of them per process, and for less than the
+# gunicorn timeout, see entrypoint.sh
+EXCHANGE_RATE_STREAM_TIMEOUT = int(
+    os.getenv('EXCHANGE_RATE_STREAM_TIMEOUT') or 60)
+
+EXCHANGE_RATE_STREAM_SLOTS = int(
+    os.getenv('EXCHANGE_RATE_STREAM_SLOTS') or 4)
+
+EXCHANGE_RATE_STREAM_HEARTBEAT = 15
+
+# Latest rates of every pair written by manage.py build_rate_snapshot and
+# memory-mapped by the read endpoints, see exchange_rate/snapshots.py.
+# Snapshots are only fresh through a cache shared between processes
+EXCHANGE_RATE_SNAPSHOT_PATH = os.getenv('EXCHANGE_RATE_SNAPSHOT_PATH') or None
+
+EXCHANGE_RATE_SNAPSHOT_CHECK_INTERVAL = 1
+
+# Feed manage.py fetch_rates pulls daily exchange rates from, see
+# exchange_rate/providers.py, off unless EXCHANGE_RATE_PROVIDER_URL is set
+EXCHANGE_RATE_PROVIDER = {
+    'BACKEND': 'exchange_rate.providers.JSONProvider',
+    'OPTIONS': {'url': os.getenv('EXCHANGE_RATE_PROVIDER_URL')},
+} if os.getenv('EXCHANGE_RATE_PROVIDER_URL') else None
+
 if 'test' in sys.argv:
-    DATABASES['default'] = {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': 'mydatabase'
+    EXCHANGE_RATE_CHANNEL_LAYER = {
+        'BACKEND': 'exchange_rate.push.InMemoryChannelLayer',
+    }
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'mydatabase'
+        },
+        # used by the replica routing tests, see DATABASE_REPLICAS
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'mydatabase',
+            'TEST': {'MIRROR': 'default'},
+        },
     }
+    DATABASE_REPLICAS = []
+
+# Log requests slower than this many seconds with their queries, for a
+# sample of them, see server/metrics.py. Off unless set
+SLOW_REQUEST_LOG_THRESHOLD = (
+    float(os.getenv('SLOW_REQUEST_LOG_THRESHOLD'))
+    if os.getenv('SLOW_REQUEST_LOG_THRESHOLD') else None)
+
+SLOW_REQUEST_LOG_SAMPLE_RATE = float(
+    os.getenv('SLOW_REQUEST_LOG_SAMPLE_RATE') or 1)
+
+# Statistical profiling of a fraction of requests, and of the requests
+# with an X-Profile header set to PROFILING_TOKEN, see server/profiling.py
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE') or 0)
+
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN') or None
+
+PROFILING_INTERVAL = 0.005
+
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+# Versions bumped on writes invalidate the cached responses of every
+# process, only when the cache is shared between them: docker-compose
+# sets memcached, the default per process cache suits a single process
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+EXCHANGE_RATE_CACHE = 'default'
+
+EXCHANGE_RATE_CACHE_TIMEOUT = int(
+    os.getenv('EXCHANGE_RATE_CACHE_TIMEOUT') or 300)
+
+EXCHANGE_RATE_CACHE_CONTROL_MAX_AGE = int(
+    os.getenv('EXCHANGE_RATE_CACHE_CONTROL_MAX_AGE') or 60)
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -133,6 +272,10 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'exchange_rate.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     # Parser classes priority-wise for Swagger
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.FormParser',
@@ -20,6 +20,9 @@ from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from rest_framework.schemas import get_schema_view
 from rest_framework_swagger.renderers import SwaggerUIRenderer, OpenAPIRenderer
 
+from server.metrics import metrics_view
+from server.profiling import stacks_view
+
 schema_view = get_schema_view(title='Exchange Rate API', renderer_classes=[
                               OpenAPIRenderer, SwaggerUIRenderer])
 
@@ -29,6 +32,8 @@ urlpatterns = [
     re_path('api/(?P<version>(v1|v2))/',
             include('exchange_rate.urls', namespace='exchange-rate')),
     url(r'^docs', schema_view, name="docs"),
+    path('metrics', metrics_view, name="metrics"),
+    path('profiling/stacks', stacks_view, name="profiling-stacks"),
 ]
 
 urlpatterns += staticfiles_urlpatterns()